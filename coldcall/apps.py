@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
 
 
 class ColdcallConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'coldcall'
+
+    def ready(self):
+        from .models import rating_counters_changed
+        from .randomizer import follow_rating
+        # cached randomizer samplers take ratings saved by this process without a rebuild
+        rating_counters_changed.connect(follow_rating)
+        # altering the student table on SQLite drops the search index triggers, put them back
+        post_migrate.connect(reinstall_search_index, sender=self)
+
+
+def reinstall_search_index(using, **kwargs):
+    from .search import SEARCH_TABLES, install_search_index
+    # only databases migration 0028 has created the index in
+    if set(SEARCH_TABLES) & set(connections[using].introspection.table_names()):
+        install_search_index(using)
@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+import re
+
+from dateutil.parser import parse
+
+# strptime formats tried against the first rows of a file, month first like dateutil's default
+CANDIDATE_FORMATS = (
+    '%m/%d/%Y %I:%M %p',
+    '%m/%d/%Y %I:%M:%S %p',
+    '%m/%d/%Y %I%p',
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y',
+    '%m/%d/%y %I:%M %p',
+    '%m/%d/%y %H:%M',
+    '%m/%d/%y',
+    '%m-%d-%Y %H:%M',
+    '%m-%d-%Y',
+    '%B %d, %Y %I%p',
+    '%B %d, %Y %I:%M%p',
+    '%B %d, %Y %I %p',
+    '%B %d, %Y %I:%M %p',
+    '%B %d, %Y %H:%M',
+    '%B %d, %Y',
+    '%b %d, %Y %I%p',
+    '%b %d, %Y %I:%M %p',
+    '%b %d, %Y',
+)
+# values checked against every candidate before the file's format is settled
+SAMPLE_SIZE = 20
+# "2nd", "31st" -> "2", "31", strptime has no directive for ordinal suffixes
+ORDINAL_SUFFIX = re.compile(r'(?<=\d)(?:st|nd|rd|th)\b', re.IGNORECASE)
+
+# Parses the dates of one import file. ISO 8601 values go straight to datetime.fromisoformat, anything else
+# is matched against the format most of the first rows used, and only values that fit neither go to dateutil.
+# Naive dates are taken as UTC.
+class DateParser:
+    def __init__(self, sample_size=SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self.format = None
+        self.sampled = 0
+        self.matches = {}
+
+    def __call__(self, value):
+        value = value.strip()
+        date = self._parse(value)
+        if not date.tzinfo:
+            date = date.replace(tzinfo=timezone.utc)
+        return date
+
+    def _parse(self, value):
+        # cheap check so non-ISO files don't pay for a failed fromisoformat on every row
+        if value[4:5] == '-':
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                pass
+
+        if value[:1].isalpha():
+            value = ORDINAL_SUFFIX.sub('', value)
+        if self.sampled < self.sample_size:
+            self._sample(value)
+        if self.format:
+            try:
+                return datetime.strptime(value, self.format)
+            except ValueError:
+                pass
+        return parse(value)
+
+    # counts which candidates read the value and switches to the most common one so far
+    def _sample(self, value):
+        self.sampled += 1
+        for date_format in CANDIDATE_FORMATS:
+            try:
+                datetime.strptime(value, date_format)
+            except ValueError:
+                continue
+            self.matches[date_format] = self.matches.get(date_format, 0) + 1
+        if self.matches:
+            self.format = max(self.matches, key=self.matches.get)
@@ -0,0 +1,273 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.timezone import is_aware
+
+from .importers import RATING_COLUMNS, STUDENT_COLUMNS
+from .models import StudentRating
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import islice
+from zipfile import ZIP_DEFLATED, ZipFile
+import base64
+import csv
+import glob
+import os
+import tempfile
+
+from openpyxl import Workbook
+
+# rows fetched from the database per round trip while exporting
+EXPORT_CHUNK_SIZE = 2000
+# csv rows joined into one chunk of the streamed response
+STREAM_ROWS_PER_CHUNK = 500
+# bytes copied into the zip per read of a class's file
+ZIP_READ_SIZE = 64 * 1024
+# changes this recent are left for the next incremental export, so a transaction that commits after its
+# rows were stamped can't end up behind a cursor that has already been handed out
+INCREMENTAL_EXPORT_LAG = timedelta(seconds=60)
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'txt': 'text/plain',
+    'excel': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+EXTENSIONS = {'csv': '.csv', 'txt': '.txt', 'excel': '.xlsx'}
+
+def format_iso_date(date):
+    if isinstance(date, datetime):
+        if is_aware(date):
+            return date.isoformat()
+        return date.replace(tzinfo=None).isoformat()
+    return date
+
+# export types and formats as they appear in cache file names, anything unexpected falls back like the view does
+def _export_key(export_type, file_format):
+    return ("simple" if export_type == "simple" else "ratings"), (file_format if file_format in EXTENSIONS else 'csv')
+
+def export_etag(class_id, export_type, file_format, version):
+    return '"{}-{}-{}-v{}"'.format(class_id, *_export_key(export_type, file_format), version)
+
+def export_filename(class_obj, export_type, file_format):
+    return f"{class_obj.class_name}_{datetime.now().strftime('%Y%m%d')}{"" if export_type == "simple" else "_ratings"}{EXTENSIONS.get(file_format, '.csv')}"
+
+# Yields the rows of a class export, header first.
+# Simple only exports a list of student attributes, otherwise export student ratings.
+# Either way it is one flat query read in chunks, so memory and query count don't grow with the class.
+def iter_export_rows(class_obj, export_type):
+    if export_type == "simple":
+        # the same columns the importer reads, so an export can be imported again
+        yield STUDENT_COLUMNS
+        students = class_obj.student_set.values_list(
+            'usc_id', 'email', 'first_name', 'last_name', 'seating', 'total_calls', 'absent_calls', 'total_score', 'class_key'
+        )
+        for row in students.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield list(row)
+    else:
+        yield from iter_rating_rows(class_obj, StudentRating.objects.filter(student_key__class_key=class_obj).order_by('student_key', 'date'))
+
+def iter_rating_rows(class_obj, ratings):
+    yield RATING_COLUMNS
+    ratings = ratings.values_list('student_key__usc_id', 'date', 'attendance', 'prepared', 'score')
+    for usc_id, date, attendance, prepared, score in ratings.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield [usc_id, format_iso_date(date), attendance, prepared, score, class_obj.pk]
+
+# A cursor is the (modified, pk) of the last rating a sync received, pk breaks ties between ratings changed
+# at the same moment. It is opaque to clients.
+def encode_export_cursor(modified, pk):
+    return base64.urlsafe_b64encode(f"{modified.isoformat()}|{pk}".encode()).decode()
+
+def decode_export_cursor(cursor):
+    try:
+        modified, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(modified), int(pk)
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor.")
+
+# Ratings of the class created or changed after the cursor, oldest change first, and the cursor to pass next time.
+# after_pk=None means everything changed after `since`. Deleted ratings are not reported.
+def changed_ratings(class_obj, since, after_pk=None):
+    until = timezone.now() - INCREMENTAL_EXPORT_LAG
+    after = Q(modified__gt=since)
+    if after_pk is not None:
+        after |= Q(modified=since, pk__gt=after_pk)
+    # on the rating's own class_key, answered from rating_class_modified_idx in change order
+    ratings = StudentRating.objects.filter(after, class_key=class_obj, modified__lte=until)
+
+    # nothing new keeps the caller where it was
+    last = ratings.order_by('-modified', '-pk').values_list('modified', 'pk').first() or (since, after_pk or 0)
+    return ratings.order_by('modified', 'pk'), encode_export_cursor(*last)
+
+# file-like object whose write returns the line, lets csv.writer format rows for a streamed response
+class Echo:
+    def write(self, value):
+        return value
+
+def iter_csv(rows):
+    writer = csv.writer(Echo())
+    chunk = []
+    for row in rows:
+        chunk.append(writer.writerow(row))
+        if len(chunk) >= STREAM_ROWS_PER_CHUNK:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+# Writes rows to an .xlsx in openpyxl's write-only mode, which streams each row to disk instead of keeping
+# the sheet's cells in memory. output is a path or a binary file object.
+def write_xlsx(rows, output):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in rows:
+        sheet.append(row)
+    workbook.save(output)
+
+# the workbook in an anonymous temporary file, rewound for reading and removed once closed
+def xlsx_tempfile(rows):
+    output = tempfile.TemporaryFile()
+    try:
+        write_xlsx(rows, output)
+    except Exception:
+        output.close()
+        raise
+    output.seek(0)
+    return output
+
+def write_export(class_obj, export_type, file_format, output):
+    rows = iter_export_rows(class_obj, export_type)
+    if file_format == 'excel':
+        write_xlsx(rows, output)
+    else:
+        for chunk in iter_csv(rows):
+            output.write(chunk.encode('utf-8'))
+
+# Exports are cached on disk per class, type, format and ClassStats.version. The version is bumped by every
+# change to the class's students or ratings, so a file that exists for the current version is up to date.
+def export_cache_path(class_id, export_type, file_format, version):
+    export_type, file_format = _export_key(export_type, file_format)
+    return os.path.join(settings.EXPORT_CACHE_DIR, f"{class_id}-{export_type}-{file_format}-v{version}{EXTENSIONS[file_format]}")
+
+# writes go to a temporary file next to the cache entry, which replaces it only once complete
+def _open_cache_tempfile(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    return os.fdopen(fd, 'wb'), temp_path
+
+def _publish_cache_file(temp_path, path):
+    os.replace(temp_path, path)
+    # older versions of the same export are stale now
+    prefix = path[:path.rindex('-v') + 2]
+    for old_path in glob.glob(glob.escape(prefix) + '*'):
+        if old_path != path:
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass
+
+# path of the cached export, building it first if this version hasn't been exported yet
+def cached_export_path(class_obj, export_type, file_format, version):
+    path = export_cache_path(class_obj.pk, export_type, file_format, version)
+    if not os.path.exists(path):
+        output, temp_path = _open_cache_tempfile(path)
+        try:
+            with output:
+                write_export(class_obj, export_type, file_format, output)
+            _publish_cache_file(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    return path
+
+# streams a csv export while saving it to the cache, an abandoned download leaves no cache entry behind
+def iter_csv_to_cache(class_obj, export_type, file_format, version):
+    path = export_cache_path(class_obj.pk, export_type, file_format, version)
+    output, temp_path = _open_cache_tempfile(path)
+    try:
+        with output:
+            for chunk in iter_csv(iter_export_rows(class_obj, export_type)):
+                output.write(chunk.encode('utf-8'))
+                yield chunk
+        _publish_cache_file(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+# opens one class's export for the zip, from the cache when the class hasn't changed
+def build_export_file(class_obj, export_type, file_format):
+    return open(cached_export_path(class_obj, export_type, file_format, class_obj.get_stats().version), 'rb')
+
+def _build_export_file_in_thread(*args):
+    try:
+        return build_export_file(*args)
+    finally:
+        # pool threads open their own connection, don't leave it behind when the thread is done
+        connection.close()
+
+# Yields (filename, file) for each class in order. With more than one worker the files are built on a
+# bounded thread pool, at most `workers` ahead of the one being read so finished files don't pile up.
+def iter_class_exports(classes, export_type, file_format, workers=1):
+    if workers <= 1:
+        for class_obj in classes:
+            yield export_filename(class_obj, export_type, file_format), build_export_file(class_obj, export_type, file_format)
+        return
+
+    classes = iter(classes)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(count):
+            for class_obj in islice(classes, count):
+                pending.append((class_obj, pool.submit(_build_export_file_in_thread, class_obj, export_type, file_format)))
+
+        submit(workers)
+        try:
+            while pending:
+                class_obj, future = pending[0]
+                content = future.result()
+                pending.popleft()
+                submit(1)
+                yield export_filename(class_obj, export_type, file_format), content
+        finally:
+            # the download was abandoned, drop the files that were built for it
+            for class_obj, future in pending:
+                if not future.cancel() and not future.exception():
+                    future.result().close()
+
+# write-only file object that hands what ZipFile writes back to iter_zip, having no seek makes ZipFile
+# write in streaming mode (sizes go in data descriptors after each entry)
+class ZipStream:
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+# streams a zip of (filename, file) pairs, each file is closed once it has been copied in
+def iter_zip(files):
+    stream = ZipStream()
+    with ZipFile(stream, 'w', compression=ZIP_DEFLATED) as zip_file:
+        for filename, content in files:
+            with content, zip_file.open(filename, 'w') as entry:
+                while data := content.read(ZIP_READ_SIZE):
+                    entry.write(data)
+                    if stream.chunks:
+                        yield stream.take()
+            yield stream.take()
+    yield stream.take()
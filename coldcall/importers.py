@@ -0,0 +1,247 @@
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ClassStats, Seating, Student, StudentRating, average_score_expression
+
+from .date_parsing import DateParser
+
+from contextlib import nullcontext
+from datetime import date, datetime
+import codecs
+import csv
+
+from openpyxl import load_workbook
+
+# rows written per INSERT ... ON CONFLICT statement
+IMPORT_BATCH_SIZE = 500
+
+STUDENT_COLUMNS = ['usc_id', 'email', 'first_name', 'last_name', 'seating', 'total_calls', 'absent_calls', 'total_score', 'class_id']
+RATING_COLUMNS = ['usc_id', 'date', 'attendance', 'prepared', 'score', 'class_id']
+# file types accepted by read_rows
+IMPORT_EXTENSIONS = ('.csv', '.xlsx')
+# accepts either the seating code or its label
+SEATING_CODES = {code: code for code, label in Seating.choices} | {label: code for code, label in Seating.choices}
+
+# counts and messages collected while importing a file
+class ImportResult:
+    def __init__(self):
+        self.rows = 0  # data rows read from the file
+        self.imported = 0
+        self.inserted = 0
+        self.updated = 0
+        self.warnings = []
+
+# yields the lines of an uploaded file, decoding it chunk by chunk instead of reading it into memory
+def iter_lines(uploaded_file, encoding='utf-8-sig'):
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ''
+    for chunk in uploaded_file.chunks():
+        pending += decoder.decode(chunk)
+        lines = pending.splitlines(keepends=True)
+        # the last line may continue in the next chunk
+        pending = lines.pop() if lines and not lines[-1].endswith(('\n', '\r')) else ''
+        yield from lines
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+def read_csv_rows(uploaded_file):
+    return csv.reader(iter_lines(uploaded_file))
+
+# spreadsheet cells come back typed, write them the way they would appear in a CSV export
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+# yields the rows of the first sheet of an .xlsx upload, read-only mode streams the sheet instead of loading it
+def read_xlsx_rows(uploaded_file):
+    workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield [_cell_text(value) for value in row]
+    finally:
+        workbook.close()
+
+def read_rows(uploaded_file):
+    if uploaded_file.name.lower().endswith('.xlsx'):
+        return read_xlsx_rows(uploaded_file)
+    return read_csv_rows(uploaded_file)
+
+# turns raw rows into dicts, using the header row for column names when the file has one
+def iter_records(rows, columns):
+    header = None
+    for row in rows:
+        values = [str(value).strip() if value is not None else '' for value in row]
+        if not any(values):
+            continue
+        if header is None:
+            header = columns
+            lowered = [value.lower() for value in values]
+            if lowered[0].startswith(columns[0]) or columns[2] in lowered:
+                header = lowered
+                continue
+        yield dict(zip(header, values))
+
+def _to_int(value):
+    return int(value) if value.isdigit() else 0
+
+# upserts the students of an uploaded roster into class_obj in fixed size batches, keyed on (class, usc_id)
+# with atomic=False each batch commits on its own, so progress is visible to other connections while importing
+def import_students(rows, class_obj, batch_size=IMPORT_BATCH_SIZE, progress=None, atomic=True):
+    result = ImportResult()
+    batch = {}
+
+    def flush():
+        with transaction.atomic():
+            Student.objects.bulk_create(
+                batch.values(),
+                update_conflicts=True,
+                unique_fields=['class_key', 'usc_id'],
+                update_fields=['email', 'first_name', 'last_name', 'seating', 'total_calls', 'absent_calls', 'total_score'],
+            )
+        result.imported += len(batch)
+        batch.clear()
+        if progress:
+            progress(result)
+
+    with transaction.atomic() if atomic else nullcontext():
+        for record in iter_records(rows, STUDENT_COLUMNS):
+            result.rows += 1
+            usc_id = record.get('usc_id', '')
+            email = record.get('email', '')
+            first_name = record.get('first_name', '')
+            last_name = record.get('last_name', '')
+
+            # Skip rows that don't have the required fields
+            if not usc_id or not email or not first_name or not last_name:
+                continue
+            if len(usc_id) > 9:
+                result.warnings.append(f"Error importing student {usc_id}: USC ID must be 9 characters long.")
+                continue
+
+            seating = record.get('seating', 'NA')
+            # later rows for the same usc_id win, the batch can only hold one row per key
+            batch.pop(usc_id, None)
+            batch[usc_id] = Student(
+                usc_id=usc_id,
+                email=email,
+                first_name=first_name,
+                last_name=last_name,
+                class_key=class_obj,
+                seating=SEATING_CODES.get(seating, 'NA'),
+                total_calls=_to_int(record.get('total_calls', '0')),
+                absent_calls=_to_int(record.get('absent_calls', '0')),
+                total_score=_to_int(record.get('total_score', '0')),
+            )
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+        # bulk_create skips Student.save, so derive the averages and class totals once at the end
+        with transaction.atomic():
+            class_obj.student_set.update(average_score=average_score_expression(F('total_calls'), F('absent_calls'), F('unprepared_calls'), F('total_score')))
+            ClassStats.refresh(class_obj.pk)
+    return result
+
+# one rating upsert, run with executemany for a whole batch. Building a model and compiling a bulk_create
+# for every row took most of the import time, the statement here is prepared once and reused.
+def rating_upsert_sql():
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in ('student_key_id', 'class_key_id', 'date', 'attendance', 'prepared', 'score', 'modified'))
+    updates = ', '.join(f"{quote(column)} = excluded.{quote(column)}" for column in ('attendance', 'prepared', 'score', 'class_key_id', 'modified'))
+    return (f"INSERT INTO {quote(StudentRating._meta.db_table)} ({columns}) VALUES (%s, %s, %s, %s, %s, %s, %s) "
+            f"ON CONFLICT ({quote('student_key_id')}, {quote('date')}) DO UPDATE SET {updates}")
+
+# upserts ratings for the students of class_obj keyed on (student, date) in fixed size batches,
+# counting how many were new and how many replaced
+def import_ratings(rows, class_obj, batch_size=IMPORT_BATCH_SIZE, progress=None, atomic=True):
+    result = ImportResult()
+    batch = {}
+    updated_students = set()
+    parse_date = DateParser()
+    # usc_id -> pk for the class in one query on the (class_key, usc_id) index, other classes are never matched
+    students = dict(class_obj.student_set.exclude(usc_id=None).values_list('usc_id', 'pk'))
+    # databases without INSERT ... ON CONFLICT (target) go through bulk_create
+    upsert_sql = rating_upsert_sql() if connection.features.supports_update_conflicts_with_target else None
+    # a class's ratings share few dates, each is converted to its database value once
+    db_dates = {}
+
+    def db_date(date):
+        if date not in db_dates:
+            db_dates[date] = connection.ops.adapt_datetimefield_value(date)
+        return db_dates[date]
+
+    def flush():
+        ratings = {}
+        for (usc_id, date), values in batch.items():
+            student_id = students.get(usc_id)
+            if student_id:
+                ratings[(student_id, date)] = values
+        batch.clear()
+        if not ratings:
+            return
+
+        student_ids = {student_id for student_id, date in ratings}
+        student_ratings = StudentRating.objects.filter(student_key__in=student_ids)
+        with transaction.atomic():
+            before = student_ratings.count()
+            if upsert_sql:
+                modified = connection.ops.adapt_datetimefield_value(timezone.now())
+                with connection.cursor() as cursor:
+                    cursor.executemany(upsert_sql, [
+                        (student_id, class_obj.pk, db_date(date), attendance, prepared, score, modified)
+                        for (student_id, date), (attendance, prepared, score) in ratings.items()
+                    ])
+            else:
+                StudentRating.objects.bulk_create(
+                    [StudentRating(student_key_id=student_id, class_key_id=class_obj.pk, date=date, attendance=attendance, prepared=prepared, score=score)
+                     for (student_id, date), (attendance, prepared, score) in ratings.items()],
+                    update_conflicts=True,
+                    update_fields=['attendance', 'prepared', 'score', 'class_key', 'modified'],
+                )
+            # a rating is either new or replaces one, so the count tells them apart
+            inserted = student_ratings.count() - before
+        result.inserted += inserted
+        result.updated += len(ratings) - inserted
+        result.imported += len(ratings)
+        updated_students.update(student_ids)
+        if progress:
+            progress(result)
+
+    #combine each query into one all-or-nothing query
+    with transaction.atomic() if atomic else nullcontext():
+        for record in iter_records(rows, RATING_COLUMNS):
+            result.rows += 1
+            usc_id = record.get('usc_id', '')
+            date = record.get('date', '')
+            #ensure valid data is present for key, skip otherwise
+            if not usc_id or not date:
+                continue
+            try:
+                date = parse_date(date)
+            except (ValueError, OverflowError):
+                continue
+
+            score = record.get('score', '0')
+            # later rows for the same student and date win
+            batch[(usc_id, date)] = (
+                record.get('attendance', 'TRUE').upper() == 'TRUE',  # attendance
+                record.get('prepared', 'FALSE').upper() == 'TRUE',  # prepared
+                int(score) if score.isdigit() else 0,  # score
+            )
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+        Student.objects.filter(pk__in=updated_students).recalculate_counters()
+    return result
@@ -0,0 +1,71 @@
+from django.utils import timezone
+
+from .importers import import_ratings, import_students, read_rows
+from .models import ImportJob
+
+# marks the oldest pending job as running and returns it, or None when the queue is empty.
+# The conditional UPDATE is the lock: if another thread claimed the job first it matches no rows.
+def claim_next_job():
+    for job_id in ImportJob.objects.filter(status=ImportJob.PENDING).order_by('created', 'pk').values_list('pk', flat=True)[:10]:
+        if ImportJob.objects.filter(pk=job_id, status=ImportJob.PENDING).update(status=ImportJob.RUNNING, started_at=timezone.now()):
+            return ImportJob.objects.get(pk=job_id)
+    return None
+
+# jobs left running by a worker that died are picked up again, the importers upsert so rerunning is safe
+def requeue_stale_jobs():
+    return ImportJob.objects.filter(status=ImportJob.RUNNING).update(status=ImportJob.PENDING, started_at=None)
+
+# imports the job's files, writing progress to the job row after every committed batch
+def run_import_job(job):
+    if not job.started_at:
+        job.started_at = timezone.now()
+        job.status = ImportJob.RUNNING
+        job.save(update_fields=['status', 'started_at'])
+
+    student_rows = 0
+
+    def student_progress(result):
+        ImportJob.objects.filter(pk=job.pk).update(rows_processed=result.rows, students_imported=result.imported)
+
+    def rating_progress(result):
+        ImportJob.objects.filter(pk=job.pk).update(rows_processed=student_rows + result.rows, ratings_inserted=result.inserted, ratings_updated=result.updated)
+
+    try:
+        with job.student_file.open('rb') as student_file:
+            students = import_students(read_rows(student_file), job.class_key, progress=student_progress, atomic=False)
+        student_rows = students.rows
+        job.rows_processed = students.rows
+        job.students_imported = students.imported
+        job.errors = students.warnings
+        if not students.rows:
+            job.errors.append("The uploaded file is empty.")
+
+        if job.rating_file:
+            with job.rating_file.open('rb') as rating_file:
+                ratings = import_ratings(read_rows(rating_file), job.class_key, progress=rating_progress, atomic=False)
+            job.rows_processed += ratings.rows
+            job.ratings_inserted = ratings.inserted
+            job.ratings_updated = ratings.updated
+        job.status = ImportJob.DONE
+    except Exception as e:
+        job.refresh_from_db(fields=['rows_processed', 'students_imported', 'ratings_inserted', 'ratings_updated'])
+        job.errors = job.errors + [f"Error: {str(e)}"]
+        job.status = ImportJob.FAILED
+
+    job.finished_at = timezone.now()
+    job.save()
+
+    # the uploads hold student details and are only needed until the job has finished, whether it worked or not
+    for upload in (job.student_file, job.rating_file):
+        if upload:
+            upload.delete(save=False)
+    job.save(update_fields=['student_file', 'rating_file'])
+    return job
+
+# claims and runs jobs until the queue is empty, used by each thread of the import worker
+def drain_jobs():
+    count = 0
+    while job := claim_next_job():
+        run_import_job(job)
+        count += 1
+    return count
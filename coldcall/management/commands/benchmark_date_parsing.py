@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta, timezone
+import time
+
+from dateutil.parser import parse
+from django.core.management.base import BaseCommand
+
+from coldcall.date_parsing import DateParser
+
+# "April 2nd, 2025 3PM"
+def long_form(date):
+    day = date.day
+    suffix = 'th' if 10 <= day % 100 <= 20 else {1: 'st', 2: 'nd', 3: 'rd'}.get(day % 10, 'th')
+    return f"{date:%B} {day}{suffix}, {date.year} {date.hour % 12 or 12}{date:%p}"
+
+STYLES = {
+    'iso': lambda date: date.isoformat(),
+    'us': lambda date: date.strftime('%m/%d/%Y %I:%M %p'),
+    'long': long_form,
+}
+
+# compares the import's date parser against calling dateutil on every value
+class Command(BaseCommand):
+    help = "Measures rating date parsing speed for ISO, US-style and long-form dates."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help="Number of dates parsed per style.")
+
+    def handle(self, *args, **options):
+        start_date = datetime(2025, 1, 6, 9, tzinfo=timezone.utc)
+        dates = [start_date + timedelta(hours=i) for i in range(options['rows'])]
+
+        for style, formatter in STYLES.items():
+            values = [formatter(date) for date in dates]
+
+            start = time.perf_counter()
+            expected = [parse(value) for value in values]
+            dateutil_time = time.perf_counter() - start
+
+            parse_date = DateParser()
+            start = time.perf_counter()
+            parsed = [parse_date(value) for value in values]
+            parser_time = time.perf_counter() - start
+
+            matches = sum(a.replace(tzinfo=None) == b.replace(tzinfo=None) for a, b in zip(expected, parsed))
+            self.stdout.write(
+                f"{style:>4}: dateutil {dateutil_time / len(values) * 1e6:.1f} us/row, "
+                f"DateParser {parser_time / len(values) * 1e6:.1f} us/row "
+                f"({dateutil_time / parser_time:.1f}x), {matches}/{len(values)} identical"
+            )
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+import multiprocessing
+import resource
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from openpyxl import Workbook
+
+from coldcall.exports import format_iso_date, xlsx_tempfile
+from coldcall.importers import RATING_COLUMNS
+
+# rating export rows shaped like iter_export_rows yields them, generated so the database isn't the bottleneck
+def rating_rows(count):
+    yield RATING_COLUMNS
+    start_date = datetime(2025, 1, 6, 9, tzinfo=timezone.utc)
+    for i in range(count):
+        yield [f"{i % 5000:09d}", format_iso_date(start_date + timedelta(minutes=i)), i % 9 != 0, i % 7 != 0, i % 6, 1]
+
+# the previous export, every cell kept in a regular workbook until it is saved
+def in_memory_tempfile(rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    for row in rows:
+        sheet.append(row)
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    return output
+
+WRITERS = {
+    'write_only': xlsx_tempfile,
+    'workbook': in_memory_tempfile,
+}
+
+# runs in a child process so ru_maxrss is the peak of this export alone
+def measure(writer, count, results):
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    output = WRITERS[writer](rating_rows(count))
+    elapsed = time.perf_counter() - start
+    size = output.seek(0, 2)
+    output.close()
+    results.put((elapsed, start_rss, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, size))
+
+class Command(BaseCommand):
+    help = "Records wall time and peak RSS of the Excel rating export for several sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000], help="Row counts to export.")
+        parser.add_argument('--compare', action='store_true', help="Also run the old in-memory Workbook export.")
+
+    def handle(self, *args, **options):
+        writers = ['write_only', 'workbook'] if options['compare'] else ['write_only']
+        context = multiprocessing.get_context('fork')
+        for count in options['rows']:
+            for writer in writers:
+                results = context.Queue()
+                process = context.Process(target=measure, args=(writer, count, results))
+                process.start()
+                elapsed, start_rss, peak_rss, size = results.get()
+                process.join()
+                # ru_maxrss is in KiB on Linux
+                self.stdout.write(
+                    f"{count:>9,} rows {writer:>10}: {elapsed:6.1f}s, peak RSS {peak_rss / 1024:6.0f} MiB "
+                    f"(+{(peak_rss - start_rss) / 1024:.0f} MiB), {size / 1024 / 1024:.1f} MiB file"
+                )
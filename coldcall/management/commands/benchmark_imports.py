@@ -0,0 +1,79 @@
+import csv
+import io
+import time
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from openpyxl import Workbook
+
+from coldcall.importers import import_ratings, import_students, read_rows
+from coldcall.models import Class
+
+# compares how fast CSV and .xlsx rosters go through the import pipeline, nothing is kept in the database
+class Command(BaseCommand):
+    help = "Measures rows per second for reading and importing CSV and Excel rosters."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help="Number of students in the generated roster.")
+        parser.add_argument('--ratings-per-student', type=int, default=5, help="Ratings per student in the generated ratings file.")
+
+    def handle(self, *args, **options):
+        rows = [[f"{i:09d}", f"student{i}@example.com", f"First{i}", f"Last{i}", "NA", i % 7, i % 3, i % 11] for i in range(options['rows'])]
+        files = {'csv': self.build_csv(rows), 'xlsx': self.build_xlsx(rows)}
+
+        for file_format, content in files.items():
+            upload = SimpleUploadedFile(f"roster.{file_format}", content)
+            start = time.perf_counter()
+            count = sum(1 for row in read_rows(upload))
+            read_time = time.perf_counter() - start
+
+            upload.seek(0)
+            with transaction.atomic():
+                professor = User.objects.create_user(username="benchmark_imports")
+                class_obj = Class.objects.create(professor_key=professor, class_name="Benchmark")
+                start = time.perf_counter()
+                result = import_students(read_rows(upload), class_obj)
+                import_time = time.perf_counter() - start
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f"{file_format:>4}: {len(content) / 1024:.0f} KiB, "
+                f"read {count / read_time:,.0f} rows/s, import {result.imported / import_time:,.0f} rows/s"
+            )
+
+        self.benchmark_ratings(rows, options['ratings_per_student'])
+
+    # a first import of the ratings file inserts every rating, importing it again updates them all
+    def benchmark_ratings(self, students, per_student):
+        rows = [[student[0], f"2025-{month:02d}-{day:02d} 15:00", "TRUE", "TRUE", (day + month) % 6]
+                for student in students for month, day in ((1 + i // 28, 1 + i % 28) for i in range(per_student))]
+        content = self.build_csv(rows)
+        with transaction.atomic():
+            professor = User.objects.create_user(username="benchmark_imports")
+            class_obj = Class.objects.create(professor_key=professor, class_name="Benchmark")
+            import_students(students, class_obj)
+            for run in ("first import", "re-import"):
+                start = time.perf_counter()
+                result = import_ratings(read_rows(SimpleUploadedFile("ratings.csv", content)), class_obj)
+                import_time = time.perf_counter() - start
+                self.stdout.write(
+                    f"ratings {run}: {result.imported:,} rows in {import_time:.2f} s ({result.inserted:,} inserted, {result.updated:,} updated)"
+                )
+            transaction.set_rollback(True)
+
+    def build_csv(self, rows):
+        output = io.StringIO()
+        csv.writer(output).writerows(rows)
+        return output.getvalue().encode('utf-8')
+
+    def build_xlsx(self, rows):
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        for row in rows:
+            sheet.append(row)
+        output = io.BytesIO()
+        workbook.save(output)
+        return output.getvalue()
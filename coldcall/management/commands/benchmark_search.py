@@ -0,0 +1,59 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from coldcall.models import Class, Student
+from coldcall.search import autocomplete, filter_contains
+
+FIRST_NAMES = ('Ann', 'Brian', 'Carla', 'Dmitri', 'Elena', 'Farid', 'Grace', 'Hiro', 'Imani', 'Jonas', 'Keiko', 'Luis')
+LAST_NAMES = ('Lee', 'Johnson', 'Okafor', 'Schmidt', 'Nguyen', 'Garcia', 'Kowalski', 'Haddad', 'Tanaka', 'Brown', 'Silva', 'Novak')
+# (search, what it exercises)
+QUERIES = (
+    ('jo', 'short prefix'),
+    ('elena ng', 'two prefixes'),
+    ('kowalsky', 'misspelled'),
+    ('12345', 'usc_id digits'),
+)
+
+# compares the search index against the LIKE scans it replaced, nothing is kept in the database
+class Command(BaseCommand):
+    help = "Measures autocomplete and home page search times on a generated roster."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=100000, help="Number of students in the generated roster.")
+        parser.add_argument('--repeat', type=int, default=20, help="Times each search is run.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            professor = User.objects.create_user(username="benchmark_search")
+            classes = [Class.objects.create(professor_key=professor, class_name=f"Benchmark {i}") for i in range(10)]
+            Student.objects.bulk_create((
+                Student(
+                    usc_id=f"{i:09d}", email=f"student{i}@example.com", class_key=classes[i % len(classes)],
+                    first_name=f"{FIRST_NAMES[i % len(FIRST_NAMES)]}{i // 997 or ''}",
+                    last_name=f"{LAST_NAMES[i // len(FIRST_NAMES) % len(LAST_NAMES)]}{i // 1009 or ''}",
+                ) for i in range(options['students'])
+            ), batch_size=5000)
+            students = Student.objects.filter(class_key__professor_key=professor)
+
+            for query, description in QUERIES:
+                results = self.time(options['repeat'], lambda: autocomplete(professor, query))
+                self.stdout.write(f"autocomplete {query!r:>11} ({description}): {results[0] * 1000:.1f} ms, {len(results[1])} results")
+
+            for field, query in (('last_name', 'hadd'), ('usc_id', '12345')):
+                indexed = self.time(options['repeat'], lambda: list(filter_contains(students, field, query).values_list('pk')[:50]))
+                scanned = self.time(options['repeat'], lambda: list(students.filter(**{f'{field}__icontains': query}).values_list('pk')[:50]))
+                self.stdout.write(f"{field} contains {query!r}: index {indexed[0] * 1000:.1f} ms, LIKE {scanned[0] * 1000:.1f} ms")
+            transaction.set_rollback(True)
+
+    # best of repeat runs and the last result
+    def time(self, repeat, search):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = search()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from coldcall.models import Student
+
+# repair job for student counters that have drifted from their ratings
+class Command(BaseCommand):
+    help = "Rebuilds every student's call and score counters from their ratings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--class', dest='class_ids', type=int, action='append', help="Only repair the given class, may be repeated.")
+
+    def handle(self, *args, **options):
+        students = Student.objects.all()
+        if options['class_ids']:
+            students = students.filter(class_key__in=options['class_ids'])
+
+        count = students.recalculate_counters()
+        self.stdout.write(self.style.SUCCESS(f"Recalculated counters for {count} students."))
@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from coldcall.jobs import drain_jobs, requeue_stale_jobs
+
+# local worker for uploads queued by AddStudentImportView when BACKGROUND_IMPORTS is on.
+# Jobs are claimed straight from the database, so no broker is needed. Run a single worker process.
+class Command(BaseCommand):
+    help = "Runs queued student and rating imports in a thread pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Number of imports to run at the same time.")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to wait between checks for new jobs.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty instead of polling.")
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} interrupted jobs.")
+
+        stop = threading.Event()
+        # a single worker runs jobs on this thread
+        if workers == 1:
+            self.work(stop, options)
+            return
+        # every thread claims its own jobs, so a long import only holds up the thread running it
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(self.work, stop, options) for i in range(workers)]
+            try:
+                for future in futures:
+                    future.result()
+            finally:
+                # e.g. Ctrl-C or a failed thread, the others finish their current job and exit
+                stop.set()
+
+    def work(self, stop, options):
+        try:
+            while not stop.is_set():
+                count = drain_jobs()
+                if count:
+                    self.stdout.write(self.style.SUCCESS(f"Finished {count} import jobs."))
+                if options['once']:
+                    break
+                stop.wait(options['poll_interval'])
+        finally:
+            # each thread opens its own connection, close it so it isn't left open after the thread exits
+            connection.close()
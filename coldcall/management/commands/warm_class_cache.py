@@ -0,0 +1,19 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from coldcall.models import Class
+
+# fills the class list cache, e.g. after a deploy or a cache flush, so the first page loads don't all query for it
+class Command(BaseCommand):
+    help = "Loads every professor's class list into the cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--professor', dest='usernames', action='append', help="Only warm the given professor's list, may be repeated.")
+
+    def handle(self, *args, **options):
+        professors = None
+        if options['usernames']:
+            professors = list(get_user_model().objects.filter(username__in=options['usernames']))
+
+        count = Class.warm_class_lists(professors)
+        self.stdout.write(self.style.SUCCESS(f"Cached the class lists of {count} professors."))
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:48
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coldcall', '0017_alter_student_options_student_average_score'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['class_key', 'dropped', 'last_name'], name='student_class_roster_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(models.F('class_key'), models.F('dropped'), django.db.models.functions.text.Lower('last_name'), name='student_class_lower_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentrating',
+            index=models.Index(fields=['student_key', 'attendance', 'prepared', 'score'], name='rating_student_counters_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentrating',
+            index=models.Index(fields=['student_key', 'date'], name='rating_student_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentrating',
+            index=models.Index(fields=['class_key', 'date'], name='rating_class_date_idx'),
+        ),
+    ]
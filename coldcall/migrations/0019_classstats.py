@@ -0,0 +1,48 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Q, Sum
+
+
+def populate_class_stats(apps, schema_editor):
+    Class = apps.get_model('coldcall', 'Class')
+    ClassStats = apps.get_model('coldcall', 'ClassStats')
+    Student = apps.get_model('coldcall', 'Student')
+    StudentRating = apps.get_model('coldcall', 'StudentRating')
+
+    for class_id in Class.objects.values_list('pk', flat=True):
+        totals = Student.objects.filter(class_key_id=class_id).aggregate(
+            student_count=Count('pk'),
+            active_count=Count('pk', filter=Q(dropped=False)),
+            rating_count=Sum('total_calls', default=0),
+            present_count=Sum(F('total_calls') - F('absent_calls'), default=0),
+            scored_count=Sum(F('total_calls') - F('absent_calls') - F('unprepared_calls'), default=0),
+            total_score=Sum('total_score', default=0),
+        )
+        totals['last_activity'] = StudentRating.objects.filter(student_key__class_key_id=class_id).aggregate(last=Max('date'))['last']
+        ClassStats.objects.create(class_key_id=class_id, **totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coldcall', '0018_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassStats',
+            fields=[
+                ('class_key', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='coldcall.class')),
+                ('student_count', models.IntegerField(default=0)),
+                ('active_count', models.IntegerField(default=0)),
+                ('rating_count', models.IntegerField(default=0)),
+                ('present_count', models.IntegerField(default=0)),
+                ('scored_count', models.IntegerField(default=0)),
+                ('total_score', models.IntegerField(default=0)),
+                ('last_activity', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(populate_class_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coldcall', '0019_classstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classstats',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coldcall', '0020_classstats_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CallQueue',
+            fields=[
+                ('class_key', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='call_queue', serialize=False, to='coldcall.class')),
+                ('student_ids', models.JSONField(default=list)),
+                ('cycle', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coldcall', '0021_callqueue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentrating',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:54
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min, Q, Sum
+
+
+# older manual adds allowed the same usc_id twice in a class, fold those students into the oldest one
+def merge_duplicate_students(apps, schema_editor):
+    ClassStats = apps.get_model('coldcall', 'ClassStats')
+    Student = apps.get_model('coldcall', 'Student')
+    StudentNote = apps.get_model('coldcall', 'StudentNote')
+    StudentRating = apps.get_model('coldcall', 'StudentRating')
+
+    duplicates = (Student.objects.filter(usc_id__isnull=False).order_by()
+                  .values('class_key', 'usc_id').annotate(keep=Min('pk'), count=Count('pk')).filter(count__gt=1))
+    affected_classes = set()
+    for group in duplicates:
+        others = Student.objects.filter(class_key=group['class_key'], usc_id=group['usc_id']).exclude(pk=group['keep'])
+        StudentRating.objects.filter(student_key__in=others).update(student_key=group['keep'])
+        StudentNote.objects.filter(student_key__in=others).update(student_key=group['keep'])
+        others.delete()
+
+        totals = StudentRating.objects.filter(student_key=group['keep']).aggregate(
+            total_calls=Count('pk'),
+            absent_calls=Count('pk', filter=Q(attendance=False)),
+            unprepared_calls=Count('pk', filter=Q(prepared=False)),
+            total_score=Sum('score', filter=Q(attendance=True, prepared=True), default=0),
+        )
+        scored_calls = totals['total_calls'] - totals['absent_calls'] - totals['unprepared_calls']
+        totals['average_score'] = round(totals['total_score'] / scored_calls, 2) if scored_calls > 0 else 0
+        Student.objects.filter(pk=group['keep']).update(**totals)
+        affected_classes.add(group['class_key'])
+
+    for class_id in affected_classes:
+        ClassStats.objects.filter(pk=class_id).update(version=F('version') + 1, **Student.objects.filter(class_key_id=class_id).aggregate(
+            student_count=Count('pk'),
+            active_count=Count('pk', filter=Q(dropped=False)),
+            rating_count=Sum('total_calls', default=0),
+            present_count=Sum(F('total_calls') - F('absent_calls'), default=0),
+            scored_count=Sum(F('total_calls') - F('absent_calls') - F('unprepared_calls'), default=0),
+            total_score=Sum('total_score', default=0),
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coldcall', '0022_studentrating_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_students, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='student',
+            constraint=models.UniqueConstraint(fields=('class_key', 'usc_id'), name='unique_usc_id_per_class'),
+        ),
+    ]
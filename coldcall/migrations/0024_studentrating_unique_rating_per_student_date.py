@@ -0,0 +1,54 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:56
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Q, Sum
+
+
+# keep the newest of any ratings sharing a student and date, then rebuild the counters they fed into
+def remove_duplicate_ratings(apps, schema_editor):
+    ClassStats = apps.get_model('coldcall', 'ClassStats')
+    Student = apps.get_model('coldcall', 'Student')
+    StudentRating = apps.get_model('coldcall', 'StudentRating')
+
+    duplicates = (StudentRating.objects.order_by().values('student_key', 'date')
+                  .annotate(keep=Max('pk'), count=Count('pk')).filter(count__gt=1))
+    affected_students = set()
+    for group in duplicates:
+        StudentRating.objects.filter(student_key=group['student_key'], date=group['date']).exclude(pk=group['keep']).delete()
+        affected_students.add(group['student_key'])
+
+    affected_classes = set()
+    for student in Student.objects.filter(pk__in=affected_students):
+        totals = StudentRating.objects.filter(student_key=student).aggregate(
+            total_calls=Count('pk'),
+            absent_calls=Count('pk', filter=Q(attendance=False)),
+            unprepared_calls=Count('pk', filter=Q(prepared=False)),
+            total_score=Sum('score', filter=Q(attendance=True, prepared=True), default=0),
+        )
+        scored_calls = totals['total_calls'] - totals['absent_calls'] - totals['unprepared_calls']
+        totals['average_score'] = round(totals['total_score'] / scored_calls, 2) if scored_calls > 0 else 0
+        Student.objects.filter(pk=student.pk).update(**totals)
+        affected_classes.add(student.class_key_id)
+
+    for class_id in affected_classes - {None}:
+        ClassStats.objects.filter(pk=class_id).update(version=F('version') + 1, **Student.objects.filter(class_key_id=class_id).aggregate(
+            rating_count=Sum('total_calls', default=0),
+            present_count=Sum(F('total_calls') - F('absent_calls'), default=0),
+            scored_count=Sum(F('total_calls') - F('absent_calls') - F('unprepared_calls'), default=0),
+            total_score=Sum('total_score', default=0),
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coldcall', '0023_student_unique_usc_id_per_class'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_ratings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='studentrating',
+            constraint=models.UniqueConstraint(fields=('student_key', 'date'), name='unique_rating_per_student_date'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:59
+
+import coldcall.models
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coldcall', '0024_studentrating_unique_rating_per_student_date'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('student_file', models.FileField(upload_to=coldcall.models.import_upload_path)),
+                ('rating_file', models.FileField(blank=True, null=True, upload_to=coldcall.models.import_upload_path)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=8)),
+                ('rows_processed', models.IntegerField(default=0)),
+                ('students_imported', models.IntegerField(default=0)),
+                ('ratings_inserted', models.IntegerField(default=0)),
+                ('ratings_updated', models.IntegerField(default=0)),
+                ('errors', models.JSONField(default=list)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('class_key', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='coldcall.class')),
+                ('professor_key', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created'], name='importjob_status_created_idx')],
+            },
+        ),
+    ]
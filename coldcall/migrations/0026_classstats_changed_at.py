@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-18 17:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coldcall', '0025_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classstats',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
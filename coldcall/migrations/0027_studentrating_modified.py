@@ -0,0 +1,41 @@
+# Generated by Django 5.1.2 on 2026-10-18 17:20
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+import django.utils.timezone
+
+
+# older ratings were saved without a class, the incremental export finds a class's changes by class_key
+def set_class_from_student(apps, schema_editor):
+    Student = apps.get_model('coldcall', 'Student')
+    StudentRating = apps.get_model('coldcall', 'StudentRating')
+    student_class = Student.objects.filter(pk=OuterRef('student_key')).values('class_key')[:1]
+    StudentRating.objects.filter(class_key=None).update(class_key=Subquery(student_class))
+
+
+# existing ratings have never been modified since they were taken
+def set_modified_to_date(apps, schema_editor):
+    StudentRating = apps.get_model('coldcall', 'StudentRating')
+    StudentRating.objects.update(modified=F('date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coldcall', '0026_classstats_changed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentrating',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_class_from_student, migrations.RunPython.noop),
+        migrations.RunPython(set_modified_to_date, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='studentrating',
+            index=models.Index(fields=['class_key', 'modified'], name='rating_class_modified_idx'),
+        ),
+    ]
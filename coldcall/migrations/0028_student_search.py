@@ -0,0 +1,49 @@
+from django.db import migrations
+
+
+# FTS5 tables and triggers over student names, emails and usc_ids as they were first created, see coldcall.search.
+# Written out here so later changes to coldcall.search don't change this migration.
+COLUMNS = "first_name, last_name, email, usc_id"
+NEW_VALUES = "new.id, new.first_name, new.last_name, new.email, new.usc_id"
+OLD_VALUES = "'delete', old.id, old.first_name, old.last_name, old.email, old.usc_id"
+SEARCH_TABLES = {
+    'coldcall_student_search': "tokenize='unicode61 remove_diacritics 2', prefix='2 3'",
+    'coldcall_student_trigram': "tokenize='trigram'",
+}
+
+CREATE_SQL = []
+DROP_SQL = []
+for table, options in SEARCH_TABLES.items():
+    CREATE_SQL += [
+        f"CREATE VIRTUAL TABLE {table} USING fts5({COLUMNS}, content='coldcall_student', content_rowid='id', {options})",
+        f"CREATE TRIGGER {table}_insert AFTER INSERT ON coldcall_student BEGIN "
+        f"INSERT INTO {table}(rowid, {COLUMNS}) VALUES ({NEW_VALUES}); END",
+        f"CREATE TRIGGER {table}_delete AFTER DELETE ON coldcall_student BEGIN "
+        f"INSERT INTO {table}({table}, rowid, {COLUMNS}) VALUES ({OLD_VALUES}); END",
+        f"CREATE TRIGGER {table}_update AFTER UPDATE OF {COLUMNS} ON coldcall_student BEGIN "
+        f"INSERT INTO {table}({table}, rowid, {COLUMNS}) VALUES ({OLD_VALUES}); "
+        f"INSERT INTO {table}(rowid, {COLUMNS}) VALUES ({NEW_VALUES}); END",
+        f"INSERT INTO {table}({table}) VALUES ('rebuild')",
+    ]
+    DROP_SQL += [f"DROP TRIGGER IF EXISTS {table}_{trigger}" for trigger in ('insert', 'delete', 'update')]
+    DROP_SQL.append(f"DROP TABLE IF EXISTS {table}")
+
+
+# FTS5 needs SQLite, other databases search with LIKE and get no index
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'sqlite':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coldcall', '0027_studentrating_modified'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_SQL), run_on_sqlite(DROP_SQL)),
+    ]
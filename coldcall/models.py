@@ -1,6 +1,11 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
-from django.db.models import UniqueConstraint
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Case, Count, F, FloatField, Max, OuterRef, Q, Subquery, Sum, UniqueConstraint, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest, Lower, Round
+from django.db.models.lookups import GreaterThan
+from django.dispatch import Signal
 
 import datetime
 import os
@@ -11,28 +16,110 @@ from django.shortcuts import render
 
 from PIL import Image
 
+# a professor's class list is dropped from the cache whenever one of their classes is saved, updated or deleted.
+# settings.CLASS_LIST_CACHE_TIMEOUT bounds how long it survives changes made behind the ORM's back, or made by
+# another process when the cache is not shared
+def class_list_cache_key(professor_id):
+    return f'coldcall:classes:{professor_id}'
+
+# Drops the professors' class lists now and again once the current transaction commits, as another request
+# can cache the old list in between. Dropping them early is harmless if the transaction rolls back.
+def forget_class_lists(professor_ids):
+    keys = [class_list_cache_key(professor_id) for professor_id in set(professor_ids) - {None}]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+# bulk updates and deletes skip Class.save() and Class.delete(), so they drop the class lists themselves
+class ClassQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        professor_ids = set(self.order_by().values_list('professor_key', flat=True).distinct())
+        count = super().update(**kwargs)
+        # classes moved to another professor change that professor's list too
+        new_professor = kwargs.get('professor_key', kwargs.get('professor_key_id'))
+        professor_ids.add(getattr(new_professor, 'pk', new_professor))
+        forget_class_lists(professor_ids)
+        return count
+
+    def delete(self):
+        professor_ids = set(self.order_by().values_list('professor_key', flat=True).distinct())
+        result = super().delete()
+        forget_class_lists(professor_ids)
+        return result
+
 class Class(models.Model):
     professor_key = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
     class_name = models.CharField(max_length=200)
     is_archived = models.BooleanField(default=False)
     start_date = models.DateField(null=True, blank=True)
     end_date = models.DateField(null=True, blank=True)
+
+    objects = ClassQuerySet.as_manager()
+
     def is_active(self):
         today = datetime.date.today()
         if self.start_date and self.end_date:
             return self.start_date <= today <= self.end_date
         return not self.is_archived
 
+    # The professor's classes for the class dropdowns, in creation order. All of them by default, only archived
+    # or only active ones with archived=True/False. Served from the cache after the first call.
+    @classmethod
+    def for_professor(cls, professor, archived=None):
+        key = class_list_cache_key(professor.pk)
+        classes = cache.get(key)
+        if classes is None:
+            classes = list(cls.objects.filter(professor_key=professor).order_by('pk'))
+            cache.set(key, classes, settings.CLASS_LIST_CACHE_TIMEOUT)
+        if archived is None:
+            return classes
+        return [class_obj for class_obj in classes if class_obj.is_archived == archived]
+
+    # loads every professor's class list into the cache in one query, returns how many lists were cached
+    @classmethod
+    def warm_class_lists(cls, professors=None):
+        classes = cls.objects.order_by('pk')
+        if professors is not None:
+            classes = classes.filter(professor_key__in=professors)
+        lists = {}
+        for class_obj in classes:
+            lists.setdefault(class_list_cache_key(class_obj.professor_key_id), []).append(class_obj)
+        # professors without classes are cached too, or their first page load would query again
+        for professor in professors or ():
+            lists.setdefault(class_list_cache_key(professor.pk), [])
+        cache.set_many(lists, settings.CLASS_LIST_CACHE_TIMEOUT)
+        return len(lists)
+
+    # class create, edit and archive all go through save()
+    def save(self, *args, **kwargs):
+        super(Class, self).save(*args, **kwargs)
+        forget_class_lists([self.professor_key_id])
+
+    def delete(self, *args, **kwargs):
+        result = super(Class, self).delete(*args, **kwargs)
+        forget_class_lists([self.professor_key_id])
+        return result
+
+    # precomputed class totals, built on first use for classes that have never had a student
+    def get_stats(self):
+        try:
+            return ClassStats.objects.get(pk=self.pk)
+        except ClassStats.DoesNotExist:
+            ClassStats.refresh(self.pk)
+            return ClassStats.objects.get(pk=self.pk)
+
     def total_students(self):  
-        return self.student_set.count()
+        return self.get_stats().student_count
 
-    def get_student_performance(self):  # Returns students with their performance (score and attendance)
-        students = self.student_set.all()
+    # Returns students with their performance (score and attendance), read from their stored counters
+    # with the attendance rate computed by the database, so no rating or student model is loaded
+    def get_student_performance(self):
+        students = self.student_set.order_by('pk').with_metrics().values_list('first_name', 'last_name', 'total_score', 'attendance_rate')
         performance_data = [{
-            "student_name": f"{student.first_name} {student.last_name}",
-            "score": student.total_score,
-            "attendance_rate": (student.total_calls - student.absent_calls) / student.total_calls * 100 if student.total_calls else 0
-        } for student in students]
+            "student_name": f"{first_name} {last_name}",
+            "score": total_score,
+            "attendance_rate": attendance_rate,
+        } for first_name, last_name, total_score, attendance_rate in students]
         return performance_data
     
     class Meta:
@@ -40,6 +127,99 @@ class Class(models.Model):
             UniqueConstraint(fields=['professor_key', 'class_name', 'start_date', 'end_date'], name='unique_class_name_per_professor')
         ]
 
+# per-class totals kept current as students and ratings change, so class level reads are a primary key lookup
+class ClassStats(models.Model):
+    class_key = models.OneToOneField(Class, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    student_count = models.IntegerField(default=0)
+    active_count = models.IntegerField(default=0)  # students that have not dropped
+    rating_count = models.IntegerField(default=0)
+    present_count = models.IntegerField(default=0)
+    scored_count = models.IntegerField(default=0)  # ratings that were present and prepared
+    total_score = models.IntegerField(default=0)
+    last_activity = models.DateTimeField(null=True, blank=True)  # date of the latest rating
+    version = models.IntegerField(default=0)  # bumped on every change so per-class caches know when to rebuild
+    changed_at = models.DateTimeField(default=timezone.now)  # when version was last bumped
+
+    def mean_score(self):
+        if self.scored_count <= 0:
+            return 0
+        return round(self.total_score / self.scored_count, 2)
+
+    def attendance_rate(self):
+        if self.rating_count == 0:
+            return 0
+        return round(self.present_count / self.rating_count * 100, 2)
+
+    # (class id, version) of each class, in the order given, None for classes that have no totals yet
+    @classmethod
+    def versions(cls, classes):
+        versions = dict(cls.objects.filter(pk__in=[class_obj.pk for class_obj in classes]).values_list('pk', 'version'))
+        return [(class_obj.pk, versions.get(class_obj.pk)) for class_obj in classes]
+
+    # full recompute from the student counters of the class, used whenever the roster changes
+    @classmethod
+    def refresh(cls, class_id):
+        totals = Student.objects.filter(class_key_id=class_id).aggregate(
+            student_count=Count('pk'),
+            active_count=Count('pk', filter=Q(dropped=False)),
+            rating_count=Sum('total_calls', default=0),
+            present_count=Sum(F('total_calls') - F('absent_calls'), default=0),
+            scored_count=Sum(F('total_calls') - F('absent_calls') - F('unprepared_calls'), default=0),
+            total_score=Sum('total_score', default=0),
+        )
+        totals['last_activity'] = StudentRating.objects.filter(student_key__class_key_id=class_id).aggregate(last=Max('date'))['last']
+        if not cls.objects.filter(pk=class_id).update(version=F('version') + 1, changed_at=timezone.now(), **totals):
+            cls.objects.create(class_key_id=class_id, version=1, **totals)
+
+    # marks the class as changed when its data moved but none of the totals did
+    @classmethod
+    def touch(cls, class_id):
+        if not cls.objects.filter(pk=class_id).update(version=F('version') + 1, changed_at=timezone.now()):
+            cls.refresh(class_id)
+
+    # shifts the totals by a student's counter deltas (see rating_counter_deltas) in one UPDATE
+    @classmethod
+    def apply_rating_deltas(cls, class_id, deltas, rated_at=None):
+        present = deltas['total_calls'] - deltas['absent_calls']
+        values = {
+            'rating_count': F('rating_count') + deltas['total_calls'],
+            'present_count': F('present_count') + present,
+            'scored_count': F('scored_count') + present - deltas['unprepared_calls'],
+            'total_score': F('total_score') + deltas['total_score'],
+            'version': F('version') + 1,
+            'changed_at': timezone.now(),
+        }
+        if rated_at is not None:
+            values['last_activity'] = Greatest(Coalesce('last_activity', Value(rated_at)), Value(rated_at))
+        if not cls.objects.filter(pk=class_id).update(**values):
+            cls.refresh(class_id)
+
+# remaining students of the current cycle for the "everyone once before repeats" randomizer mode
+class CallQueue(models.Model):
+    class_key = models.OneToOneField(Class, on_delete=models.CASCADE, primary_key=True, related_name='call_queue')
+    student_ids = models.JSONField(default=list)  # next pick first
+    cycle = models.IntegerField(default=0)
+
+    # takes a student out of the current cycle, used when they are marked absent or dropped
+    @classmethod
+    def remove(cls, class_id, student_id):
+        with transaction.atomic():
+            queue = cls.objects.select_for_update().filter(pk=class_id).first()
+            if queue and student_id in queue.student_ids:
+                queue.student_ids.remove(student_id)
+                queue.save(update_fields=['student_ids'])
+
+    # moves a skipped student to the end of the current cycle, or puts them back if they had left it
+    @classmethod
+    def requeue(cls, class_id, student_id):
+        with transaction.atomic():
+            queue = cls.objects.select_for_update().filter(pk=class_id).first()
+            if queue:
+                if student_id in queue.student_ids:
+                    queue.student_ids.remove(student_id)
+                queue.student_ids.append(student_id)
+                queue.save(update_fields=['student_ids'])
+
 class Seating:
     choices = (
         ('FR', "Front Right"),
@@ -51,6 +231,71 @@ class Seating:
         ('NA', "None")
     )
 
+# sent once a rating change is committed, with class_id, student_id and the counter deltas. Each one stands for
+# exactly one bump of the class version, so in-memory per-class caches can follow it instead of rebuilding
+rating_counters_changed = Signal()
+
+# denormalized counters on Student that are derived from its StudentRating rows
+COUNTER_FIELDS = ('total_calls', 'absent_calls', 'unprepared_calls', 'total_score')
+
+# amount a single rating contributes to each counter, negate with sign=-1 to remove it
+def rating_counter_deltas(attendance, prepared, score, sign=1):
+    return {
+        'total_calls': sign,
+        'absent_calls': sign if not attendance else 0,
+        'unprepared_calls': sign if not prepared else 0,
+        'total_score': sign * score if attendance and prepared else 0,
+    }
+
+# SQL equivalent of Student.get_average_score, lets average_score be written in the same UPDATE as the counters
+def average_score_expression(total_calls, absent_calls, unprepared_calls, total_score):
+    scored_calls = total_calls - absent_calls - unprepared_calls
+    return Case(
+        When(GreaterThan(scored_calls, 0), then=Round(Cast(total_score, FloatField()) / scored_calls, 2)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+# SQL equivalent of Student.calculate_attendance_rate
+def attendance_rate_expression(total_calls, absent_calls):
+    return Case(
+        When(GreaterThan(total_calls, 0), then=Round(Cast(total_calls - absent_calls, FloatField()) * 100 / total_calls, 2)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+class StudentQuerySet(models.QuerySet):
+    # the average score and attendance rate computed by the database as `average` and `attendance_rate`,
+    # for tables that show them on every row
+    def with_metrics(self):
+        return self.annotate(
+            average=average_score_expression(F('total_calls'), F('absent_calls'), F('unprepared_calls'), F('total_score')),
+            attendance_rate=attendance_rate_expression(F('total_calls'), F('absent_calls')),
+        )
+
+    # rebuilds the counters of every student in the queryset from their ratings in two UPDATE statements,
+    # each counter is a correlated aggregate answered from the rating_student_counters_idx covering index.
+    # Import jobs call this while holding the SQLite write lock, so every other writer waits for it to finish
+    def recalculate_counters(self):
+        ratings = StudentRating.objects.filter(student_key=OuterRef('pk')).order_by().values('student_key')
+
+        def counter(aggregate):
+            return Coalesce(Subquery(ratings.annotate(value=aggregate).values('value')), 0)
+
+        class_ids = set(self.order_by().values_list('class_key', flat=True).distinct()) - {None}
+        with transaction.atomic(savepoint=False):
+            count = self.update(
+                total_calls=counter(Count('pk')),
+                absent_calls=counter(Count('pk', filter=Q(attendance=False))),
+                unprepared_calls=counter(Count('pk', filter=Q(prepared=False))),
+                total_score=counter(Sum('score', filter=Q(attendance=True, prepared=True))),
+            )
+            # SET expressions see the old row, so the average needs the new counters written first
+            self.update(average_score=average_score_expression(F('total_calls'), F('absent_calls'), F('unprepared_calls'), F('total_score')))
+            for class_id in class_ids:
+                ClassStats.refresh(class_id)
+        return count
+
 class Student(models.Model):
     usc_id = models.CharField(max_length=9, null=True)
     email = models.EmailField(max_length=100, null = True) 
@@ -65,17 +310,100 @@ class Student(models.Model):
     dropped = models.BooleanField(default=False)
     average_score = models.FloatField(default=0.0)  # average score of the student
 
+    objects = StudentQuerySet.as_manager()
+
+    # remember the class, drop state and counters the row was loaded with, so save() can tell a transfer or drop,
+    # which refreshes the totals of the classes, from a counter change or an edit that only shifts or touches them
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_state = instance.tracked_state()
+        return instance
+
+    # deferred fields are left out, save() refreshes the totals when it can't compare them
+    def tracked_state(self):
+        return {field: self.__dict__[field] for field in ('class_key_id', 'dropped') + COUNTER_FIELDS if field in self.__dict__}
+
     def save(self, *args, **kwargs):
         self.average_score = self.get_average_score()  # Assign average score before saving
+        adding = self._state.adding
         super(Student, self).save(*args, **kwargs)
+        loaded = getattr(self, '_loaded_state', {})
+        current = self.tracked_state()
+        if adding or loaded.keys() != current.keys() or any(loaded[field] != current[field] for field in ('class_key_id', 'dropped')):
+            self.refresh_class_stats()
+        elif self.class_key_id:
+            deltas = {field: current[field] - loaded[field] for field in COUNTER_FIELDS}
+            if any(deltas.values()):
+                ClassStats.apply_rating_deltas(self.class_key_id, deltas)
+            else:
+                # names and seating are part of the cached tables and exports
+                ClassStats.touch(self.class_key_id)
+        self._loaded_state = current
+
+    def delete(self, *args, **kwargs):
+        result = super(Student, self).delete(*args, **kwargs)
+        self.refresh_class_stats()
+        return result
+
+    def refresh_class_stats(self):
+        for class_id in {getattr(self, '_loaded_state', {}).get('class_key_id'), self.class_key_id} - {None}:
+            ClassStats.refresh(class_id)
 
     def add_rating(self, score, is_present=True, is_prepared=True, in_date=None):
         if in_date is None:
             in_date = timezone.now() # default value locks time on server start
         new_rating = StudentRating(student_key = self, attendance = is_present, prepared = is_prepared, score = score, date = in_date, class_key = self.class_key)
-        new_rating.save()
-        self.recalculate_all()
-        pass
+        with transaction.atomic():
+            new_rating.save()
+            self.apply_counter_deltas(new_rating.counter_deltas(), rated_at=new_rating.date)
+        return new_rating
+
+    # overwrites an existing rating and shifts the counters by the difference between its old and new values
+    def update_rating(self, rating, score, is_present=True, is_prepared=True):
+        old_deltas = rating.counter_deltas(sign=-1)
+        rating.attendance = is_present
+        rating.prepared = is_prepared
+        rating.score = score
+        rating.class_key_id = self.class_key_id
+        with transaction.atomic():
+            rating.save()
+            self.apply_counter_deltas(old_deltas, rating.counter_deltas())
+        return rating
+
+    def remove_rating(self, rating):
+        with transaction.atomic():
+            rating.delete()
+            self.apply_counter_deltas(rating.counter_deltas(sign=-1))
+
+    # adds the given deltas to the counters in a single UPDATE so that concurrent ratings can't overwrite each other,
+    # the in-memory copy is kept in step without reloading the row
+    def apply_counter_deltas(self, *deltas, rated_at=None):
+        totals = dict.fromkeys(COUNTER_FIELDS, 0)
+        for delta in deltas:
+            for field, amount in delta.items():
+                totals[field] += amount
+        if not any(totals.values()):
+            # e.g. an absent rating's score changed, the counters stay put but exports are out of date
+            if self.class_key_id:
+                ClassStats.touch(self.class_key_id)
+            return self
+
+        new_values = {field: F(field) + amount for field, amount in totals.items()}
+        Student.objects.filter(pk=self.pk).update(average_score=average_score_expression(**new_values), **new_values)
+        if self.class_key_id:
+            ClassStats.apply_rating_deltas(self.class_key_id, totals, rated_at)
+            class_id, student_id = self.class_key_id, self.pk
+            transaction.on_commit(lambda: rating_counters_changed.send(sender=Student, class_id=class_id, student_id=student_id, deltas=totals))
+
+        # the row already has the new counters, a later save() mustn't apply them to the class again
+        loaded = getattr(self, '_loaded_state', {})
+        for field, amount in totals.items():
+            setattr(self, field, getattr(self, field) + amount)
+            if field in loaded:
+                loaded[field] += amount
+        self.average_score = self.get_average_score()
+        return self
     
     def calculate_attendance_rate(self):
         if self.total_calls == 0:
@@ -96,11 +424,17 @@ class Student(models.Model):
         else:
             return "Needs Improvement"
         
+    # full recompute from the ratings table, only needed to repair counters that have drifted
     def recalculate_all(self):
-        self.recalculate_total_calls()
-        self.recalculate_absent_calls()
-        self.recalculate_unprepared_calls()
-        self.recalculate_total_score()
+        totals = StudentRating.objects.filter(student_key = self).aggregate(
+            total_calls=Count('pk'),
+            absent_calls=Count('pk', filter=Q(attendance=False)),
+            unprepared_calls=Count('pk', filter=Q(prepared=False)),
+            total_score=Sum('score', filter=Q(attendance=True, prepared=True), default=0),
+        )
+        for field in COUNTER_FIELDS:
+            setattr(self, field, totals[field])
+        self.save()
         return self
         
     def recalculate_total_calls(self):
@@ -137,6 +471,16 @@ class Student(models.Model):
     
     class Meta:
         ordering = ['dropped', 'last_name']
+        constraints = [
+            # lets imports upsert by usc_id, NULL ids are never equal so manual students without one are unaffected
+            UniqueConstraint(fields=['class_key', 'usc_id'], name='unique_usc_id_per_class')
+        ]
+        indexes = [
+            # class roster in default ordering (randomizer, export)
+            models.Index(fields=['class_key', 'dropped', 'last_name'], name='student_class_roster_idx'),
+            # class roster as sorted on the home page
+            models.Index(F('class_key'), F('dropped'), Lower('last_name'), name='student_class_lower_name_idx'),
+        ]
 
 class StudentRating(models.Model):
     student_key = models.ForeignKey(Student, on_delete=models.CASCADE)
@@ -145,6 +489,27 @@ class StudentRating(models.Model):
     prepared = models.BooleanField(default=True)
     score = models.IntegerField(default=5)
     class_key = models.ForeignKey(Class, on_delete=models.CASCADE, null=True)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, unique=True)  # client supplied, stops resubmitted batches counting twice
+    modified = models.DateTimeField(auto_now=True)  # last insert or change, incremental exports pick up rows after a cursor on this
+
+    class Meta:
+        constraints = [
+            # one rating per student per moment, lets re-imported exports upsert instead of duplicating
+            UniqueConstraint(fields=['student_key', 'date'], name='unique_rating_per_student_date')
+        ]
+        indexes = [
+            # covers the per-student counter aggregates
+            models.Index(fields=['student_key', 'attendance', 'prepared', 'score'], name='rating_student_counters_idx'),
+            # a student's rating history in date order (student metrics)
+            models.Index(fields=['student_key', 'date'], name='rating_student_date_idx'),
+            # a class's ratings in date order (export)
+            models.Index(fields=['class_key', 'date'], name='rating_class_date_idx'),
+            # a class's ratings changed after a cursor (incremental export)
+            models.Index(fields=['class_key', 'modified'], name='rating_class_modified_idx'),
+        ]
+
+    def counter_deltas(self, sign=1):
+        return rating_counter_deltas(self.attendance, self.prepared, self.score, sign)
 
     #used in student table view
     def get_formatted_rating(self):
@@ -184,4 +549,65 @@ class StudentNote(models.Model):
     student_key= models.ForeignKey(Student, on_delete=models.CASCADE)
     note = models.TextField()
     date = models.DateTimeField(default=timezone.now)
-    class_key = models.ForeignKey(Class, on_delete=models.CASCADE, null=True)
\ No newline at end of file
+    class_key = models.ForeignKey(Class, on_delete=models.CASCADE, null=True)
+
+# where uploads waiting for the import worker are kept
+def import_upload_path(instance, filename):
+    extension = os.path.splitext(filename)[1]
+    return f"imports/{uuid.uuid4().hex}{extension}"
+
+# a roster (and optional ratings) upload queued for the import worker, polled by the browser for progress
+class ImportJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    professor_key = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    class_key = models.ForeignKey(Class, on_delete=models.CASCADE)
+    student_file = models.FileField(upload_to=import_upload_path)
+    rating_file = models.FileField(upload_to=import_upload_path, null=True, blank=True)
+    status = models.CharField(choices=STATUS_CHOICES, default=PENDING, max_length=8)
+    rows_processed = models.IntegerField(default=0)
+    students_imported = models.IntegerField(default=0)
+    ratings_inserted = models.IntegerField(default=0)
+    ratings_updated = models.IntegerField(default=0)
+    errors = models.JSONField(default=list)
+    created = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the worker polls for the oldest pending job
+            models.Index(fields=['status', 'created'], name='importjob_status_created_idx'),
+        ]
+
+    def is_finished(self):
+        return self.status in (ImportJob.DONE, ImportJob.FAILED)
+
+    # rows per second since the worker picked the job up
+    def throughput(self):
+        if not self.started_at:
+            return 0.0
+        elapsed = ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+        return round(self.rows_processed / elapsed, 1) if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            "id": self.pk,
+            "status": self.status,
+            "finished": self.is_finished(),
+            "rows_processed": self.rows_processed,
+            "students_imported": self.students_imported,
+            "ratings_inserted": self.ratings_inserted,
+            "ratings_updated": self.ratings_updated,
+            "errors": self.errors,
+            "rows_per_second": self.throughput(),
+        }
@@ -0,0 +1,175 @@
+from collections import Counter, OrderedDict
+import random
+import threading
+
+from django.db import transaction
+
+from .models import CallQueue, Student
+
+# students called this many times more than the least called student are not picked
+CALL_SPREAD = 3
+# how many class samplers each worker keeps in memory
+MAX_CACHED_SAMPLERS = 64
+# draws that may land on an absent student before the sampler is rebuilt without them
+MAX_REJECTIONS = 16
+
+# Picks students with probability proportional to how far they are below the "min calls + 3" threshold.
+# Weights are stored in a Fenwick tree so a pick is O(log n) once the sampler has been built.
+class WeightedSampler:
+    def __init__(self, calls):
+        # calls maps student id -> number of calls the student was present for
+        self.calls = calls
+        self.ids = list(calls)
+        self.index = {student_id: i for i, student_id in enumerate(self.ids)}
+        self.lock = threading.RLock()  # picks never see a tree halfway through an update
+        self.build()
+
+    def build(self):
+        self.call_counts = Counter(self.calls.values())
+        self.min_calls = min(self.call_counts, default=0)
+        threshold = self.min_calls + CALL_SPREAD
+        self.weights = [max(threshold - self.calls[student_id], 0) for student_id in self.ids]
+
+        # build the tree in O(n)
+        self.tree = [0] + self.weights
+        for i in range(1, len(self.tree)):
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+        self.total = sum(self.weights)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Sets a student's number of calls. Only their weight changes, in O(log n), unless they were the last of
+    # the least called students; then the threshold moves for everyone and the weights are rebuilt in O(n).
+    def update(self, student_id, calls):
+        with self.lock:
+            i = self.index[student_id]
+            self.call_counts[self.calls[student_id]] -= 1
+            self.call_counts[calls] += 1
+            self.call_counts += Counter()  # drops the counts that reached zero
+            self.calls[student_id] = calls
+            if min(self.call_counts) != self.min_calls:
+                self.build()
+                return
+            weight = max(self.min_calls + CALL_SPREAD - calls, 0)
+            delta = weight - self.weights[i]
+            self.weights[i] = weight
+            self.total += delta
+            pos = i + 1
+            while pos < len(self.tree):
+                self.tree[pos] += delta
+                pos += pos & -pos
+
+    # position of the student that owns the target'th unit of weight
+    def _find(self, target):
+        pos = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self.tree) and self.tree[nxt] <= target:
+                pos = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        return pos
+
+    # lowest call count once the excluded students are left out, None if nobody is left
+    def _remaining_min_calls(self, exclude):
+        excluded_counts = Counter(self.calls[student_id] for student_id in exclude)
+        for calls in sorted(self.call_counts):
+            if self.call_counts[calls] > excluded_counts[calls]:
+                return calls
+        return None
+
+    # returns a student id, skipping any id in exclude, or None if everyone is excluded
+    def pick(self, exclude=(), rng=random):
+        with self.lock:
+            return self._pick(exclude, rng)
+
+    def _pick(self, exclude, rng):
+        exclude = set(exclude) & self.index.keys()
+        if exclude:
+            min_calls = self._remaining_min_calls(exclude)
+            if min_calls is None:
+                return None
+            if min_calls != self.min_calls:
+                # the least called students are all excluded, so the threshold moves up
+                remaining = {student_id: calls for student_id, calls in self.calls.items() if student_id not in exclude}
+                return WeightedSampler(remaining).pick(rng=rng)
+
+        if self.total <= 0:
+            return None
+        # rejecting excluded students keeps the remaining ones in proportion to their weights
+        for i in range(MAX_REJECTIONS):
+            student_id = self.ids[self._find(rng.randrange(self.total))]
+            if student_id not in exclude:
+                return student_id
+
+        # the excluded students hold most of the weight, draw from the rest directly
+        remaining = [(student_id, self.weights[i]) for i, student_id in enumerate(self.ids) if student_id not in exclude and self.weights[i]]
+        return rng.choices([student_id for student_id, weight in remaining], [weight for student_id, weight in remaining])[0]
+
+    # up to count different students, drawn one after another without replacement
+    def pick_many(self, count, exclude=(), rng=random):
+        exclude = set(exclude)
+        picks = []
+        while len(picks) < count:
+            student_id = self.pick(exclude=exclude, rng=rng)
+            if student_id is None:
+                break
+            picks.append(student_id)
+            exclude.add(student_id)
+        return picks
+
+def build_sampler(class_id):
+    rows = Student.objects.filter(class_key_id=class_id, dropped=False).order_by().values_list('pk', 'total_calls', 'absent_calls')
+    return WeightedSampler({pk: total_calls - absent_calls for pk, total_calls, absent_calls in rows})
+
+_samplers = OrderedDict()
+_samplers_lock = threading.Lock()
+
+# Returns the sampler for the class, rebuilding it only when the class version has moved on. Ratings saved by
+# this process are applied to the cached sampler instead (see follow_rating), so it is only rebuilt after
+# roster changes and after ratings saved by other processes.
+def get_sampler(class_id, version):
+    with _samplers_lock:
+        cached = _samplers.get(class_id)
+        if cached and cached[0] == version:
+            _samplers.move_to_end(class_id)
+            return cached[1]
+
+    sampler = build_sampler(class_id)
+    with _samplers_lock:
+        _samplers[class_id] = (version, sampler)
+        _samplers.move_to_end(class_id)
+        while len(_samplers) > MAX_CACHED_SAMPLERS:
+            _samplers.popitem(last=False)
+    return sampler
+
+# Receives rating_counters_changed. The rating bumped the class version by one, the cached sampler takes the
+# student's new number of calls and moves to that version with them; any other change still misses.
+def follow_rating(class_id, student_id, deltas, **kwargs):
+    with _samplers_lock:
+        cached = _samplers.get(class_id)
+        if cached is None:
+            return
+        version, sampler = cached
+        if student_id in sampler.index:
+            sampler.update(student_id, sampler.calls[student_id] + deltas['total_calls'] - deltas['absent_calls'])
+        _samplers[class_id] = (version + 1, sampler)
+
+# The next count students of the class's shuffled cycle without taking them, for the randomizer page and
+# prefetching. They stay queued until they are rated, so picks that are shown but never called keep their turn. Only an
+# exhausted cycle is changed, by starting the next one.
+def peek_queue(class_id, count=1, exclude=(), rng=random):
+    with transaction.atomic():
+        queue, created = CallQueue.objects.select_for_update().get_or_create(class_key_id=class_id)
+        upcoming = [pk for pk in queue.student_ids if pk not in exclude]
+        if not upcoming:
+            queue.student_ids = [pk for pk in Student.objects.filter(class_key_id=class_id, dropped=False).values_list('pk', flat=True)]
+            rng.shuffle(queue.student_ids)
+            queue.cycle += 1
+            queue.save()
+            upcoming = [pk for pk in queue.student_ids if pk not in exclude]
+    return upcoming[:count]
@@ -0,0 +1,80 @@
+from django.db.models import F, Q
+from django.db.models.functions import Lower
+
+import base64
+import binascii
+import hashlib
+import json
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# offered on the home page, any size up to the maximum can be requested
+PAGE_SIZE_CHOICES = (25, 50, 100, 200)
+
+# what the home table's sort options order by, text compares case-insensitively.
+# The default keeps dropped students after the active ones.
+SORT_KEYS = {
+    '': (F('dropped'), Lower('last_name')),
+    'first_name': (Lower('first_name'),),
+    'last_name': (Lower('last_name'),),
+    'seating': (Lower('seating'),),
+    'total_calls': (F('total_calls'),),
+    'absent_calls': (F('absent_calls'),),
+    'average_score': (F('average_score'),),
+}
+
+# page_size query parameter, anything unusable falls back to the default
+def parse_page_size(value):
+    try:
+        return min(max(int(value), 1), MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+
+# A cursor holds the sort key values and id of the last student on a page. It is opaque to clients.
+def encode_page_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_page_cursor(cursor, length):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error):
+        raise ValueError("Invalid cursor.")
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError("Invalid cursor.")
+    return values
+
+# rows that sort after the cursor: (key_0, key_1, ..., pk) > (value_0, value_1, ..., last_pk)
+def after_cursor(names, values):
+    condition = Q(pk__gt=values[-1])
+    for name, value in reversed(list(zip(names, values))):
+        condition = Q(**{f'{name}__gt': value}) | (Q(**{name: value}) & condition)
+    return condition
+
+# One page of students in sort order, and the cursor of the page after it (None on the last page).
+# The page after a cursor is a range condition on the sort keys with id breaking ties, so the index on the
+# sort keys finds where it starts instead of reading every earlier page like OFFSET does.
+def keyset_page(students, sort='', cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    keys = SORT_KEYS.get(sort, SORT_KEYS[''])
+    names = [f'sort_key_{i}' for i in range(len(keys))]
+    students = students.annotate(**dict(zip(names, keys))).order_by(*names, 'pk')
+    if cursor:
+        students = students.filter(after_cursor(names, decode_page_cursor(cursor, len(names) + 1)))
+
+    # one extra row tells whether there is a next page
+    page = list(students[:page_size + 1])
+    if len(page) <= page_size:
+        return page, None
+    page = page[:page_size]
+    return page, encode_page_cursor([getattr(page[-1], name) for name in names] + [page[-1].pk])
+
+# rendered table rows are cached under a key that changes with the data, this only bounds how long unused ones stay
+TABLE_CACHE_TIMEOUT = 60 * 60
+
+# query parameters that change what the table shows
+TABLE_PARAMS = ('class_id', 'sort', 'search_first_name', 'search_last_name', 'search_usc_id', 'cursor', 'page_size')
+
+# ETag and fragment cache key of a rendering of the table. Every change to a class's students or ratings bumps its ClassStats.version,
+# so the (class, version) pairs and the parameters identify the result without running the query.
+def student_table_etag(class_versions, params, file_format, mobile):
+    key = [list(class_versions), [params.get(name, '') for name in TABLE_PARAMS], file_format, mobile]
+    return '"{}"'.format(hashlib.sha1(json.dumps(key).encode()).hexdigest())
@@ -0,0 +1,142 @@
+from django.db import connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Class, Student
+
+import re
+
+# Full-text indexes over student names, emails and usc_ids. Both are FTS5 external content tables over
+# coldcall_student, kept in sync by triggers on every insert, update and delete, bulk import upserts included.
+SEARCH_TABLES = {
+    # whole words and word prefixes, for autocomplete
+    'coldcall_student_search': "tokenize='unicode61 remove_diacritics 2', prefix='2 3'",
+    # any substring of three or more characters, and the trigrams typo-tolerant matches are scored on
+    'coldcall_student_trigram': "tokenize='trigram'",
+}
+SEARCH_COLUMNS = ('first_name', 'last_name', 'email', 'usc_id')
+
+AUTOCOMPLETE_LIMIT = 10
+# longer input is cut off, it only makes bigger trigram queries
+MAX_QUERY_LENGTH = 100
+# trigram candidates read per autocomplete result before typo matches are scored
+FUZZY_CANDIDATES = 5
+# share of the query's trigrams a typo match has to contain
+FUZZY_THRESHOLD = 0.5
+
+# FTS5 needs SQLite, other databases search with LIKE
+def search_index_available(using='default'):
+    return connections[using].vendor == 'sqlite'
+
+# Creates the search tables and triggers that are missing. Django rebuilds coldcall_student to alter it on
+# SQLite, which drops its triggers, so this runs again after every migrate and rebuilds what it recreated.
+def install_search_index(using='default'):
+    if not search_index_available(using):
+        return
+    columns = ', '.join(SEARCH_COLUMNS)
+    new_values = ', '.join(f'new.{column}' for column in ('id',) + SEARCH_COLUMNS)
+    old_values = ', '.join(["'delete'"] + [f'old.{column}' for column in ('id',) + SEARCH_COLUMNS])
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {row[0] for row in cursor.fetchall()}
+        for table, options in SEARCH_TABLES.items():
+            statements = {
+                table: f"CREATE VIRTUAL TABLE {table} USING fts5({columns}, content='coldcall_student', content_rowid='id', {options})",
+                f'{table}_insert': f"CREATE TRIGGER {table}_insert AFTER INSERT ON coldcall_student BEGIN "
+                                   f"INSERT INTO {table}(rowid, {columns}) VALUES ({new_values}); END",
+                f'{table}_delete': f"CREATE TRIGGER {table}_delete AFTER DELETE ON coldcall_student BEGIN "
+                                   f"INSERT INTO {table}({table}, rowid, {columns}) VALUES ({old_values}); END",
+                # counter updates are by far the most common, only changes to the indexed columns touch it
+                f'{table}_update': f"CREATE TRIGGER {table}_update AFTER UPDATE OF {columns} ON coldcall_student BEGIN "
+                                   f"INSERT INTO {table}({table}, rowid, {columns}) VALUES ({old_values}); "
+                                   f"INSERT INTO {table}(rowid, {columns}) VALUES ({new_values}); END",
+            }
+            missing = [name for name in statements if name not in existing]
+            for name in missing:
+                cursor.execute(statements[name])
+            if missing:
+                cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+
+def uninstall_search_index(using='default'):
+    if not search_index_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        for table in SEARCH_TABLES:
+            for trigger in ('insert', 'delete', 'update'):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {table}_{trigger}")
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+# a string as an FTS5 phrase, quotes inside it are doubled
+def fts_phrase(text):
+    return '"{}"'.format(text.replace('"', '""'))
+
+def trigrams(text):
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+# Filters students whose field contains the text, like icontains. Text of three or more characters is
+# looked up in the trigram index, shorter text can't be and falls back to LIKE.
+def filter_contains(students, field, text):
+    if len(text) < 3 or not search_index_available(students.db):
+        return students.filter(**{f'{field}__icontains': text})
+    return students.filter(id__in=RawSQL(
+        "SELECT rowid FROM coldcall_student_trigram WHERE coldcall_student_trigram MATCH %s",
+        [f'{field} : {fts_phrase(text)}'],
+    ))
+
+# Students of the professor matching what has been typed so far, best matches first. Every word has to start
+# a word of the name, email or usc_id; when those run out, students sharing most of the text's trigrams fill
+# the list so misspelled names are still found.
+def autocomplete(professor, text, class_id=None, limit=AUTOCOMPLETE_LIMIT):
+    words = re.findall(r'\w+', text)
+    if not words:
+        return []
+    class_ids = [class_obj.pk for class_obj in Class.for_professor(professor, archived=False)
+                 if not class_id or str(class_obj.pk) == str(class_id)]
+    if not class_ids:
+        return []
+
+    if not search_index_available():
+        condition = Q()
+        for word in words:
+            condition &= Q(first_name__icontains=word) | Q(last_name__icontains=word) | Q(email__icontains=word) | Q(usc_id__icontains=word)
+        students = Student.objects.filter(condition, class_key_id__in=class_ids).select_related('class_key')
+        return list(students.order_by('last_name', 'first_name', 'pk')[:limit])
+
+    ids = ranked('coldcall_student_search', ' AND '.join(f'{fts_phrase(word)}*' for word in words), class_ids, limit)
+    results = load_students(ids)
+    if len(results) < limit:
+        results += fuzzy_matches(text, class_ids, limit - len(results), exclude=ids)
+    return results
+
+# Ids of the students in the classes matching an FTS5 query, in rank order. The match drives the query and
+# each hit is checked against its class, so the cost follows the number of matches rather than the roster.
+def ranked(table, query, class_ids, limit, exclude=()):
+    sql = (f"SELECT {table}.rowid FROM {table} JOIN coldcall_student ON coldcall_student.id = {table}.rowid "
+           f"WHERE {table} MATCH %s AND coldcall_student.class_key_id IN ({', '.join(['%s'] * len(class_ids))})")
+    params = [query, *class_ids]
+    if exclude:
+        sql += f" AND coldcall_student.id NOT IN ({', '.join(['%s'] * len(exclude))})"
+        params += exclude
+    with connection.cursor() as cursor:
+        cursor.execute(sql + f" ORDER BY {table}.rank LIMIT %s", params + [limit])
+        return [row[0] for row in cursor.fetchall()]
+
+def load_students(ids):
+    students = Student.objects.select_related('class_key').in_bulk(ids)
+    return [students[pk] for pk in ids if pk in students]
+
+# trigram matches scored by the share of the text's trigrams they contain, weak ones are left out
+def fuzzy_matches(text, class_ids, limit, exclude=()):
+    query_trigrams = set().union(*(trigrams(word) for word in re.findall(r'\w+', text)))
+    if not query_trigrams:
+        return []
+    query = ' OR '.join(fts_phrase(trigram) for trigram in query_trigrams)
+    candidates = load_students(ranked('coldcall_student_trigram', query, class_ids, limit * FUZZY_CANDIDATES, exclude))
+
+    def score(student):
+        fields = ' '.join(filter(None, (student.first_name, student.last_name, student.email, student.usc_id)))
+        return len(query_trigrams & trigrams(fields)) / len(query_trigrams)
+
+    scored = [(score(student), student) for student in candidates]
+    return [student for value, student in sorted(scored, key=lambda item: -item[0]) if value >= FUZZY_THRESHOLD][:limit]
@@ -0,0 +1,98 @@
+// Re-sorts and pages the home page student table in place with rows from the student table endpoint,
+// instead of reloading the whole page. Falls back to a normal page load if the request fails.
+
+// query parameters of the table, the same as roster.TABLE_PARAMS
+const TABLE_PARAMS = ['class_id', 'sort', 'search_first_name', 'search_last_name', 'search_usc_id', 'cursor', 'page_size'];
+
+// the table parameters of a query string, so a refresh keeps the class, search, sort and page size
+function tableParams(query) {
+    const current = new URLSearchParams(query);
+    const params = new URLSearchParams();
+    TABLE_PARAMS.forEach(function(name) {
+        if (current.get(name)) {
+            params.set(name, current.get(name));
+        }
+    });
+    return params;
+}
+
+function studentTable(endpoint) {
+    const body = document.getElementById('student-table-body');
+    const pagination = document.getElementById('student-table-pagination');
+    const sort = document.getElementById('sort');
+    const pageSize = document.getElementById('page_size');
+    if (!body || !sort) {
+        return;
+    }
+
+    function showPagination(params, nextCursor) {
+        pagination.innerHTML = '';
+        if (params.get('cursor')) {
+            const first = tableParams(params);
+            first.delete('cursor');
+            pagination.appendChild(pageLink('First page', first));
+        }
+        if (nextCursor) {
+            const next = tableParams(params);
+            next.set('cursor', nextCursor);
+            pagination.appendChild(pageLink('Next page', next));
+        }
+    }
+
+    function pageLink(text, params) {
+        const link = document.createElement('a');
+        link.href = '?' + params.toString();
+        link.textContent = text;
+        link.addEventListener('click', function(event) {
+            event.preventDefault();
+            load(params);
+        });
+        return link;
+    }
+
+    function load(params) {
+        // the browser revalidates with the ETag, unchanged rows come back as an empty 304
+        fetch(endpoint + '?' + params.toString(), {credentials: 'same-origin'})
+            .then(function(response) {
+                if (!response.ok) {
+                    throw new Error(response.statusText);
+                }
+                return response.text().then(function(rows) {
+                    body.innerHTML = rows;
+                    const next = body.querySelector('tr[data-next-cursor]');
+                    showPagination(params, next && next.dataset.nextCursor);
+                    history.replaceState(null, '', '?' + params.toString());
+                    // the other forms keep the current class, search, sort and page size
+                    TABLE_PARAMS.forEach(function(name) {
+                        document.querySelectorAll('input[type="hidden"][name="' + name + '"]').forEach(function(input) {
+                            input.value = params.get(name) || '';
+                        });
+                    });
+                });
+            })
+            .catch(function() {
+                window.location.search = params.toString();
+            });
+    }
+
+    // a sort or page size change starts again from the first page
+    [sort, pageSize].forEach(function(select) {
+        if (!select) {
+            return;
+        }
+        select.onchange = null;
+        select.addEventListener('change', function() {
+            const params = tableParams(window.location.search);
+            params.delete('cursor');
+            params.set(select.name, select.value);
+            load(params);
+        });
+    });
+
+    pagination.querySelectorAll('a').forEach(function(link) {
+        link.addEventListener('click', function(event) {
+            event.preventDefault();
+            load(tableParams(link.getAttribute('href').slice(1)));
+        });
+    });
+}
@@ -1,5 +1,12 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
+from django.urls import reverse
+from io import StringIO
+from unittest.mock import patch
+import time
 from coldcall.models import *
 
 from .test_helper import *
@@ -55,4 +62,143 @@ class TestClassWithValidStudents(TestCase):
         for i in performance:
             if i["score"] != 3 or i["attendance_rate"] != 100:
                 self.assertEqual(i, False)
-        self.assertTrue(True)
\ No newline at end of file
+        self.assertTrue(True)
+
+# the class totals should follow every student and rating change
+class TestClassStats(TestCase):
+    def setUp(self):
+        self.professor = init_prof()
+        self.class_obj = init_class(self.professor)
+        self.students = init_sample_students(self.class_obj, 4)
+
+    def assertMatchesRefresh(self):
+        stored = ClassStats.objects.get(pk=self.class_obj.pk)
+        ClassStats.refresh(self.class_obj.pk)
+        refreshed = ClassStats.objects.get(pk=self.class_obj.pk)
+        for field in ('student_count', 'active_count', 'rating_count', 'present_count', 'scored_count', 'total_score', 'last_activity'):
+            self.assertEqual(getattr(refreshed, field), getattr(stored, field), field)
+
+    def test_roster_changes(self):
+        self.assertEqual(4, self.class_obj.get_stats().student_count)
+        self.students[0].dropped = True
+        self.students[0].save()
+        self.students[1].delete()
+        stats = self.class_obj.get_stats()
+        self.assertEqual(3, stats.student_count)
+        self.assertEqual(2, stats.active_count)
+        self.assertMatchesRefresh()
+
+    def test_rating_changes(self):
+        populate_student_constant(self.students[0], 4, 3, 0)
+        rating = self.students[1].add_rating(score=2)
+        self.students[2].add_rating(score=0, is_present=False)
+        self.students[1].update_rating(rating, score=0, is_prepared=False)
+        stats = self.class_obj.get_stats()
+        self.assertEqual(5, stats.rating_count)
+        self.assertEqual(4.0, stats.mean_score())
+        self.assertEqual(80.0, stats.attendance_rate())
+        self.assertIsNotNone(stats.last_activity)
+        self.assertMatchesRefresh()
+
+    def test_transfer_updates_both_classes(self):
+        other_class = Class.objects.create(professor_key=self.professor, class_name="Other")
+        self.students[0].class_key = other_class
+        self.students[0].save()
+        self.assertEqual(3, self.class_obj.total_students())
+        self.assertEqual(1, other_class.total_students())
+
+    def test_edits_do_not_reaggregate(self):
+        student = Student.objects.get(pk=self.students[0].pk)
+        version = self.class_obj.get_stats().version
+        student.first_name = "Renamed"
+        # the student UPDATE and one version bump
+        with self.assertNumQueries(2):
+            student.save()
+        self.assertEqual(version + 1, self.class_obj.get_stats().version)
+
+        student.add_rating(score=4)
+        student.total_calls += 1
+        student.absent_calls += 1
+        with self.assertNumQueries(2):
+            student.save()
+        stats = self.class_obj.get_stats()
+        self.assertEqual((2, 1), (stats.rating_count, stats.present_count))
+        self.assertMatchesRefresh()
+
+    def test_total_students_is_one_lookup(self):
+        with self.assertNumQueries(1):
+            self.class_obj.total_students()
+
+class TestClassListCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.professor = init_prof()
+        self.class_obj = init_class(self.professor)
+        self.archived = Class.objects.create(professor_key=self.professor, class_name="Old", is_archived=True)
+
+    def names(self, **kwargs):
+        return [class_obj.class_name for class_obj in Class.for_professor(self.professor, **kwargs)]
+
+    def test_cached_after_first_call(self):
+        self.assertEqual(["Test101", "Old"], self.names())
+        with self.assertNumQueries(0):
+            self.assertEqual(["Test101"], self.names(archived=False))
+            self.assertEqual(["Old"], self.names(archived=True))
+
+    def test_create_edit_and_archive_invalidate(self):
+        self.names()
+        new_class = Class.objects.create(professor_key=self.professor, class_name="New")
+        self.assertEqual(["Test101", "New"], self.names(archived=False))
+        new_class.class_name = "Renamed"
+        new_class.save()
+        self.assertEqual(["Test101", "Renamed"], self.names(archived=False))
+        self.client.force_login(self.professor)
+        self.client.post(reverse('edit_class', args=[self.class_obj.id]), {'name': "Test101", 'is_archived': 'on'})
+        self.assertEqual(["Renamed"], self.names(archived=False))
+        new_class.delete()
+        self.assertEqual([], self.names(archived=False))
+
+    def test_dropped_again_on_commit(self):
+        self.names()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.class_obj.class_name = "Renamed"
+            self.class_obj.save()
+            # another request reads the old row before the commit
+            cache.set(class_list_cache_key(self.professor.pk), [Class(pk=self.class_obj.pk, class_name="Test101")])
+        self.assertEqual(["Renamed", "Old"], self.names())
+
+    def test_bulk_update_and_delete_invalidate(self):
+        self.names()
+        Class.objects.filter(pk=self.class_obj.pk).update(is_archived=True)
+        self.assertEqual([], self.names(archived=False))
+        Class.objects.filter(pk=self.archived.pk).delete()
+        self.assertEqual(["Test101"], self.names())
+
+    # another worker's change only clears its own locmem cache, this one's copy has to expire
+    @override_settings(CLASS_LIST_CACHE_TIMEOUT=10)
+    def test_changes_from_other_processes_expire(self):
+        self.names()
+        QuerySet.update(Class.objects.filter(pk=self.class_obj.pk), class_name="Renamed")
+        self.assertEqual(["Test101", "Old"], self.names())
+        with patch('django.core.cache.backends.locmem.time.time', return_value=time.time() + 11):
+            self.assertEqual(["Renamed", "Old"], self.names())
+
+    def test_other_professors_unaffected(self):
+        other = User.objects.create_user(username="other", password=PROF_PASSWORD)
+        Class.objects.create(professor_key=other, class_name="Other")
+        self.assertEqual(["Other"], [class_obj.class_name for class_obj in Class.for_professor(other)])
+        self.assertEqual(["Test101", "Old"], self.names())
+
+    def test_warm_up_command(self):
+        out = StringIO()
+        call_command('warm_class_cache', stdout=out)
+        self.assertIn("1 professors", out.getvalue())
+        with self.assertNumQueries(0):
+            self.assertEqual(["Test101", "Old"], self.names())
+
+    def test_manage_classes_filters_cached_list(self):
+        self.client.force_login(self.professor)
+        response = self.client.get(reverse('manage_classes'), {'class_filter': 'all', 'class_name': 'OLD'})
+        self.assertEqual([self.archived], response.context['classes'])
+        response = self.client.get(reverse('manage_classes'))
+        self.assertEqual([self.class_obj], response.context['classes'])
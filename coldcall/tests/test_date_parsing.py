@@ -0,0 +1,36 @@
+from django.test import TestCase
+from coldcall.date_parsing import DateParser
+
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+# tests for the rating import's date parser
+class TestDateParser(TestCase):
+    def test_iso_dates(self):
+        parse_date = DateParser()
+        self.assertEqual(datetime(2025, 4, 2, 15, tzinfo=timezone.utc), parse_date("2025-04-02T15:00:00Z"))
+        self.assertEqual(datetime(2025, 4, 2, 15, tzinfo=timezone(timedelta(hours=-4))), parse_date("2025-04-02 15:00-04:00"))
+        # naive dates are taken as UTC
+        self.assertEqual(datetime(2025, 4, 2, tzinfo=timezone.utc), parse_date("2025-04-02"))
+
+    def test_sample_rating_format(self):
+        parse_date = DateParser()
+        self.assertEqual(datetime(2025, 4, 2, 15, tzinfo=timezone.utc), parse_date("April 2nd, 2025 3PM"))
+        self.assertEqual("%B %d, %Y %I%p", parse_date.format)
+        self.assertEqual(datetime(2025, 4, 21, 9, tzinfo=timezone.utc), parse_date("April 21st, 2025 9AM"))
+
+    def test_dominant_format_reused(self):
+        parse_date = DateParser(sample_size=3)
+        for day in range(1, 4):
+            parse_date(f"04/0{day}/2025 3:00 PM")
+        self.assertEqual("%m/%d/%Y %I:%M %p", parse_date.format)
+        with mock.patch('coldcall.date_parsing.parse') as dateutil_parse:
+            self.assertEqual(datetime(2025, 4, 9, 15, tzinfo=timezone.utc), parse_date("04/09/2025 3:00 PM"))
+        dateutil_parse.assert_not_called()
+
+    def test_outliers_fall_back_to_dateutil(self):
+        parse_date = DateParser()
+        parse_date("04/02/2025 3:00 PM")
+        self.assertEqual(datetime(2025, 4, 3, 9, 30, tzinfo=timezone.utc), parse_date("Thursday 3 April 2025 9:30"))
+        with self.assertRaises(ValueError):
+            parse_date("not a date")
@@ -0,0 +1,174 @@
+from django.core.cache import cache
+from django.http import QueryDict
+from django.test import TestCase
+from django.urls import reverse
+
+from coldcall.models import *
+from coldcall.roster import keyset_page
+
+from .test_helper import *
+
+import re
+
+class TestHomePagination(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.professor = init_prof()
+        self.class_obj = init_class(self.professor)
+        self.students = init_sample_students(self.class_obj, 5)
+        self.client.force_login(self.professor)
+
+    def pages(self, **params):
+        params = {'class_id': self.class_obj.id, 'page_size': 2, **params}
+        while True:
+            response = self.client.get(reverse('home'), params)
+            yield [student.id for student in response.context['table'].students]
+            if not response.context['table'].next_page:
+                return
+            params['cursor'] = QueryDict(response.context['table'].next_page)['cursor']
+
+    def test_pages_cover_the_class_once(self):
+        Student.objects.filter(pk=self.students[0].pk).update(dropped=True)
+        pages = list(self.pages())
+        self.assertEqual([2, 2, 1], [len(page) for page in pages])
+        # active students by last name, then the dropped one
+        self.assertEqual([s.id for s in self.students[1:]] + [self.students[0].id], sum(pages, []))
+
+    def test_ties_broken_by_id(self):
+        Student.objects.filter(class_key=self.class_obj).update(last_name="Same")
+        self.assertEqual([s.id for s in self.students], sum(self.pages(sort='last_name'), []))
+
+    def test_numbers_sort_numerically(self):
+        for student, calls in zip(self.students, [10, 2, 0, 1, 3]):
+            Student.objects.filter(pk=student.pk).update(total_calls=calls)
+        pages = sum(self.pages(sort='total_calls'), [])
+        self.assertEqual([self.students[i].id for i in (2, 3, 1, 4, 0)], pages)
+
+    def test_invalid_cursor_starts_over(self):
+        response = self.client.get(reverse('home'), {'class_id': self.class_obj.id, 'page_size': 2, 'cursor': 'garbage'})
+        self.assertEqual([s.id for s in self.students[:2]], [s.id for s in response.context['table'].students])
+        self.assertIsNone(response.context['table'].first_page)
+
+    def test_page_links_keep_the_search(self):
+        params = {'class_id': self.class_obj.id, 'page_size': 2, 'sort': 'first_name', 'search_first_name': 'First',
+                  'search_last_name': 'Last', 'search_usc_id': '', 'format': 'json'}
+        table = self.client.get(reverse('home'), params).context['table']
+        next_page = QueryDict(table.next_page)
+        for name in ('class_id', 'page_size', 'sort', 'search_first_name', 'search_last_name', 'search_usc_id'):
+            self.assertEqual(str(params[name]), next_page[name])
+        self.assertNotIn('format', next_page)
+        table = self.client.get(reverse('home'), next_page).context['table']
+        self.assertEqual(2, len(table.students))
+        self.assertNotIn('cursor', QueryDict(table.first_page))
+
+    def test_page_size_is_clamped(self):
+        response = self.client.get(reverse('home'), {'class_id': self.class_obj.id, 'page_size': 0})
+        self.assertEqual(1, response.context['page_size'])
+        response = self.client.get(reverse('home'), {'class_id': self.class_obj.id, 'page_size': 'all'})
+        self.assertEqual(5, len(response.context['table'].students))
+
+    def test_later_pages_cost_the_same(self):
+        students = Student.objects.filter(class_key=self.class_obj)
+        page, cursor = keyset_page(students, page_size=1)
+        with self.assertNumQueries(1):
+            keyset_page(students, cursor=cursor, page_size=1)
+
+class TestHomeTable(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.professor = init_prof()
+        self.class_obj = init_class(self.professor)
+        self.client.force_login(self.professor)
+
+    def test_metrics_match_the_model(self):
+        student = init_sample_students(self.class_obj, 1)[0]
+        populate_student_constant(student, 2, 3, 1)
+        student.add_rating(0, is_prepared=False)
+        student.refresh_from_db()
+        row = self.client.get(reverse('home'), {'class_id': self.class_obj.id}).context['table'].students[0]
+        self.assertEqual(student.get_average_score(), row.average)
+        self.assertEqual(student.calculate_attendance_rate(), row.attendance_rate)
+
+        empty = Student.objects.create(first_name="New", last_name="Student", class_key=self.class_obj)
+        empty = Student.objects.filter(pk=empty.pk).with_metrics().get()
+        self.assertEqual((0, 0), (empty.average, empty.attendance_rate))
+
+    def test_query_count_does_not_grow(self):
+        init_sample_students(self.class_obj, 2)
+        with self.assertNumQueries(6):
+            self.client.get(reverse('home'), {'class_id': self.class_obj.id})
+        for i in range(20):
+            Student.objects.create(usc_id=f"1{i:02d}", first_name="New", last_name=str(i), class_key=self.class_obj).add_rating(2)
+        # session and user, onboarding state, the selected class and one page of students, the class list is cached
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('home'), {'class_id': self.class_obj.id})
+        self.assertContains(response, "⚠️")
+
+    def test_repeat_view_served_from_cache(self):
+        student = init_sample_students(self.class_obj, 1)[0]
+        params = {'class_id': self.class_obj.id, 'sort': 'last_name'}
+        self.client.get(reverse('home'), params)
+        # no class or student query, the class list and the rows and pagination come from the cache
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('home'), params)
+        self.assertContains(response, "First0")
+
+        student.first_name = "Renamed"
+        student.save()
+        self.assertContains(self.client.get(reverse('home'), params), "Renamed")
+        # other sorts and the mobile page are cached separately
+        self.assertNotContains(self.client.get(reverse('home'), {**params, 'search_first_name': 'zzz'}), "Renamed")
+        self.assertContains(self.client.get(reverse('home'), params, headers={'User-Agent': 'Mobile'}), "Renamed")
+
+class TestStudentTableView(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.professor = init_prof()
+        self.class_obj = init_class(self.professor)
+        self.students = init_sample_students(self.class_obj, 3)
+        self.client.force_login(self.professor)
+
+    def table(self, etag=None, **params):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get(reverse('student_table'), {'class_id': self.class_obj.id, **params}, headers=headers)
+
+    def test_rows_fragment(self):
+        response = self.table(sort='first_name', page_size=2)
+        self.assertTemplateUsed(response, 'coldcall/student_table_rows.html')
+        self.assertNotContains(response, "<html")
+        self.assertContains(response, "First1")
+        self.assertNotContains(response, "First2")
+        cursor = re.search(r'data-next-cursor="([^"]+)"', response.content.decode()).group(1)
+        response = self.table(sort='first_name', page_size=2, cursor=cursor)
+        self.assertContains(response, "First2")
+        self.assertNotContains(response, "data-next-cursor")
+
+    def test_json_rows(self):
+        self.students[1].add_rating(2)
+        data = self.table(format='json', sort='average_score').json()
+        self.assertIsNone(data['next_cursor'])
+        self.assertEqual(self.students[1].id, data['students'][-1]['id'])
+        self.assertEqual((2.0, 100.0), (data['students'][-1]['average'], data['students'][-1]['attendance_rate']))
+
+    def test_unchanged_rows_not_modified(self):
+        etag = self.table(sort='last_name')['ETag']
+        # session and user, then the class versions
+        with self.assertNumQueries(3):
+            self.assertEqual(304, self.table(etag, sort='last_name').status_code)
+        self.assertEqual(200, self.table(etag, sort='first_name').status_code)
+
+        self.students[0].add_rating(4)
+        self.assertEqual(200, self.table(etag, sort='last_name').status_code)
+
+    def test_all_classes(self):
+        other_class = Class.objects.create(professor_key=self.professor, class_name="Other")
+        etag = self.client.get(reverse('student_table'))['ETag']
+        Student.objects.create(first_name="New", last_name="Student", class_key=other_class)
+        response = self.client.get(reverse('student_table'), HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "New")
+
+    def test_other_professors_class(self):
+        other = User.objects.create_user(username="other", password=PROF_PASSWORD)
+        self.client.force_login(other)
+        self.assertEqual(404, self.table().status_code)
+        self.assertEqual(404, self.client.get(reverse('student_table'), {'class_id': 'x'}).status_code)
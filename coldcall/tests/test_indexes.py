@@ -0,0 +1,88 @@
+from django.db import connection
+from django.db.models.functions import Lower
+from django.test import TestCase
+from unittest import skipUnless
+
+import re
+
+from coldcall.exports import changed_ratings
+from coldcall.models import *
+from coldcall.roster import after_cursor, decode_page_cursor, keyset_page
+
+from .test_helper import *
+
+# plan lines such as "SCAN coldcall_studentrating" mean SQLite reads the whole table,
+# index scans are reported as "SCAN ... USING [COVERING] INDEX ..." instead
+TABLE_SCAN = re.compile(r"\bSCAN (?:TABLE )?(\w+)\s*$", re.MULTILINE)
+
+# the hot query shapes should be answered from the composite indexes rather than table scans
+@skipUnless(connection.vendor == 'sqlite', "query plans are checked with SQLite's EXPLAIN QUERY PLAN")
+class TestHotQueryPlans(TestCase):
+    def setUp(self):
+        self.prof = init_prof()
+        self.class_obj = init_sample_classes(self.prof, 1)[0]
+        self.student = init_sample_students(self.class_obj, 2)[0]
+        populate_student_constant(self.student, 3, 2, 1)
+
+    def assertNoTableScan(self, queryset):
+        plan = queryset.explain()
+        self.assertIsNone(TABLE_SCAN.search(plan), plan)
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    # Student.recalculate_all and StudentQuerySet.recalculate_counters
+    def test_student_counters(self):
+        ratings = StudentRating.objects.filter(student_key=self.student)
+        self.assertNoTableScan(ratings.filter(attendance=False))
+        self.assertNoTableScan(ratings.filter(prepared=False))
+        self.assertUsesIndex(ratings.filter(attendance=True, prepared=True).values('score'), 'rating_student_counters_idx')
+
+    def test_class_counters(self):
+        students = Student.objects.filter(class_key=self.class_obj).values('pk')
+        queryset = (StudentRating.objects.filter(student_key__in=students).order_by()
+                    .values('student_key').annotate(total=Count('pk')))
+        self.assertNoTableScan(queryset)
+
+    # StudentMetricsView
+    def test_student_history(self):
+        queryset = StudentRating.objects.filter(student_key=self.student.pk).order_by('date')
+        self.assertUsesIndex(queryset, 'rating_student_date_idx')
+
+    # ExportClassFileView
+    def test_class_ratings(self):
+        self.assertUsesIndex(StudentRating.objects.filter(class_key=self.class_obj).order_by('date'), 'rating_class_date_idx')
+        self.assertNoTableScan(self.student.studentrating_set.all())
+        self.assertUsesIndex(self.class_obj.student_set.all(), 'student_class_roster_idx')
+
+    # incremental export, a class's changes in change order without sorting them
+    def test_class_changed_ratings(self):
+        ratings, cursor = changed_ratings(self.class_obj, timezone.now() - datetime.timedelta(days=1), after_pk=0)
+        plan = ratings.explain()
+        self.assertIn('rating_class_modified_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    # import_ratings
+    def test_class_usc_id_lookup(self):
+        self.assertNoTableScan(self.class_obj.student_set.exclude(usc_id=None).values_list('usc_id', 'pk'))
+
+    # HomePageView and StudentRandomizerView
+    def test_class_roster(self):
+        queryset = Student.objects.filter(class_key_id=self.class_obj.pk).order_by('dropped', Lower('last_name'))
+        self.assertUsesIndex(queryset, 'student_class_lower_name_idx')
+        self.assertNoTableScan(Student.objects.filter(class_key=self.class_obj, dropped=False))
+
+    # later pages of the home table start from an index seek on the sort keys
+    def test_class_roster_page(self):
+        students = Student.objects.filter(class_key_id=self.class_obj.pk)
+        page, cursor = keyset_page(students, page_size=1)
+        queryset = (students.annotate(sort_key_0=F('dropped'), sort_key_1=Lower('last_name'))
+                    .filter(after_cursor(['sort_key_0', 'sort_key_1'], decode_page_cursor(cursor, 3)))
+                    .order_by('sort_key_0', 'sort_key_1', 'pk'))
+        self.assertUsesIndex(queryset, 'student_class_lower_name_idx')
+
+    def test_professor_roster(self):
+        queryset = (Student.objects.filter(class_key__professor_key=self.prof, class_key__is_archived=False)
+                    .order_by('dropped', Lower('last_name')))
+        self.assertNoTableScan(queryset)
@@ -0,0 +1,313 @@
+from django.test import TestCase
+from django.urls import reverse
+
+import random
+from unittest.mock import patch
+
+from coldcall.models import *
+from coldcall.randomizer import WeightedSampler, get_sampler
+
+from .test_helper import *
+
+# tests for the weighted sampler behind the randomizer
+class TestWeightedSampler(TestCase):
+    def draw(self, sampler, n=2000, exclude=()):
+        rng = random.Random(1)
+        picks = {}
+        for i in range(n):
+            student_id = sampler.pick(exclude=exclude, rng=rng)
+            picks[student_id] = picks.get(student_id, 0) + 1
+        return picks
+
+    def test_empty(self):
+        self.assertIsNone(WeightedSampler({}).pick())
+
+    def test_threshold(self):
+        # students 3 or more calls above the minimum are never picked
+        picks = self.draw(WeightedSampler({1: 0, 2: 1, 3: 3, 4: 7}))
+        self.assertEqual({1, 2}, set(picks))
+        # weights are 3 and 2
+        self.assertAlmostEqual(0.6, picks[1] / 2000, delta=0.05)
+
+    def test_exclude(self):
+        picks = self.draw(WeightedSampler({1: 0, 2: 1, 3: 1}), exclude={2})
+        self.assertEqual({1, 3}, set(picks))
+
+    def test_exclude_least_called_moves_threshold(self):
+        # with student 1 absent the minimum becomes 3, so student 3 can be picked again
+        picks = self.draw(WeightedSampler({1: 0, 2: 3, 3: 5}), exclude={1})
+        self.assertEqual({2, 3}, set(picks))
+
+    def test_everyone_excluded(self):
+        self.assertIsNone(WeightedSampler({1: 0, 2: 0}).pick(exclude={1, 2}))
+
+    def test_update_matches_rebuild(self):
+        sampler = WeightedSampler({1: 0, 2: 0, 3: 2, 4: 5})
+        for student_id, calls in ((1, 1), (3, 1), (2, 1), (2, 4), (4, 0)):
+            sampler.update(student_id, calls)
+            rebuilt = WeightedSampler(dict(sampler.calls))
+            self.assertEqual((rebuilt.min_calls, rebuilt.total, rebuilt.tree), (sampler.min_calls, sampler.total, sampler.tree))
+
+# tests for the randomizer page using the cached sampler
+class TestRandomizerView(TestCase):
+    def setUp(self):
+        self.prof = init_prof()
+        self.class_obj = init_class(self.prof)
+        self.students = init_sample_students(self.class_obj, 5)
+        self.client.force_login(self.prof)
+        self.url = reverse('randomizer') + f"?class_id={self.class_obj.id}"
+
+    def test_picks_least_called(self):
+        for student in self.students[1:]:
+            populate_student_constant(student, 3, 4, 0)
+        response = self.client.get(self.url)
+        self.assertEqual(self.students[0], response.context['student'])
+
+    def test_sampler_cached_per_version(self):
+        version = self.class_obj.get_stats().version
+        self.client.get(self.url)
+        self.assertIs(get_sampler(self.class_obj.id, version), get_sampler(self.class_obj.id, version))
+
+        self.students[0].add_rating(score=3)
+        new_version = self.class_obj.get_stats().version
+        self.assertNotEqual(version, new_version)
+        self.assertIsNot(get_sampler(self.class_obj.id, version), get_sampler(self.class_obj.id, new_version))
+
+    def test_sampler_follows_ratings(self):
+        sampler = get_sampler(self.class_obj.id, self.class_obj.get_stats().version)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.students[0].add_rating(score=3)
+            self.students[1].add_rating(score=0, is_present=False)
+        version = self.class_obj.get_stats().version
+        with self.assertNumQueries(0):
+            self.assertIs(sampler, get_sampler(self.class_obj.id, version))
+        self.assertEqual(1, sampler.calls[self.students[0].id])
+        self.assertEqual(0, sampler.calls[self.students[1].id])
+        self.assertEqual(WeightedSampler(dict(sampler.calls)).tree, sampler.tree)
+
+        # changes made elsewhere are only seen by rebuilding
+        ClassStats.touch(self.class_obj.id)
+        self.assertIsNot(sampler, get_sampler(self.class_obj.id, self.class_obj.get_stats().version))
+
+    def test_dropped_students_not_picked(self):
+        for student in self.students[1:]:
+            student.dropped = True
+            student.save()
+        for i in range(5):
+            self.assertEqual(self.students[0], self.client.get(self.url).context['student'])
+
+    def test_all_absent(self):
+        session = self.client.session
+        session['absent_students'] = [str(s.id) for s in self.students]
+        session['last_class_id'] = str(self.class_obj.id)
+        session.save()
+        response = self.client.get(self.url)
+        self.assertIsNone(response.context.get('student'))
+
+# tests for the "everyone once before repeats" mode
+class TestShuffleMode(TestCase):
+    def setUp(self):
+        self.prof = init_prof()
+        self.class_obj = init_class(self.prof)
+        self.students = init_sample_students(self.class_obj, 6)
+        self.client.force_login(self.prof)
+        self.url = reverse('randomizer') + f"?class_id={self.class_obj.id}&mode=shuffle"
+
+    def pick(self):
+        return self.client.get(self.url).context['student']
+
+    def rate(self, student, rating='star-3'):
+        return self.client.post(reverse('randomizer'), {'student_id': student.pk, 'rating': rating}, content_type='application/json')
+
+    # each shown student is rated before the next one is picked
+    def call(self):
+        student = self.pick()
+        self.rate(student)
+        return student
+
+    def test_everyone_once_per_cycle(self):
+        first_cycle = [self.call() for i in range(6)]
+        self.assertCountEqual(self.students, first_cycle)
+        second_cycle = [self.call() for i in range(6)]
+        self.assertCountEqual(self.students, second_cycle)
+        self.assertEqual(2, CallQueue.objects.get(pk=self.class_obj.pk).cycle)
+
+    def test_reload_keeps_the_student_queued(self):
+        student = self.pick()
+        self.assertEqual(student, self.pick())
+        self.assertEqual(6, len(CallQueue.objects.get(pk=self.class_obj.pk).student_ids))
+        self.rate(student)
+        self.assertNotIn(student.pk, CallQueue.objects.get(pk=self.class_obj.pk).student_ids)
+        self.assertNotEqual(student, self.pick())
+
+    def test_mode_persists_in_session(self):
+        self.call()
+        response = self.client.get(reverse('randomizer') + f"?class_id={self.class_obj.id}")
+        self.assertEqual('shuffle', response.context['mode'])
+        self.assertEqual(5, len(CallQueue.objects.get(pk=self.class_obj.pk).student_ids))
+
+    def test_drop_removes_from_queue(self):
+        self.pick()
+        queue = CallQueue.objects.get(pk=self.class_obj.pk)
+        dropped = Student.objects.get(pk=queue.student_ids[0])
+        self.client.post(reverse('student_drop', args=[dropped.pk]))
+        self.assertNotIn(dropped.pk, CallQueue.objects.get(pk=self.class_obj.pk).student_ids)
+        picks = [self.call() for i in range(5)]
+        self.assertNotIn(dropped, picks)
+
+    def test_deleted_student_leaves_the_queue(self):
+        deleted = self.pick()
+        Student.objects.filter(pk=deleted.pk).delete()
+        self.assertNotEqual(deleted.pk, self.pick().pk)
+        self.assertNotIn(deleted.pk, CallQueue.objects.get(pk=self.class_obj.pk).student_ids)
+
+    def test_other_professors_students_untouched(self):
+        other_class = init_class(User.objects.create_user(username="other", password=PROF_PASSWORD))
+        other_student = init_sample_students(other_class, 2)[1]
+        CallQueue.objects.create(class_key=other_class, student_ids=[other_student.pk, 999])
+        self.pick()
+        self.rate(other_student, 'skip')
+        self.assertEqual([other_student.pk, 999], CallQueue.objects.get(pk=other_class.pk).student_ids)
+        response = self.rate(other_student)
+        self.assertFalse(response.json()['success'])
+        self.assertEqual(0, other_student.studentrating_set.count())
+
+    def test_absent_and_skip(self):
+        student = self.pick()
+        self.rate(student, 'skip')
+        self.assertEqual(student.pk, CallQueue.objects.get(pk=self.class_obj.pk).student_ids[-1])
+        self.assertEqual(6, len(CallQueue.objects.get(pk=self.class_obj.pk).student_ids))
+        self.assertNotEqual(student, self.pick())
+
+        self.client.post(reverse('randomizer'), {'student_id': student.pk, 'rating': 'absent'}, content_type='application/json')
+        queue = CallQueue.objects.get(pk=self.class_obj.pk)
+        self.assertNotIn(student.pk, queue.student_ids)
+        self.assertEqual(5, len(queue.student_ids))
+
+# tests for the JSON endpoint that prefetches picks
+class TestRandomizerPicks(TestCase):
+    def setUp(self):
+        self.prof = init_prof()
+        self.class_obj = init_class(self.prof)
+        self.students = init_sample_students(self.class_obj, 4)
+        self.client.force_login(self.prof)
+
+    def picks(self, **params):
+        params.setdefault('class_id', self.class_obj.id)
+        return self.client.get(reverse('randomizer_picks'), params).json()
+
+    def test_weighted_picks_are_distinct(self):
+        data = self.picks(count=10, mode='weighted')
+        ids = [s['id'] for s in data['students']]
+        self.assertCountEqual([s.id for s in self.students], ids)
+        self.assertEqual({'id', 'first_name', 'last_name', 'seating', 'total_calls', 'average_score'}, set(data['students'][0]))
+
+    def test_shuffle_picks_stay_queued_until_rated(self):
+        first = [s['id'] for s in self.picks(count=3, mode='shuffle')['students']]
+        self.assertEqual(first, [s['id'] for s in self.picks(count=3, mode='shuffle')['students']])
+
+        self.client.post(reverse('randomizer'), {'student_id': first[0], 'rating': 'star-4'}, content_type='application/json')
+        queue = CallQueue.objects.get(pk=self.class_obj.pk)
+        self.assertNotIn(first[0], queue.student_ids)
+        self.assertEqual(first[1:], queue.student_ids[:2])
+        self.assertEqual(first[1:], [s['id'] for s in self.picks(count=2)['students']])
+
+    def test_shuffle_picks_start_the_next_cycle(self):
+        first = [s['id'] for s in self.picks(count=10, mode='shuffle')['students']]
+        self.assertCountEqual([s.id for s in self.students], first)
+        for student_id in first:
+            self.client.post(reverse('randomizer'), {'student_id': student_id, 'rating': 'star-3'}, content_type='application/json')
+        self.assertCountEqual(first, [s['id'] for s in self.picks(count=10)['students']])
+        self.assertEqual(2, CallQueue.objects.get(pk=self.class_obj.pk).cycle)
+
+    def test_other_professor(self):
+        other = User.objects.create_user(username="other", password=PROF_PASSWORD)
+        other_class = Class.objects.create(professor_key=other, class_name="Other")
+        response = self.client.get(reverse('randomizer_picks'), {'class_id': other_class.id})
+        self.assertEqual(404, response.status_code)
+
+# tests for submitting a queue of ratings in one request
+class TestRandomizerBatch(TestCase):
+    def setUp(self):
+        self.prof = init_prof()
+        self.class_obj = init_class(self.prof)
+        self.students = init_sample_students(self.class_obj, 3)
+        self.client.force_login(self.prof)
+
+    def submit(self, ratings):
+        return self.client.post(reverse('randomizer_batch'), {'ratings': ratings}, content_type='application/json').json()
+
+    def test_batch_updates_counters(self):
+        a, b, c = self.students
+        data = self.submit([
+            {'student_id': a.id, 'rating': 'star-4', 'timestamp': '2025-04-02T15:00:00Z', 'idempotency_key': 'k1'},
+            {'student_id': a.id, 'rating': 'star-2', 'timestamp': 1743609600000, 'idempotency_key': 'k2'},
+            {'student_id': b.id, 'rating': 'absent', 'idempotency_key': 'k3'},
+            {'student_id': c.id, 'rating': 'skip'},
+        ])
+        self.assertEqual({'success': True, 'created': 3, 'duplicates': [], 'errors': []}, data)
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual((2, 6, 3.0), (a.total_calls, a.total_score, a.average_score))
+        self.assertEqual((1, 1), (b.total_calls, b.absent_calls))
+        self.assertEqual(3, self.class_obj.get_stats().rating_count)
+        self.assertIn(str(b.id), self.client.session['absent_students'])
+
+    def test_resubmitted_batch_is_ignored(self):
+        ratings = [{'student_id': self.students[0].id, 'rating': 'star-5', 'idempotency_key': 'same'}]
+        self.submit(ratings)
+        data = self.submit(ratings + ratings)
+        self.assertEqual(0, data['created'])
+        self.assertEqual(['same', 'same'], data['duplicates'])
+        self.assertEqual(1, StudentRating.objects.count())
+
+    def test_invalid_entries_reported(self):
+        other = User.objects.create_user(username="other", password=PROF_PASSWORD)
+        other_student = init_sample_students(Class.objects.create(professor_key=other, class_name="Other"), 1)[0]
+        data = self.submit([
+            {'student_id': other_student.id, 'rating': 'star-3'},
+            {'student_id': self.students[0].id, 'rating': 'star-3', 'timestamp': 'yesterday'},
+            {'student_id': self.students[0].id, 'rating': 'unprepared'},
+        ])
+        self.assertFalse(data['success'])
+        self.assertEqual([0, 1], [error['index'] for error in data['errors']])
+        self.assertEqual(1, data['created'])
+        self.assertFalse(StudentRating.objects.filter(student_key=other_student).exists())
+
+    def test_same_timestamp_rejected(self):
+        student = self.students[0]
+        ratings = [
+            {'student_id': student.id, 'rating': 'star-3', 'timestamp': '2025-04-02T15:00:00Z', 'idempotency_key': 'a'},
+            {'student_id': student.id, 'rating': 'star-5', 'timestamp': '2025-04-02T15:00:00Z', 'idempotency_key': 'b'},
+        ]
+        data = self.submit(ratings)
+        self.assertEqual(1, data['created'])
+        self.assertEqual([1], [error['index'] for error in data['errors']])
+        self.assertEqual(1, StudentRating.objects.filter(student_key=student).count())
+
+    def test_bad_timestamps_are_entry_errors(self):
+        student = self.students[0]
+        data = self.submit([{'student_id': student.id, 'rating': 'star-3', 'timestamp': timestamp} for timestamp in (1e20, 1e300, -1, True, float('nan'))]
+                           + [{'student_id': student.id, 'rating': 'star-3'}])
+        self.assertEqual([0, 1, 2, 3, 4], [error['index'] for error in data['errors']])
+        self.assertEqual(1, data['created'])
+
+    def test_rating_inserted_after_the_check(self):
+        a, b = self.students[:2]
+        bulk_create = StudentRating.objects.bulk_create
+
+        # another request saves a rating for a at the same time between the check and every insert of a
+        def racing_bulk_create(ratings):
+            if ratings[0].student_key_id == a.id:
+                StudentRating.objects.get_or_create(student_key=a, class_key=self.class_obj, date=ratings[0].date)
+            return bulk_create(ratings)
+
+        with patch.object(StudentRating.objects, 'bulk_create', racing_bulk_create):
+            data = self.submit([
+                {'student_id': a.id, 'rating': 'star-3', 'timestamp': '2025-04-02T15:00:00Z'},
+                {'student_id': b.id, 'rating': 'star-4', 'timestamp': '2025-04-02T15:00:00Z'},
+            ])
+        self.assertEqual(1, data['created'])
+        self.assertEqual([0], [error['index'] for error in data['errors']])
+        b.refresh_from_db()
+        self.assertEqual(1, b.total_calls)
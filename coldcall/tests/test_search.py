@@ -0,0 +1,76 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from unittest import skipUnless
+
+from coldcall.importers import import_students
+from coldcall.models import *
+from coldcall.search import autocomplete, filter_contains
+
+from .test_helper import *
+
+@skipUnless(connection.vendor == 'sqlite', "the search index uses SQLite's FTS5")
+class TestStudentSearch(TestCase):
+    def setUp(self):
+        self.professor = init_prof()
+        self.class_obj = init_class(self.professor)
+        self.ann = Student.objects.create(usc_id="123456789", email="ann.lee@example.com", first_name="Ann", last_name="Lee", class_key=self.class_obj)
+        self.bo = Student.objects.create(usc_id="987654321", first_name="Bo", last_name="Johnson", class_key=self.class_obj)
+
+    def names(self, text, **kwargs):
+        return [student.first_name for student in autocomplete(self.professor, text, **kwargs)]
+
+    def test_prefixes(self):
+        self.assertEqual(["Ann"], self.names("an"))
+        self.assertEqual(["Ann"], self.names("ann le"))
+        self.assertEqual(["Bo"], self.names("98765"))
+        self.assertEqual([], self.names("   "))
+
+    def test_misspelled(self):
+        self.assertEqual(["Bo"], self.names("johnsen"))
+        self.assertEqual([], self.names("xyzzy"))
+
+    def test_only_own_active_classes(self):
+        other = User.objects.create_user(username="other", password=PROF_PASSWORD)
+        other_class = Class.objects.create(professor_key=other, class_name="Other")
+        Student.objects.create(first_name="Anna", last_name="Other", class_key=other_class)
+        archived = Class.objects.create(professor_key=self.professor, class_name="Old", is_archived=True)
+        Student.objects.create(first_name="Andy", last_name="Old", class_key=archived)
+        self.assertEqual(["Ann"], self.names("an"))
+        self.assertEqual([], self.names("an", class_id=other_class.id))
+
+    def test_index_follows_changes(self):
+        self.ann.first_name = "Annabel"
+        self.ann.save()
+        Student.objects.filter(pk=self.bo.pk).update(last_name="Brown")
+        self.assertEqual(["Annabel"], self.names("annab"))
+        self.assertEqual(["Bo"], self.names("brown"))
+        self.assertEqual([], self.names("johnson"))
+
+        self.ann.delete()
+        self.assertEqual([], self.names("annab"))
+
+        import_students([["555", "cy@example.com", "Cyrus", "Vance"], ["987654321", "bob@example.com", "Bob", "Johnson"]], self.class_obj)
+        self.assertEqual(["Cyrus"], self.names("cyr"))
+        self.assertEqual(["Bob"], self.names("johnson"))
+
+    def test_filter_contains(self):
+        students = Student.objects.filter(class_key=self.class_obj)
+        self.assertEqual([self.bo], list(filter_contains(students, 'last_name', "OHNS")))
+        self.assertEqual([self.ann], list(filter_contains(students, 'usc_id', "345")))
+        # too short for trigrams
+        self.assertEqual([self.bo], list(filter_contains(students, 'last_name', "hn")))
+
+    def test_autocomplete_view(self):
+        self.client.force_login(self.professor)
+        response = self.client.get(reverse('student_autocomplete'), {'q': 'lee'})
+        student = response.json()['students'][0]
+        self.assertEqual((self.ann.id, "Test101"), (student['id'], student['class_name']))
+        self.assertEqual(reverse('student_metrics', args=[self.ann.id]), student['url'])
+
+    def test_home_search(self):
+        cache.clear()
+        self.client.force_login(self.professor)
+        response = self.client.get(reverse('home'), {'class_id': self.class_obj.id, 'search_last_name': 'johns'})
+        self.assertEqual([self.bo], response.context['table'].students)
@@ -1,12 +1,23 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
 from coldcall.models import *
+from coldcall.importers import RATING_COLUMNS, STUDENT_COLUMNS, import_ratings, import_students, read_xlsx_rows
+from coldcall.jobs import drain_jobs, requeue_stale_jobs
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+from coldcall.exports import iter_class_exports, iter_zip
+from zipfile import ZipFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from django.apps import apps
+from importlib import import_module
 import csv
 import io
+import tempfile
 import time
 from django.contrib.messages import get_messages
+from openpyxl import Workbook
 
 from .test_helper import *
 # tests related to the student model and its methods
@@ -215,4 +226,465 @@ class TestStudentImportExport(TestCase):
         # The existing student should have been updated, not duplicated
         updated_student = Student.objects.get(usc_id="5555555")
         self.assertEqual(updated_student.first_name, "Duplicate")  # Updated name
-        self.assertEqual(updated_student.email, "dup@example.com")  # Updated email
\ No newline at end of file
+        self.assertEqual(updated_student.email, "dup@example.com")  # Updated email
+
+# tests for keeping counters current from rating deltas instead of recounting every rating
+class TestRatingDeltas(TestCase):
+    def setUp(self):
+        self.student = init_sample_students(init_class(init_prof()), 1)[0]
+
+    def assertMatchesRecalculation(self, student):
+        stored = Student.objects.get(pk=student.pk)
+        repaired = Student.objects.get(pk=student.pk).recalculate_all()
+        for field in COUNTER_FIELDS + ('average_score',):
+            self.assertEqual(getattr(repaired, field), getattr(stored, field), field)
+            self.assertEqual(getattr(repaired, field), getattr(student, field), field)
+
+    def test_add_rating_updates_counters(self):
+        self.student.add_rating(score=4)
+        self.student.add_rating(score=2)
+        self.student.add_rating(score=0, is_present=False)
+        self.student.add_rating(score=0, is_prepared=False)
+        self.assertEqual(4, self.student.total_calls)
+        self.assertEqual(1, self.student.absent_calls)
+        self.assertEqual(1, self.student.unprepared_calls)
+        self.assertEqual(6, self.student.total_score)
+        self.assertEqual(3.0, self.student.average_score)
+        self.assertMatchesRecalculation(self.student)
+
+    def test_add_rating_query_count(self):
+        self.student.add_rating(score=3)
+        # insert, student counter update and class totals update, the rest is savepoint handling
+        with self.assertNumQueries(5):
+            self.student.add_rating(score=5)
+
+    def test_update_rating(self):
+        rating = self.student.add_rating(score=5)
+        self.student.add_rating(score=3)
+        self.student.update_rating(rating, score=0, is_present=False)
+        self.assertEqual(3, self.student.total_score)
+        self.assertEqual(1, self.student.absent_calls)
+        self.assertMatchesRecalculation(self.student)
+
+        self.student.update_rating(rating, score=1)
+        self.assertEqual(4, self.student.total_score)
+        self.assertEqual(0, self.student.absent_calls)
+        self.assertMatchesRecalculation(self.student)
+
+    def test_remove_rating(self):
+        rating = self.student.add_rating(score=0, is_prepared=False)
+        self.student.add_rating(score=2)
+        self.student.remove_rating(rating)
+        self.assertEqual(1, self.student.total_calls)
+        self.assertEqual(0, self.student.unprepared_calls)
+        self.assertEqual(2.0, self.student.average_score)
+        self.assertMatchesRecalculation(self.student)
+
+    def test_edit_rating_view(self):
+        self.client.force_login(self.student.class_key.professor_key)
+        rating = self.student.add_rating(score=5)
+        self.client.post(reverse('edit_rating', args=[self.student.pk, rating.pk]), {'modifier': 'none', 'rating': '2'})
+        student = Student.objects.get(pk=self.student.pk)
+        self.assertEqual(2, student.total_score)
+        self.assertMatchesRecalculation(student)
+
+# tests for the set-based counter rebuild used by imports, transfers and repairs
+class TestBulkRecalculation(TestCase):
+    def setUp(self):
+        self.professor = init_prof()
+        self.class_obj = init_class(self.professor)
+        self.students = init_sample_students(self.class_obj, 3)
+        for student in self.students[:2]:
+            StudentRating.objects.create(student_key=student, score=4)
+            StudentRating.objects.create(student_key=student, score=2)
+            StudentRating.objects.create(student_key=student, score=0, attendance=False)
+        # drifted counters that should be reset by the rebuild
+        Student.objects.filter(pk=self.students[2].pk).update(total_calls=7, total_score=12)
+
+    def test_recalculate_class(self):
+        self.assertEqual(3, self.class_obj.student_set.recalculate_counters())
+        for student in self.students[:2]:
+            student.refresh_from_db()
+            self.assertEqual(3, student.total_calls)
+            self.assertEqual(1, student.absent_calls)
+            self.assertEqual(6, student.total_score)
+            self.assertEqual(3.0, student.average_score)
+        self.students[2].refresh_from_db()
+        self.assertEqual(0, self.students[2].total_calls)
+        self.assertEqual(0, self.students[2].total_score)
+
+    def test_recalculate_query_count(self):
+        # class lookup, counter and average updates, then three queries to refresh the class totals
+        with self.assertNumQueries(6):
+            Student.objects.filter(class_key=self.class_obj).recalculate_counters()
+
+    def test_transfer_rebuilds_counters(self):
+        other_class = Class.objects.create(professor_key=self.professor, class_name="Other")
+        self.client.force_login(self.professor)
+        student = self.students[0]
+        self.client.post(reverse('edit_student', args=[student.pk]), {
+            'usc_id': student.usc_id, 'first_name': student.first_name, 'last_name': student.last_name,
+            'class_key': other_class.pk, 'seating': 'NA', 'email': 'a@example.com',
+        })
+        student.refresh_from_db()
+        self.assertEqual(other_class, student.class_key)
+        self.assertEqual(3, student.total_calls)
+        self.assertFalse(StudentRating.objects.filter(student_key=student).exclude(class_key=other_class).exists())
+
+# tests for the streaming, batched roster import
+class TestStreamingStudentImport(TestCase):
+    def setUp(self):
+        self.professor = init_prof()
+        self.class_obj = init_class(self.professor)
+        self.client.force_login(self.professor)
+
+    def upload(self, content, chunk_size=None):
+        csv_file = SimpleUploadedFile("students.csv", content.encode('utf-8'), content_type="text/csv")
+        if chunk_size:
+            csv_file.DEFAULT_CHUNK_SIZE = chunk_size
+        return self.client.post(reverse('add_student_import_with_id', args=[self.class_obj.id]), {
+            'class_id': self.class_obj.id,
+            'students': csv_file
+        }, follow=True)
+
+    def test_quoted_fields_across_chunks(self):
+        content = 'usc_id,email,first_name,last_name,seating\n1,a@example.com,"Smith, Jr.",Ann,FR\n2,b@example.com,Bo,"O\'Neil",Back Left\n'
+        self.upload(content, chunk_size=7)
+        self.assertEqual("Smith, Jr.", Student.objects.get(usc_id="1").first_name)
+        self.assertEqual("BL", Student.objects.get(usc_id="2").seating)
+
+    def test_duplicate_rows_last_wins(self):
+        content = "1,a@example.com,First,Ann\n2,b@example.com,Bo,Bee\n1,a@example.com,Second,Ann\n"
+        self.upload(content)
+        self.assertEqual(2, self.class_obj.student_set.count())
+        self.assertEqual("Second", Student.objects.get(usc_id="1").first_name)
+
+    def test_batches_and_class_totals(self):
+        rows = [[str(i), f"s{i}@example.com", f"First{i}", f"Last{i}", "NA", "4", "1", "6"] for i in range(1, 26)]
+        batches = []
+        result = import_students(rows, self.class_obj, batch_size=10, progress=lambda r: batches.append(r.imported))
+        self.assertEqual([10, 20, 25], batches)
+        self.assertEqual(25, result.imported)
+        self.assertEqual(25, self.class_obj.total_students())
+        student = Student.objects.get(usc_id="7")
+        self.assertEqual(2.0, student.average_score)
+        self.assertEqual(100, self.class_obj.get_stats().rating_count)
+
+    def test_same_usc_id_other_class_is_separate(self):
+        other_class = Class.objects.create(professor_key=self.professor, class_name="Other")
+        Student.objects.create(class_key=other_class, first_name="Other", last_name="Student", usc_id="1")
+        self.upload("1,a@example.com,New,Student\n")
+        self.assertEqual("Other", Student.objects.get(class_key=other_class, usc_id="1").first_name)
+        self.assertEqual("New", Student.objects.get(class_key=self.class_obj, usc_id="1").first_name)
+
+    def test_manual_duplicate_rejected(self):
+        Student.objects.create(class_key=self.class_obj, first_name="A", last_name="B", usc_id="X1")
+        response = self.client.post(reverse('add_student_manual', args=[self.class_obj.id]), {
+            'usc_id': 'X1', 'first_name': 'C', 'last_name': 'D', 'class_key': self.class_obj.id, 'seating': 'NA', 'email': 'c@example.com',
+        })
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, self.class_obj.student_set.count())
+
+class TestRatingImport(TestCase):
+    def setUp(self):
+        self.professor = init_prof()
+        self.class_obj = init_class(self.professor)
+        self.student = Student.objects.create(class_key=self.class_obj, first_name="Ann", last_name="Lee", usc_id="1")
+        self.client.force_login(self.professor)
+
+    def upload(self, content):
+        return self.client.post(reverse('add_student_import_with_id', args=[self.class_obj.id]), {
+            'class_id': self.class_obj.id,
+            'students': SimpleUploadedFile("students.csv", b"1,a@example.com,Ann,Lee\n", content_type="text/csv"),
+            'ratings': SimpleUploadedFile("ratings.csv", content.encode('utf-8'), content_type="text/csv"),
+        }, follow=True)
+
+    def test_reimport_updates_instead_of_duplicating(self):
+        content = "usc_id,date,attendance,prepared,score\n1,2025-04-02 15:00,TRUE,TRUE,3\n1,2025-04-03 15:00,TRUE,TRUE,4\n"
+        self.upload(content)
+        response = self.upload(content.replace(",3\n", ",5\n") + "1,2025-04-04 15:00,FALSE,TRUE,0\n")
+        self.assertEqual(3, StudentRating.objects.count())
+        messages = [str(message) for message in get_messages(response.wsgi_request)]
+        self.assertIn("Imported 1 new and updated 2 existing ratings.", messages)
+        self.student.refresh_from_db()
+        self.assertEqual((3, 1, 9, 4.5), (self.student.total_calls, self.student.absent_calls, self.student.total_score, self.student.average_score))
+
+    def test_batches_report_counts(self):
+        rows = [["1", f"2025-04-{day:02d}T10:00:00Z", "TRUE", "TRUE", "2"] for day in range(1, 26)]
+        result = import_ratings(rows, self.class_obj, batch_size=10)
+        self.assertEqual((25, 0), (result.inserted, result.updated))
+        result = import_ratings(rows[:12], self.class_obj, batch_size=10)
+        self.assertEqual((0, 12), (result.inserted, result.updated))
+        self.assertEqual(25, self.class_obj.get_stats().rating_count)
+
+    def test_only_students_of_the_class_are_rated(self):
+        other_class = Class.objects.create(professor_key=User.objects.create_user(username="other", password=PROF_PASSWORD), class_name="Other")
+        other_student = Student.objects.create(class_key=other_class, first_name="Other", last_name="Student", usc_id="1")
+        self.upload("1,2025-04-02 15:00,TRUE,TRUE,3\n")
+        self.assertEqual(1, self.student.studentrating_set.count())
+        self.assertFalse(other_student.studentrating_set.exists())
+
+    def test_rating_per_student_date_is_unique(self):
+        date = timezone.now()
+        self.student.add_rating(3, in_date=date)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            StudentRating.objects.create(student_key=self.student, class_key=self.class_obj, date=date, attendance=True, prepared=True, score=1)
+
+class TestBackgroundImport(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(BACKGROUND_IMPORTS=True, MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.professor = init_prof()
+        self.class_obj = init_class(self.professor)
+        self.client.force_login(self.professor)
+
+    def upload(self, students, ratings=None):
+        data = {'class_id': self.class_obj.id, 'students': SimpleUploadedFile("students.csv", students.encode('utf-8'), content_type="text/csv")}
+        if ratings:
+            data['ratings'] = SimpleUploadedFile("ratings.csv", ratings.encode('utf-8'), content_type="text/csv")
+        return self.client.post(reverse('add_student_import_with_id', args=[self.class_obj.id]), data)
+
+    def test_upload_is_queued_then_imported(self):
+        response = self.upload("1,a@example.com,Ann,Lee\n2,b@example.com,Bo,Bee\n", "1,2025-04-02 15:00,TRUE,TRUE,4\n")
+        job = ImportJob.objects.get()
+        self.assertRedirects(response, f"{reverse('add_student_import_with_id', args=[self.class_obj.id])}?job={job.id}")
+        self.assertEqual(ImportJob.PENDING, job.status)
+        self.assertEqual(0, self.class_obj.student_set.count())
+
+        call_command('run_import_worker', '--once', '--workers', '1', stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual(ImportJob.DONE, job.status)
+        self.assertEqual((3, 2, 1, 0), (job.rows_processed, job.students_imported, job.ratings_inserted, job.ratings_updated))
+        self.assertEqual(4, Student.objects.get(usc_id="1").total_score)
+        self.assertFalse(job.student_file)
+
+        data = self.client.get(reverse('import_job_status', args=[job.id])).json()
+        self.assertTrue(data['job']['finished'])
+        self.assertEqual(3, data['job']['rows_processed'])
+
+    def test_status_of_other_professor(self):
+        self.upload("1,a@example.com,Ann,Lee\n")
+        other = User.objects.create_user(username="other", password=PROF_PASSWORD)
+        self.client.force_login(other)
+        response = self.client.get(reverse('import_job_status', args=[ImportJob.objects.get().id]))
+        self.assertEqual(404, response.status_code)
+
+    def test_failed_job_and_requeue(self):
+        self.upload("1,a@example.com,Ann,Lee\n", "1,2025-04-02 15:00,TRUE,TRUE,4\n")
+        job = ImportJob.objects.get()
+        rating_file = job.rating_file.name
+        job.student_file.storage.delete(job.student_file.name)
+        self.assertEqual(1, drain_jobs())
+        job.refresh_from_db()
+        self.assertEqual(ImportJob.FAILED, job.status)
+        self.assertTrue(job.errors[0].startswith("Error:"))
+        # the uploads aren't kept after a failure either
+        self.assertFalse(job.rating_file)
+        self.assertFalse(job.rating_file.storage.exists(rating_file))
+
+        ImportJob.objects.filter(pk=job.pk).update(status=ImportJob.RUNNING)
+        self.assertEqual(1, requeue_stale_jobs())
+        self.assertEqual(ImportJob.PENDING, ImportJob.objects.get(pk=job.pk).status)
+
+class TestExcelImport(TestCase):
+    def setUp(self):
+        self.professor = init_prof()
+        self.class_obj = init_class(self.professor)
+        self.client.force_login(self.professor)
+
+    def xlsx(self, name, rows):
+        workbook = Workbook()
+        for row in rows:
+            workbook.active.append(row)
+        output = io.BytesIO()
+        workbook.save(output)
+        return SimpleUploadedFile(name, output.getvalue())
+
+    def test_typed_cells_read_as_text(self):
+        upload = self.xlsx("ratings.xlsx", [[123456789, datetime.datetime(2025, 4, 2, 15, 0), True, False, 4.0]])
+        self.assertEqual([["123456789", "2025-04-02T15:00:00", "TRUE", "FALSE", "4"]], list(read_xlsx_rows(upload)))
+
+    def test_import_students_and_ratings(self):
+        self.client.post(reverse('add_student_import_with_id', args=[self.class_obj.id]), {
+            'class_id': self.class_obj.id,
+            'students': self.xlsx("students.xlsx", [STUDENT_COLUMNS[:5], [123456789, "a@example.com", "Ann", "Lee", "Front Left"]]),
+            'ratings': self.xlsx("ratings.xlsx", [[123456789, datetime.datetime(2025, 4, 2, 15, 0), True, True, 5]]),
+        })
+        student = Student.objects.get(class_key=self.class_obj, usc_id="123456789")
+        self.assertEqual("FL", student.seating)
+        self.assertEqual((1, 5), (student.total_calls, student.total_score))
+
+# keeps the export cache in a directory removed after the test
+def use_temporary_export_cache(test_case):
+    cache_dir = tempfile.TemporaryDirectory()
+    test_case.addCleanup(cache_dir.cleanup)
+    settings = override_settings(EXPORT_CACHE_DIR=cache_dir.name)
+    settings.enable()
+    test_case.addCleanup(settings.disable)
+
+class TestClassExport(TestCase):
+    def setUp(self):
+        use_temporary_export_cache(self)
+        self.professor = init_prof()
+        self.class_obj = init_class(self.professor)
+        self.students = init_sample_students(self.class_obj, 3)
+        self.client.force_login(self.professor)
+
+    def export(self, export_type, file_format='csv', class_ids=None):
+        return self.client.post(reverse('export_class_file'), {
+            'class_id': class_ids or [self.class_obj.id], 'export_type': export_type, 'file_format': file_format,
+        })
+
+    def read_csv(self, response):
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+
+    def test_student_export_is_streamed(self):
+        response = self.export('simple')
+        self.assertTrue(response.streaming)
+        rows = self.read_csv(response)
+        self.assertEqual(STUDENT_COLUMNS, rows[0])
+        self.assertEqual(['0', '', 'First0', 'Last0', 'NA', '0', '0', '0', str(self.class_obj.id)], rows[1])
+        self.assertEqual(4, len(rows))
+
+    def test_rating_export(self):
+        date = datetime.datetime(2025, 4, 2, 15, tzinfo=datetime.timezone.utc)
+        self.students[1].add_rating(4, in_date=date)
+        self.students[1].add_rating(0, is_present=False, in_date=date + datetime.timedelta(days=1))
+        rows = self.read_csv(self.export('ratings', 'txt'))
+        self.assertEqual([
+            ['usc_id', 'date', 'attendance', 'prepared', 'score', 'class_id'],
+            ['1', '2025-04-02T15:00:00+00:00', 'True', 'True', '4', str(self.class_obj.id)],
+            ['1', '2025-04-03T15:00:00+00:00', 'False', 'True', '0', str(self.class_obj.id)],
+        ], rows)
+
+    def test_excel_export(self):
+        self.students[0].add_rating(5)
+        response = self.export('ratings', 'excel')
+        self.assertTrue(response.streaming)
+        self.assertIn('_ratings.xlsx', response['Content-Disposition'])
+        rows = list(read_xlsx_rows(io.BytesIO(b''.join(response.streaming_content))))
+        self.assertEqual(RATING_COLUMNS, rows[0])
+        self.assertEqual(['0', 'TRUE', 'TRUE', '5'], [rows[1][0]] + rows[1][2:5])
+
+    def test_sample_files_use_import_columns(self):
+        for export_type, columns in ((1, STUDENT_COLUMNS), (2, RATING_COLUMNS)):
+            response = self.client.post(reverse('export_sample_file', args=[self.class_obj.id, export_type]))
+            rows = list(csv.reader(io.StringIO(response.content.decode('utf-8'))))
+            self.assertEqual(columns, rows[0])
+
+    @override_settings(EXPORT_WORKERS=1)
+    def test_multi_class_zip(self):
+        other_class = Class.objects.create(professor_key=self.professor, class_name="Other")
+        init_sample_students(other_class, 1)
+        response = self.export('simple', class_ids=[self.class_obj.id, other_class.id])
+        self.assertTrue(response.streaming)
+        with ZipFile(io.BytesIO(b''.join(response.streaming_content))) as zip_file:
+            names = zip_file.namelist()
+            self.assertEqual(2, len(names))
+            self.assertTrue(names[1].startswith("Other_"))
+            self.assertEqual(2, len(zip_file.read(names[1]).decode('utf-8').splitlines()))
+
+    def test_multi_class_zip_of_other_professor(self):
+        other = User.objects.create_user(username="other", password=PROF_PASSWORD)
+        other_class = Class.objects.create(professor_key=other, class_name="Other")
+        response = self.export('simple', class_ids=[self.class_obj.id, other_class.id])
+        self.assertFalse(response.streaming)
+        self.assertEqual(200, response.status_code)
+
+    def test_query_count_does_not_grow(self):
+        for student in self.students:
+            student.add_rating(3)
+            student.add_rating(5)
+        # session and user, the class and its stats, then the ratings in one query
+        with self.assertNumQueries(5):
+            self.read_csv(self.export('ratings'))
+
+    def test_repeat_export_served_from_cache(self):
+        self.students[0].add_rating(3)
+        first = self.read_csv(self.export('ratings'))
+        # no ratings query the second time
+        with self.assertNumQueries(4):
+            response = self.export('ratings')
+            self.assertEqual(first, self.read_csv(response))
+
+        self.students[1].add_rating(4)
+        self.assertEqual(3, len(self.read_csv(self.export('ratings'))))
+
+    def test_conditional_get(self):
+        url = reverse('export_class_file_with_id', args=[self.class_obj.id])
+        response = self.client.get(url, {'export_type': 'ratings', 'file_format': 'excel'})
+        self.assertEqual(200, response.status_code)
+        etag = response['ETag']
+        b''.join(response.streaming_content)
+
+        response = self.client.get(url, {'export_type': 'ratings', 'file_format': 'excel'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        response = self.client.get(url, {'export_type': 'ratings', 'file_format': 'excel'}, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(304, response.status_code)
+
+        # an absent rating's score doesn't move any counter but is part of the export
+        rating = self.students[0].add_rating(0, is_present=False)
+        etag = self.client.get(url, {'export_type': 'ratings', 'file_format': 'excel'})['ETag']
+        self.students[0].update_rating(rating, 3, is_present=False)
+        response = self.client.get(url, {'export_type': 'ratings', 'file_format': 'excel'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+
+    def test_incremental_export(self):
+        url = reverse('export_class_file_with_id', args=[self.class_obj.id])
+        now = timezone.now()
+        old = self.students[0].add_rating(2)
+        changed = self.students[1].add_rating(4)
+        # changes inside the lag window are left for the next export
+        recent = self.students[2].add_rating(5)
+        StudentRating.objects.filter(pk=old.pk).update(modified=now - datetime.timedelta(hours=2))
+        StudentRating.objects.filter(pk=changed.pk).update(modified=now - datetime.timedelta(minutes=5))
+
+        response = self.client.get(url, {'since': (now - datetime.timedelta(hours=1)).isoformat()})
+        rows = self.read_csv(response)
+        self.assertEqual(RATING_COLUMNS, rows[0])
+        self.assertEqual([['1', '4']], [[row[0], row[4]] for row in rows[1:]])
+
+        cursor = response['X-Export-Cursor']
+        response = self.client.get(url, {'cursor': cursor})
+        self.assertEqual(1, len(self.read_csv(response)))
+        self.assertEqual(cursor, response['X-Export-Cursor'])
+
+        StudentRating.objects.filter(pk__in=[old.pk, recent.pk]).update(modified=now - datetime.timedelta(minutes=2))
+        rows = self.read_csv(self.client.get(url, {'cursor': cursor}))
+        self.assertEqual(['0', '2'], sorted(row[0] for row in rows[1:]))
+
+    def test_incremental_export_legacy_rating(self):
+        url = reverse('export_class_file_with_id', args=[self.class_obj.id])
+        legacy = self.students[0].add_rating(3)
+        StudentRating.objects.filter(pk=legacy.pk).update(class_key=None, modified=timezone.now() - datetime.timedelta(minutes=5))
+        # migration 0027 gives ratings saved without a class their student's class
+        import_module('coldcall.migrations.0027_studentrating_modified').set_class_from_student(apps, None)
+        since = (timezone.now() - datetime.timedelta(hours=1)).isoformat()
+        rows = self.read_csv(self.client.get(url, {'since': since}))
+        self.assertEqual([['0', '3']], [[row[0], row[4]] for row in rows[1:]])
+
+    def test_incremental_export_bad_input(self):
+        url = reverse('export_class_file_with_id', args=[self.class_obj.id])
+        self.assertEqual(400, self.client.get(url, {'cursor': 'not-a-cursor'}).status_code)
+        self.assertEqual(400, self.client.get(url, {'since': 'yesterday'}).status_code)
+
+# pool threads need committed data, their connections can't see a TestCase transaction
+class TestParallelClassExport(TransactionTestCase):
+    def setUp(self):
+        use_temporary_export_cache(self)
+
+    def test_files_built_on_threads_stay_in_order(self):
+        professor = init_prof()
+        classes = [Class.objects.create(professor_key=professor, class_name=f"C{i}") for i in range(5)]
+        for i, class_obj in enumerate(classes):
+            init_sample_students(class_obj, i + 1)
+
+        files = iter_class_exports(classes, 'simple', 'csv', workers=3)
+        with ZipFile(io.BytesIO(b''.join(iter_zip(files)))) as zip_file:
+            names = zip_file.namelist()
+            self.assertEqual([f"C{i}_" for i in range(5)], [name[:3] for name in names])
+            self.assertEqual([i + 2 for i in range(5)], [len(zip_file.read(name).splitlines()) for name in names])
@@ -30,6 +30,7 @@ urlpatterns = [
     path('accounts/change_password/', views.ChangePasswordView.as_view(), name='password_change'),
     # Home
     path("",views.HomePageView.as_view(), name="home"),
+    path("students/table", views.StudentTableView.as_view(), name="student_table"),
     
     # Opening the specified class 
     path("<int:class_id>/", views.ClassHomePageView.as_view(), name="class_home"),
@@ -43,6 +44,7 @@ urlpatterns = [
     path("student/<int:student_id>/delete", views.StudentDeleteView.as_view(), name="student_delete"),
     path("student/<int:student_id>/drop", views.StudentDropView.as_view(), name="student_drop"),
     path('transfer_student/<int:student_id>/', views.StudentUpdateView.as_view(), name='transfer_student'),
+    path("students/search", views.StudentAutocompleteView.as_view(), name="student_autocomplete"),
 
     # Add class 
     path("addclass", views.AddClassView.as_view(), name="add_class"),
@@ -50,6 +52,7 @@ urlpatterns = [
     # Import From 
     path("addstudents/import", views.AddStudentImportView.as_view(), name="add_student_import"),
     path("addstudents/import/<int:class_id>", views.AddStudentImportView.as_view(), name="add_student_import_with_id"),
+    path("addstudents/import/jobs/<int:job_id>", views.ImportJobStatusView.as_view(), name="import_job_status"),
 
     # Export To File 
     path("exportclassfile", views.ExportClassFileView.as_view(), name="export_class_file"),
@@ -58,6 +61,8 @@ urlpatterns = [
 
     # Randomizer
     path("randomizer", views.StudentRandomizerView.as_view(), name="randomizer"),
+    path("randomizer/picks", views.StudentRandomizerPicksView.as_view(), name="randomizer_picks"),
+    path("randomizer/batch", views.StudentRandomizerBatchView.as_view(), name="randomizer_batch"),
     # Unsure URLS (Were already commented out)
     # path("class/<int:class_id>/details", views.ClassDetailsView.as_view(), name="class_details"),
     # path("student/<int:student_id>/update_score", views.StudentScoreUpdateView.as_view(), name="student_score_update"),
@@ -1,11 +1,11 @@
 #views to create, modify, and view student info
 from .views_class import AddClassView, ClassDetailsView, ClassHomePageView
 #views related to data management (i.e CSV import/export)
-from .views_data import AddStudentImportView, ExportClassFileView, ExportSampleFileView
+from .views_data import AddStudentImportView, ImportJobStatusView, ExportClassFileView, ExportSampleFileView
 #views for core functionality (i.e registration and homepage)
-from .views_main import CreateAccountView, LoginView, HomePageView, StudentRandomizerView, ProfileView, ChangePasswordView, DemoView
+from .views_main import CreateAccountView, LoginView, HomePageView, StudentTableView, StudentRandomizerView, StudentRandomizerPicksView, StudentRandomizerBatchView, ProfileView, ChangePasswordView, DemoView
 #views to create, modify, and view student info
-from .views_student import AddStudentManualView, EditStudentView, StudentMetricsView, StudentRatingEditView, StudentUpdateView, StudentDeleteView, StudentDropView, AddNoteView, DeleteNoteView
+from .views_student import AddStudentManualView, EditStudentView, StudentMetricsView, StudentRatingEditView, StudentUpdateView, StudentDeleteView, StudentDropView, StudentAutocompleteView, AddNoteView, DeleteNoteView
 from .views_manage_classes import ManageClassesView
 from .views_class import EditClassView
 
@@ -1,4 +1,6 @@
 # helper functions used in creation of each view
+from ..importers import RATING_COLUMNS, STUDENT_COLUMNS
+
 BASE_TEMPLATE_DIR = "coldcall/"
 MOBILE_TEMPLATE_DIR = "mobile/"
 def get_template_dir(in_str, mobile):
@@ -10,8 +12,8 @@ def get_template_dir(in_str, mobile):
 def get_demo_dir():
     return BASE_TEMPLATE_DIR + "demo/demo.html"
     
-#ExportClassFileView constants
-STUDENT_ATTRIBUTES = ['usc_id', 'email', 'first_name', 'last_name', 'seating', 'total_calls', 'absent_calls', 'total_score', 'class_id']
-RATING_ATTRIBUTES = ['usc_id', 'date', 'attendance', 'prepared', 'score', 'class_id']
+#ExportClassFileView constants, the same headers the importers read
+STUDENT_ATTRIBUTES = STUDENT_COLUMNS
+RATING_ATTRIBUTES = RATING_COLUMNS
 SAMPLE_STUDENT = ['B12345678', "sample@example.com", "John", "Doe", "FR", '0', '0', '0']
 SAMPLE_RATING = ['B12345678', 'April 2nd, 2025 3PM', 'TRUE', 'TRUE', '5']
\ No newline at end of file
@@ -50,12 +50,18 @@ class ClassDetailsView(View):
     def get(self, request, class_id):
         try:
             working_class = Class.objects.get(id=class_id, professor_key=request.user)
-            students = working_class.student_set.all()
+            stats = working_class.get_stats()
+            students = working_class.student_set.values('id', 'first_name', 'last_name', 'total_score')
             return JsonResponse({
                 "class_name": working_class.class_name,
                 "is_active": working_class.is_active(),
-                "total_students": working_class.total_students(),
-                "students": [{"id": s.id, "name": str(s), "score": s.total_score} for s in students],
+                "total_students": stats.student_count,
+                "active_students": stats.active_count,
+                "total_ratings": stats.rating_count,
+                "mean_score": stats.mean_score(),
+                "attendance_rate": stats.attendance_rate(),
+                "last_activity": stats.last_activity,
+                "students": [{"id": s["id"], "name": f"{s['first_name']} {s['last_name']}", "score": s["total_score"]} for s in students],
             })
         except Class.DoesNotExist:
             return JsonResponse({"error": "Class not found or unauthorized"}, status=404)
@@ -1,25 +1,28 @@
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db import transaction
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from django.utils.timezone import is_naive, make_aware
 from django.views import View
 from django.views.generic import TemplateView
 
-from django.utils.timezone import is_aware
-from datetime import datetime, timezone
-from dateutil.parser import parse
+from datetime import datetime
 
 from .view_helper import get_template_dir, STUDENT_ATTRIBUTES, RATING_ATTRIBUTES, SAMPLE_STUDENT, SAMPLE_RATING
-from ..models import Class, Student, StudentRating
+from ..exports import (CONTENT_TYPES, cached_export_path, changed_ratings, decode_export_cursor, export_cache_path, export_etag, export_filename,
+                       iter_class_exports, iter_csv, iter_csv_to_cache, iter_rating_rows, iter_zip, xlsx_tempfile)
+from ..importers import IMPORT_EXTENSIONS, import_ratings, import_students, read_rows
+from ..models import Class, ImportJob
 
 import csv
-import io
-from zipfile import ZipFile
+import os
 
-from openpyxl import Workbook
-
-#Adds a list of students to a given class using a user provided .csv file
+#Adds a list of students to a given class using a user provided .csv or .xlsx file
 class AddStudentImportView(LoginRequiredMixin, TemplateView):
 
     def get(self, request, class_id=None): 
@@ -28,8 +31,11 @@ class AddStudentImportView(LoginRequiredMixin, TemplateView):
             selected_class = Class.objects.get(id=class_id)
         else: 
             selected_class = None
-        classes = Class.objects.filter(professor_key = request.user, is_archived=False)
-        return render(request, self.template_name, {'classes': classes, 'selected_class': selected_class})
+        classes = Class.for_professor(request.user, archived=False)
+        # a queued import the page should poll for progress
+        job_id = request.GET.get('job', '')
+        job = ImportJob.objects.filter(id=job_id, professor_key=request.user).first() if job_id.isdigit() else None
+        return render(request, self.template_name, {'classes': classes, 'selected_class': selected_class, 'job': job})
     
     def post(self, request, class_id=None):
         self.template_name = get_template_dir("add_student_import", request.is_mobile) 
@@ -38,186 +44,141 @@ class AddStudentImportView(LoginRequiredMixin, TemplateView):
         rating_file = request.FILES.get("ratings")
         
         if not student_file:
-            messages.error(request, "No student file uploaded. Please select a CSV file.")
-            return render(request, self.template_name, {'classes': Class.objects.filter(professor_key=request.user), 'selected_class': None})
+            messages.error(request, "No student file uploaded. Please select a CSV or Excel file.")
+            return render(request, self.template_name, {'classes': Class.for_professor(request.user), 'selected_class': None})
         
-        # Check if the file type is csv
-        if not student_file.name.endswith('.csv'):
-            messages.error(request, "Invalid file type. Please select a CSV file.")
-            return render(request, self.template_name, {'classes': Class.objects.filter(professor_key=request.user), 'selected_class': selected_class})
+        # Check if the file type is csv or xlsx
+        if not student_file.name.lower().endswith(IMPORT_EXTENSIONS):
+            messages.error(request, "Invalid file type. Please select a CSV or Excel file.")
+            return render(request, self.template_name, {'classes': Class.for_professor(request.user), 'selected_class': None})
                 
         try:
-            selected_class = Class.objects.get(id=class_id)
+            selected_class = Class.objects.get(id=class_id, professor_key=request.user)
         except Class.DoesNotExist:
             messages.error(request, "Invalid class ID. Please select a valid class for student import.")
-            return render(request, self.template_name, {'classes': Class.objects.filter(professor_key=request.user), 'selected_class': None})
+            return render(request, self.template_name, {'classes': Class.for_professor(request.user), 'selected_class': None})
+
+        # large files would outlast the request, hand them to the import worker and let the page poll for progress
+        if settings.BACKGROUND_IMPORTS:
+            if rating_file and not rating_file.name.lower().endswith(IMPORT_EXTENSIONS):
+                messages.error(request, "Invalid rating file type. Please select a CSV or Excel file.")
+                return render(request, self.template_name, {'classes': Class.for_professor(request.user), 'selected_class': selected_class})
+            job = ImportJob.objects.create(professor_key=request.user, class_key=selected_class, student_file=student_file, rating_file=rating_file)
+            messages.info(request, "Your import has been queued.")
+            return redirect(f"{reverse('add_student_import_with_id', args=[selected_class.id])}?job={job.id}")
 
         try:
-            decoded_file = student_file.read().decode('utf-8').splitlines()
-            
+            # rows are decoded and written in batches as the file is read
+            result = import_students(read_rows(student_file), selected_class)
+
             # Skip empty files
-            if not decoded_file:
+            if not result.rows:
                 messages.error(request, "The uploaded file is empty.")
-                return render(request, self.template_name, {'classes': Class.objects.filter(professor_key=request.user), 'selected_class': selected_class})
-            
-            # Check if first row is header row
-            is_header_row = False
-            if decoded_file[0].lower().startswith('usc_id') or 'first_name' in decoded_file[0].lower():
-                is_header_row = True
-            
-            # Simple CSV parsing approach
-            rows_to_process = []
-            expected_headers = ['usc_id', 'email', 'first_name', 'last_name', 'seating', 
-                              'total_calls', 'absent_calls', 'total_score', 'class_id']
-            
-            for i, row in enumerate(decoded_file):
-                # Skip header row
-                if i == 0 and is_header_row:
-                    continue
-                
-                if not row.strip():
-                    continue
-                
-                # Add row to processing list
-                rows_to_process.append(row)
-            
-            # Reading CSV file & gathering student information 
-            successful_imports = 0
-            
-            for row in rows_to_process:
-                # Split the CSV row
-                values = row.split(',')
-                
-                # Create a dict with field names
-                row_data = {}
-                for i, value in enumerate(values):
-                    if i < len(expected_headers):
-                        row_data[expected_headers[i]] = value.strip()
-                    else:
-                        break
-                
-                # Extract fields with defaults
-                usc_id = row_data.get('usc_id', '')
-                email = row_data.get('email', '')
-                first_name = row_data.get('first_name', '')
-                last_name = row_data.get('last_name', '')
-                seating = row_data.get('seating', 'NA')
-                total_calls = row_data.get('total_calls', '0')
-                absent_calls = row_data.get('absent_calls', '0')
-                total_score = row_data.get('total_score', '0')
-                
-                # Skip rows that don't have the required fields
-                if not usc_id or not email or not first_name or not last_name:
-                    continue
-                
-                # Also skip if this looks like a header row
-                if usc_id.lower() == 'usc_id' or 'first_name' in usc_id.lower():
-                    continue
-                
-                try:
-                    # Create or update the student
-                    Student.objects.update_or_create(
-                        usc_id=usc_id,
-                        class_key=selected_class,
-                        defaults={
-                            'email': email, 
-                            'first_name': first_name, 
-                            'last_name': last_name,
-                            'class_key': selected_class,
-                            'seating': seating if seating in ['FR', "Front Right", 'FM', "Front Middle", 'FL', "Front Left", 'BR', "Back Right", 'BM', "Back Middle", 'BL', "Back Left", 'NA', "None"] else 'NA',
-                            'total_calls': int(total_calls) if total_calls.isdigit() else 0,
-                            'absent_calls': int(absent_calls) if absent_calls.isdigit() else 0,
-                            'total_score': int(total_score) if total_score.isdigit() else 0
-                        }
-                    )
-                    successful_imports += 1
-                except Exception as e:
-                    # Log the error but continue with other students
-                    messages.warning(request, f"Error importing student {usc_id}: {str(e)}")
-                    continue
+                return render(request, self.template_name, {'classes': Class.for_professor(request.user), 'selected_class': selected_class})
+
+            for warning in result.warnings:
+                messages.warning(request, warning)
 
-            if successful_imports > 0:
-                messages.success(request, f"Successfully imported {successful_imports} students.")
+            if result.imported > 0:
+                messages.success(request, f"Successfully imported {result.imported} students.")
             else:
                 messages.warning(request, "No students were imported. Please check your file format.")
 
         except Exception as e:
             messages.error(request, f"Error: {str(e)}")
-            return render(request, self.template_name, {'classes': Class.objects.filter(professor_key=request.user), 'selected_class': selected_class})
+            return render(request, self.template_name, {'classes': Class.for_professor(request.user), 'selected_class': selected_class})
 
         # Handle rating import if file is present    
         if rating_file:
-            if not rating_file.name.endswith('.csv'):
-                messages.error(request, "Invalid rating file type. Please select a CSV file.")
+            if not rating_file.name.lower().endswith(IMPORT_EXTENSIONS):
+                messages.error(request, "Invalid rating file type. Please select a CSV or Excel file.")
                 return redirect('/')
                 
             try:
-                decoded_file = rating_file.read().decode('utf-8').splitlines()
-                reader = csv.DictReader(decoded_file)
-
-                rows = []
-                student_ids = set()        
-
-                for row in reader:
-                    usc_id = row.get('usc_id', '').strip()
-                    date = row.get('date', '').strip()
-                    #ensure valid data is present for key, skip otherwise
-                    if not usc_id or not date:
-                        continue
-                    rows.append(row)
-                    student_ids.add(usc_id)
-                #bulk grab students using SQL IN search
-                students = {
-                    student.usc_id: student for student in Student.objects.filter(usc_id__in=student_ids)
-                }
-                #use new set to store student references rather than ids
-                updated_students = set()
-                #combine each query into one all-or-nothing query
-                with transaction.atomic():
-                    for row in rows:
-                        usc_id = row.get('usc_id', '').strip()
-                        date = row.get('date', '').strip()
-                        attendance = row.get('attendance', "TRUE").strip().upper()
-                        prepared = row.get('prepared', "FALSE").strip().upper()
-                        score = row.get('score', '0').strip()
-
-                        try:
-                            date = parse(date)
-                            if not date.tzinfo:
-                                date = date.replace(tzinfo=timezone.utc)
-                        except Exception:
-                            continue
-
-                        #grab student from existing set
-                        student = students.get(usc_id)
-                        if not student:
-                            continue
-
-                        StudentRating.objects.update_or_create(
-                            student_key = student,
-                            date = date,
-                            defaults={
-                                'attendance': attendance == "TRUE",
-                                'prepared': prepared == "TRUE",
-                                'score': int(score) if score.isdigit() else 0
-                            }
-                        )
-
-                        updated_students.add(student)
-
-                with transaction.atomic():
-                    for student in updated_students:
-                        student.recalculate_all()
+                result = import_ratings(read_rows(rating_file), selected_class)
+                if result.imported:
+                    messages.success(request, f"Imported {result.inserted} new and updated {result.updated} existing ratings.")
             except Exception as e:
                 messages.error(request, f"Error importing ratings: {str(e)}")
                 
         return redirect('/')
 
-class ExportClassFileView(View):
+# progress of a queued import, polled by the import page
+class ImportJobStatusView(LoginRequiredMixin, View):
+    def get(self, request, job_id):
+        try:
+            job = ImportJob.objects.get(id=job_id, professor_key=request.user)
+        except ImportJob.DoesNotExist:
+            return JsonResponse({"success": False, "error": "Import not found or unauthorized"}, status=404)
+        return JsonResponse({"success": True, "job": job.as_dict()})
+
+class ExportClassFileView(LoginRequiredMixin, View):
     def get(self, request, class_id=None):
         self.template_name = get_template_dir("export_class_file", request.is_mobile)
-        classes = Class.objects.filter(professor_key=request.user)
+        # a single class export can be downloaded with GET, so repeat downloads can be answered with 304,
+        # since or cursor ask for the ratings changed after a previous sync
+        if class_id and any(request.GET.get(key) for key in ('export_type', 'since', 'cursor')):
+            try:
+                class_obj = Class.objects.get(id=class_id, professor_key=request.user)
+            except Class.DoesNotExist:
+                raise Http404("Class not found")
+            file_format = request.GET.get('file_format', 'csv')
+            if request.GET.get('since') or request.GET.get('cursor'):
+                return self.export_changes(request, class_obj, file_format)
+            return self.export_class(request, class_obj, request.GET['export_type'], file_format)
+
+        classes = Class.for_professor(request.user)
         return render(request, self.template_name, {'classes': classes, 'class_id': class_id})
+
+    # serves one class's export from the export cache, built again only when the class has changed since
+    def export_class(self, request, class_obj, export_type, file_format):
+        stats = class_obj.get_stats()
+        etag = export_etag(class_obj.pk, export_type, file_format, stats.version)
+        last_modified = int(stats.changed_at.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            content_type = CONTENT_TYPES.get(file_format, 'text/csv')
+            filename = export_filename(class_obj, export_type, file_format)
+            path = export_cache_path(class_obj.pk, export_type, file_format, stats.version)
+            # a missing CSV/txt is streamed as the rows are read and saved on the way, Excel is written to the cache first
+            if file_format in ['csv', 'txt'] and not os.path.exists(path):
+                response = StreamingHttpResponse(iter_csv_to_cache(class_obj, export_type, file_format, stats.version), content_type=content_type)
+                response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            else:
+                path = cached_export_path(class_obj, export_type, file_format, stats.version)
+                response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type=content_type)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    # ratings created or changed since a timestamp or the cursor of the previous call, for gradebook syncs.
+    # The cursor to send next time is returned in the X-Export-Cursor header.
+    def export_changes(self, request, class_obj, file_format):
+        try:
+            if request.GET.get('cursor'):
+                since, after_pk = decode_export_cursor(request.GET['cursor'])
+            else:
+                since, after_pk = parse_datetime(request.GET.get('since', '')), None
+                if since is None:
+                    raise ValueError("since must be an ISO 8601 timestamp.")
+                if is_naive(since):
+                    since = make_aware(since)
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+        ratings, cursor = changed_ratings(class_obj, since, after_pk)
+        rows = iter_rating_rows(class_obj, ratings)
+        content_type = CONTENT_TYPES.get(file_format, 'text/csv')
+        filename = export_filename(class_obj, "ratings", file_format)
+        if file_format == 'excel':
+            response = FileResponse(xlsx_tempfile(rows), as_attachment=True, filename=filename, content_type=content_type)
+        else:
+            response = StreamingHttpResponse(iter_csv(rows), content_type=content_type)
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['X-Export-Cursor'] = cursor
+        patch_cache_control(response, private=True, no_store=True)
+        return response
     
     def post(self, request, class_id=None):
         self.template_name = get_template_dir("export_class_file", request.is_mobile)
@@ -227,95 +188,28 @@ class ExportClassFileView(View):
 
         if not class_ids or not export_type:
             messages.error(request, "No class ID provided.")
-            return render(request, self.template_name, {'classes': Class.objects.filter(professor_key=request.user), 'class_id': class_id})
+            return render(request, self.template_name, {'classes': Class.for_professor(request.user), 'class_id': class_id})
         
         try:
-            content_types = {
-                'csv': 'text/csv',
-                'txt': 'text/plain',
-                'excel': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            }
-            extensions = {'csv': '.csv', 'txt': '.txt', 'excel': '.xlsx'}
-            content_type = content_types.get(file_format, 'text/csv')
-            extension = extensions.get(file_format, '.csv')
-
-            def format_iso_date(date):
-                if isinstance(date, datetime):
-                    if is_aware(date):
-                        return date.isoformat()
-                    return date.replace(tzinfo=None).isoformat
-                return date
-
-        
-            # Generates the rows for the given class
-            # Simple only exports a list of student attributes, otherwise export student ratings
-            def generate_file(class_obj):
-                rows = [STUDENT_ATTRIBUTES] if export_type == "simple" else [RATING_ATTRIBUTES]
-                for student in class_obj.student_set.all():
-                    if export_type == "simple":
-                        rows.append(student.get_data_list())
-                    else:
-                        for rating in student.studentrating_set.all():
-                            rows.append([student.usc_id, 
-                                         format_iso_date(rating.date), 
-                                         rating.attendance, rating.prepared, rating.score, student.class_key.pk])
-
-                return rows
-        
-            
-            response = HttpResponse(content_type=content_type)
             #export a single file, not to zip
             if len(class_ids) == 1:
                 class_obj = Class.objects.get(id=class_ids[0], professor_key=request.user)
-                filename = f"{class_obj.class_name}_{datetime.now().strftime('%Y%m%d')}{"" if export_type == "simple" else "_ratings"}{extension}"
-                response['Content-Disposition'] = f'attachment; filename="{filename}"'
-
-                rows = generate_file(class_obj)
-                # CSV/txt and Excel require different writers
-                if file_format in ['csv', 'txt']:
-                    writer = csv.writer(response)
-                    writer.writerows(rows)
-                else:
-                    wb = Workbook() 
-                    ws = wb.active
-                    for row in rows:
-                        ws.append(row)
-                    wb.save(response)
-
-                return response
-            #iterate through each class id, create file, and add to .zip
-            zip_buffer = io.BytesIO()
-            with ZipFile(zip_buffer, 'w') as zip_file:
-                for class_id in class_ids:
-                    class_obj = Class.objects.get(id=class_id, professor_key=request.user)
-
-                    rows = generate_file(class_obj)
-
-                    if file_format in ['csv', 'txt']:
-                        output = io.StringIO()
-                        writer = csv.writer(output)
-                        writer.writerows(rows)
-                        content = output.getvalue()
-                    else: #Excel
-                        output = io.BytesIO()
-                        wb = Workbook()
-                        ws = wb.active
-                        for row in rows: 
-                            ws.append(row)
-                        wb.save(output)
-                        content = output.getvalue()
-
-                    timestamp = datetime.now().strftime('%Y%m%d')
-                    filename = f"{class_obj.class_name}_{timestamp}{"" if export_type == "simple" else "_ratings"}{extension}"
-                    zip_file.writestr(filename, content)
-
-            response = HttpResponse(zip_buffer.getvalue(), content_type='application/zip')
+                return self.export_class(request, class_obj, export_type, file_format)
+            #build each class's file on the export pool and stream them into one .zip
+            class_ids = list(dict.fromkeys(int(class_id) for class_id in class_ids))
+            classes = Class.objects.filter(professor_key=request.user).in_bulk(class_ids)
+            if len(classes) != len(class_ids):
+                raise Class.DoesNotExist("Class matching query does not exist.")
+            classes = [classes[class_id] for class_id in class_ids]
+
+            files = iter_class_exports(classes, export_type, file_format, workers=settings.EXPORT_WORKERS)
+            response = StreamingHttpResponse(iter_zip(files), content_type='application/zip')
             response['Content-Disposition'] = f'attachment; filename="class_exports_{datetime.now().strftime('%Y%m%d')}.zip"'
             
             return response
         except Exception as e:
             messages.error(request, f"Error: {str(e)}")
-            return render(request, self.template_name, {'classes': Class.objects.filter(professor_key=request.user), 'class_id': class_id})
+            return render(request, self.template_name, {'classes': Class.for_professor(request.user), 'class_id': class_id})
 
 class ExportSampleFileView(View):
     def post(self, request, class_id=None, export_type=None):
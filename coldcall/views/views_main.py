@@ -3,18 +3,26 @@ from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.views import LoginView as DjangoLoginView
 from django.contrib.auth.hashers import make_password, check_password
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse
+from django.http import JsonResponse, QueryDict
 from django.shortcuts import redirect, render
+from django.db import IntegrityError, transaction
 from django.db.models import Case, ExpressionWrapper, F, FloatField, IntegerField, Value, When
-from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 from django.views import View
 from django.views.generic import FormView
 
 from .view_helper import get_template_dir, get_demo_dir
 from ..forms import LoginUserForm, RegisterUserForm
-from ..models import Student, Class, UserData
+from ..models import CallQueue, Student, StudentRating, Class, ClassStats, UserData
+from ..randomizer import get_sampler, peek_queue
+from ..roster import PAGE_SIZE_CHOICES, TABLE_CACHE_TIMEOUT, TABLE_PARAMS, keyset_page, parse_page_size, student_table_etag
+from ..search import filter_contains
 
-import json, random
+from datetime import datetime, timezone as dt_timezone
+import json
 
 #Registration page using custom form
 class CreateAccountView(FormView): 
@@ -48,7 +56,7 @@ class HomePageView(LoginRequiredMixin, View):
         #changed to only display logged in user's students and classes
         #classes = Class.objects.all()
         user = request.user
-        classes = Class.objects.filter(professor_key=user, is_archived=False)
+        classes = Class.for_professor(user, archived=False)
         students = Student.objects.filter(class_key__professor_key=user)
 
         seen_onboarding = user.userdata.seen_onboarding
@@ -58,60 +66,160 @@ class HomePageView(LoginRequiredMixin, View):
 
         # get the id of the selected class
         selected_class_id = request.GET.get('class_id')
-        sort_query = request.GET.get('sort', '') # default to empty string
-        search_first_name_query = request.GET.get('search_first_name', '') # default to empty string
-        search_last_name_query = request.GET.get('search_last_name', '') # default to empty string
-        search_usc_id_query = request.GET.get('search_usc_id', '') # default to empty string
-        
+
         # get the students that are in that class
         if selected_class_id:
-            selected_class = Class.objects.get(id=selected_class_id)
-            if selected_class.professor_key != user:
+            selected_class = Class.objects.annotate(version=F('stats__version')).get(id=selected_class_id)
+            if selected_class.professor_key_id != user.id:
                 # prevent user from viewing information by modifying URL
-                students = None
+                students = Student.objects.none()
                 selected_class = None
+                versions = []
             else:             
                 students = Student.objects.filter(class_key_id=selected_class_id)
+                versions = [(selected_class.pk, selected_class.version)]
 
         else: 
             # all classes, limited to classes authenticated user has access to and are not archived
             students = Student.objects.filter(class_key__professor_key=user, class_key__is_archived=False)
             selected_class = None
-            
-        # Apply sorting
-        if students and sort_query:
-            students = students.order_by(Lower(sort_query))
-        else:
-            # Making sure that non-dropped students are displayed first then dropped students
-            students = students.order_by('dropped', Lower('last_name'))
-
-        # Apply search filters
-        if students and search_first_name_query:
-            students = students.filter(first_name__icontains=search_first_name_query)
-        if students and search_last_name_query:
-            students = students.filter(last_name__icontains=search_last_name_query)
-        if students and search_usc_id_query:
-            students = students.filter(usc_id__icontains=search_usc_id_query)
+            versions = ClassStats.versions(classes)
 
+        table = StudentTable(request, students, versions)
         context = {
-            'students': students,
             'classes': classes,
             'selected_class': selected_class,
-            'sort': sort_query,
-            'first_name': search_first_name_query,
-            'last_name': search_last_name_query,
-            'usc_id': search_usc_id_query,
-            'seen_onboarding': not seen_onboarding
+            'table': table,
+            'sort': table.sort,
+            'first_name': table.search_first_name,
+            'last_name': table.search_last_name,
+            'usc_id': table.search_usc_id,
+            'page_size': table.page_size,
+            'page_sizes': PAGE_SIZE_CHOICES,
+            'seen_onboarding': not seen_onboarding,
         }
         return render(request, self.template_name, context)
 
+# One page of the home table's students, searched and sorted from the request's query parameters.
+# The page is loaded the first time the template reads it, so a rendering served from the fragment cache
+# never runs the query. cache_key changes with any class version, parameter or template variant.
+class StudentTable:
+    def __init__(self, request, students, class_versions, file_format='html'):
+        self.request = request
+        self.sort = request.GET.get('sort', '') # default to empty string
+        self.search_first_name = request.GET.get('search_first_name', '') # default to empty string
+        self.search_last_name = request.GET.get('search_last_name', '') # default to empty string
+        self.search_usc_id = request.GET.get('search_usc_id', '') # default to empty string
+        self.page_size = parse_page_size(request.GET.get('page_size'))
+        self.cursor = request.GET.get('cursor')
+        self.etag = student_table_etag(class_versions, request.GET, file_format, request.is_mobile)
+        self.cache_key = self.etag.strip('"')
+        self.cache_timeout = TABLE_CACHE_TIMEOUT
+        self.queryset = students
+
+    def load(self):
+        students = self.queryset
+        # Apply search filters, answered from the search index
+        if self.search_first_name:
+            students = filter_contains(students, 'first_name', self.search_first_name)
+        if self.search_last_name:
+            students = filter_contains(students, 'last_name', self.search_last_name)
+        if self.search_usc_id:
+            students = filter_contains(students, 'usc_id', self.search_usc_id)
+
+        # only the columns the table shows, its metrics are computed in the same query
+        students = students.with_metrics().only('first_name', 'last_name', 'seating', 'total_calls', 'absent_calls', 'dropped')
+
+        # Sort and load one page, the cursor of the last page starts the next one
+        try:
+            return (self.cursor,) + keyset_page(students, self.sort, self.cursor, self.page_size)
+        except ValueError:
+            # a cursor that was tampered with starts over from the first page
+            return (None,) + keyset_page(students, self.sort, None, self.page_size)
+
+    @cached_property
+    def page(self):
+        return self.load()
+
+    @property
+    def students(self):
+        return self.page[1]
+
+    @property
+    def next_cursor(self):
+        return self.page[2]
+
+    @property
+    def next_page(self):
+        return page_query(self.request, cursor=self.next_cursor) if self.next_cursor else None
+
+    @property
+    def first_page(self):
+        return page_query(self.request) if self.page[0] else None
+
+# query string of another page of the home table, keeping the class, sort, search and page size
+def page_query(request, cursor=None):
+    query = QueryDict(mutable=True)
+    for name in TABLE_PARAMS:
+        if name != 'cursor' and name in request.GET:
+            query[name] = request.GET[name]
+    if cursor:
+        query['cursor'] = cursor
+    return query.urlencode()
+
+#Just the rows of the home table for a class, sort, search and cursor, so the page can re-sort and filter
+#in place. HTML by default, format=json for rows as data. Unchanged results are answered with 304.
+class StudentTableView(LoginRequiredMixin, View):
+    def get(self, request):
+        classes = Class.for_professor(request.user, archived=False)
+        class_id = request.GET.get('class_id')
+        if class_id:
+            classes = [class_obj for class_obj in Class.for_professor(request.user) if str(class_obj.pk) == class_id]
+
+        # the table only changes when a class version does, so the ETag is known before loading any student
+        versions = ClassStats.versions(classes)
+        if class_id and not versions:
+            return JsonResponse({"success": False, "error": "Class not found or unauthorized"}, status=404)
+        file_format = 'json' if request.GET.get('format') == 'json' else 'html'
+        table = StudentTable(request, Student.objects.filter(class_key_id__in=[pk for pk, version in versions]), versions, file_format)
+        etag = table.etag
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            if file_format == 'json':
+                response = JsonResponse({
+                    "success": True,
+                    "students": [{
+                        "id": student.id,
+                        "first_name": student.first_name,
+                        "last_name": student.last_name,
+                        "seating": student.seating,
+                        "total_calls": student.total_calls,
+                        "absent_calls": student.absent_calls,
+                        "average": student.average,
+                        "attendance_rate": student.attendance_rate,
+                        "dropped": student.dropped,
+                    } for student in table.students],
+                    "next_cursor": table.next_cursor,
+                })
+            else:
+                # the next cursor is part of the rows so it comes from the fragment cache along with them
+                response = render(request, get_template_dir("student_table_rows", request.is_mobile), {'table': table})
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['User-Agent'])
+        return response
+
+RANDOMIZER_MODES = ('weighted', 'shuffle')
+# latest epoch millisecond timestamp a client may send, the end of year 9999
+MAX_CLIENT_TIMESTAMP = 253402300799999
+
 #Core functionality, selects a random student from a class to be called on.    
 class StudentRandomizerView(LoginRequiredMixin,View):
 
     def get(self, request):
         self.template_name = get_template_dir("randomizer", request.is_mobile)
         # get all classes to populate the dropdown
-        classes = Class.objects.filter(professor_key = request.user)
+        classes = Class.for_professor(request.user)
         class_id = request.GET.get('class_id')  # selected class ID from query parameters
         refresh = request.GET.get('refresh', 'false')  # Check if this is a refresh request
         
@@ -120,6 +228,12 @@ class StudentRandomizerView(LoginRequiredMixin,View):
             request.session['absent_students'] = []
             request.session.modified = True
 
+        # weighted picks by default, "shuffle" calls everyone once before anyone repeats
+        mode = request.GET.get('mode')
+        if mode in RANDOMIZER_MODES:
+            request.session['randomizer_mode'] = mode
+        mode = request.session.get('randomizer_mode', 'weighted')
+
         # Reset absent students list if a new class is selected
         if class_id and class_id != request.session.get('last_class_id'):
             request.session['absent_students'] = []
@@ -140,22 +254,29 @@ class StudentRandomizerView(LoginRequiredMixin,View):
                 if selected_class.professor_key != request.user:
                     selected_class = None
                 else: 
-                    students = list(Student.objects.filter(class_key=selected_class, dropped=False))
-                    
                     # Filter out students marked as absent in this session
-                    active_students = [s for s in students if str(s.id) not in request.session['absent_students']]
-                    
-                    # randomly select a student if there are students in the selected class
-                    if active_students:
-                        # set maximum calls requirement to 3 higher than the lowest in the class 
-                        ms = min((s.total_calls - s.absent_calls) for s in active_students) + 3
-                        student = None
-                        while student == None:
-                            student = random.choice(active_students)
-                            if(student.total_calls-student.absent_calls >= ms):
-                                active_students.remove(student)
-                                student = None
-                    elif students:  # No active students but class has students
+                    absent_ids = {int(s) for s in request.session['absent_students']}
+
+                    if mode == 'shuffle':
+                        # only looked at, the student leaves the cycle when their rating is saved, so a reload or
+                        # an abandoned tab keeps their turn. Students deleted since the cycle started are dropped from it
+                        student_ids = peek_queue(selected_class.id, exclude=absent_ids)
+                        while student_ids and student is None:
+                            student = Student.objects.filter(id=student_ids[0], class_key=selected_class, dropped=False).first()
+                            if student is None:
+                                CallQueue.remove(selected_class.id, student_ids[0])
+                                student_ids = peek_queue(selected_class.id, exclude=absent_ids)
+                        has_students = student is not None or selected_class.get_stats().active_count > 0
+                    else:
+                        # the sampler is cached per class version, so only the picked student is loaded
+                        stats = selected_class.get_stats()
+                        sampler = get_sampler(selected_class.id, stats.version)
+                        student_id = sampler.pick(exclude=absent_ids)
+                        if student_id is not None:
+                            student = Student.objects.get(id=student_id)
+                        has_students = len(sampler) > 0
+
+                    if student is None and has_students:  # No active students but class has students
                         messages.info(request, "All students have been marked absent in this session. Use the 'Reset Absent List' button to include them again.")
 
             except Class.DoesNotExist:
@@ -165,7 +286,7 @@ class StudentRandomizerView(LoginRequiredMixin,View):
 
         #prevent reading attribute from None if class is empty or invalid (i.e no access)
         if selected_class is None or student is None:
-            context = {'classes': classes, 'selected_class': selected_class, 'empty': True, 'id_present': False}
+            context = {'classes': classes, 'selected_class': selected_class, 'empty': True, 'id_present': False, 'mode': mode}
             #only show no class message if a class is selected
             if class_id:
                 context['id_present'] = True
@@ -178,6 +299,7 @@ class StudentRandomizerView(LoginRequiredMixin,View):
             'avg_rating': student.get_average_score(),
             'empty': False,
             'id_present': True,
+            'mode': mode,
             'absent_count': len(request.session.get('absent_students', []))
         }
         return render(request, self.template_name, context)
@@ -185,41 +307,203 @@ class StudentRandomizerView(LoginRequiredMixin,View):
     def post(self, request): 
         data = json.loads(request.body)
 
-        present = True
-        prepared = True
+        # only the professor's own students, like the picks and batch endpoints
+        student = Student.objects.filter(id=data["student_id"], class_key__professor_key=request.user).first()
 
         rating = data["rating"]
         if rating == "skip":
+            # a skipped student still has to be called in this cycle
+            if student and request.session.get('randomizer_mode') == 'shuffle':
+                CallQueue.requeue(student.class_key_id, student.id)
             messages.success(request, "Student has been skipped.")
             return JsonResponse({"success": True})
-        elif rating == "absent":
-            rating = 0
-            present = False
-            
-            # Add the student to the session's absent list
-            if 'absent_students' not in request.session:
-                request.session['absent_students'] = []
-            
-            student_id = str(data["student_id"])
-            if student_id not in request.session['absent_students']:
-                request.session['absent_students'].append(student_id)
-                request.session.modified = True
-                
-        elif rating == "unprepared":
-            rating = 0
-            prepared = False
-        elif rating != 'none':
-            rating = int(data["rating"][-1]) #negative indexing to get last character
 
-        student = Student.objects.get(id=data["student_id"])
         if student:
+            rating, present, prepared = parse_rating(rating)
+            if not present:
+                mark_absent(request, student.id)
             student.add_rating(is_present = present, is_prepared = prepared, score = rating)
+            # absent students sit out the rest of the cycle, in shuffle mode the shown or prefetched student leaves it once rated
+            if not present or request.session.get('randomizer_mode') == 'shuffle':
+                CallQueue.remove(student.class_key_id, student.id)
             messages.success(request, f"Rating for {student.first_name} {student.last_name} has been successfully saved.")
             return JsonResponse({"success": True})
         else:
             messages.error(request, "Student not found!")
             return JsonResponse({"success": False, "error": "Student not found!"})
 
+#Saves a queue of randomizer ratings in one request, e.g. ratings captured offline or by several TAs.
+#Expects {"ratings": [{"student_id", "rating", "timestamp", "idempotency_key"}, ...]} in the order they were given.
+class StudentRandomizerBatchView(LoginRequiredMixin, View):
+    MAX_RATINGS = 500
+
+    def post(self, request):
+        try:
+            entries = json.loads(request.body)["ratings"]
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({"success": False, "error": "Expected a JSON object with a ratings list."}, status=400)
+        if not isinstance(entries, list) or len(entries) > self.MAX_RATINGS:
+            return JsonResponse({"success": False, "error": f"ratings must be a list of at most {self.MAX_RATINGS} entries."}, status=400)
+
+        # one query to check every student belongs to this professor
+        student_ids = {entry.get("student_id") for entry in entries if isinstance(entry, dict)}
+        students = dict(Student.objects.filter(id__in=[i for i in student_ids if isinstance(i, int)], class_key__professor_key=request.user).values_list('id', 'class_key_id'))
+
+        keys = [entry.get("idempotency_key") for entry in entries if isinstance(entry, dict) and entry.get("idempotency_key")]
+        seen_keys = set(StudentRating.objects.filter(idempotency_key__in=keys).values_list('idempotency_key', flat=True))
+
+        pending = []
+        duplicates = []
+        errors = []
+        for index, entry in enumerate(entries):
+            try:
+                student_id = entry["student_id"]
+                if student_id not in students:
+                    raise ValueError("Student not found!")
+                key = entry.get("idempotency_key") or None
+                if key in seen_keys:
+                    duplicates.append(key)
+                    continue
+                if entry["rating"] == "skip":
+                    continue
+                score, present, prepared = parse_rating(entry["rating"])
+                date = parse_client_timestamp(entry.get("timestamp"))
+            except (KeyError, TypeError, ValueError) as e:
+                errors.append({"index": index, "error": str(e)})
+                continue
+
+            if key:
+                seen_keys.add(key)
+            pending.append((index, StudentRating(student_key_id=student_id, class_key_id=students[student_id], date=date,
+                                                 attendance=present, prepared=prepared, score=score, idempotency_key=key)))
+
+        # a student can only have one rating at a given time. The check is in the write transaction so it
+        # sees ratings committed by any request that got there first
+        new_ratings = []
+        with transaction.atomic():
+            taken = set(StudentRating.objects.filter(student_key__in={r.student_key_id for i, r in pending}, date__in={r.date for i, r in pending}).values_list('student_key_id', 'date'))
+            checked = []
+            for index, rating in pending:
+                if (rating.student_key_id, rating.date) in taken:
+                    errors.append({"index": index, "error": "A rating for this student at this time already exists."})
+                    continue
+                taken.add((rating.student_key_id, rating.date))
+                checked.append((index, rating))
+
+            try:
+                with transaction.atomic():
+                    StudentRating.objects.bulk_create([rating for index, rating in checked])
+                new_ratings = [rating for index, rating in checked]
+            except IntegrityError:
+                # a database that doesn't lock on the check can still let a concurrent insert through,
+                # insert one at a time to report which entries clashed
+                for index, rating in checked:
+                    try:
+                        with transaction.atomic():
+                            StudentRating.objects.bulk_create([rating])
+                        new_ratings.append(rating)
+                    except IntegrityError:
+                        if rating.idempotency_key and StudentRating.objects.filter(idempotency_key=rating.idempotency_key).exists():
+                            duplicates.append(rating.idempotency_key)
+                        else:
+                            errors.append({"index": index, "error": "A rating for this student at this time already exists."})
+
+            # rebuild each affected student's counters from their ratings
+            Student.objects.filter(id__in={rating.student_key_id for rating in new_ratings}).recalculate_counters()
+
+        shuffle = request.session.get('randomizer_mode') == 'shuffle'
+        for rating in new_ratings:
+            if not rating.attendance:
+                mark_absent(request, rating.student_key_id)
+            if not rating.attendance or shuffle:
+                CallQueue.remove(rating.class_key_id, rating.student_key_id)
+
+        return JsonResponse({
+            "success": not errors,
+            "created": len(new_ratings),
+            "duplicates": duplicates,
+            "errors": errors,
+        })
+
+# converts a randomizer rating ("star-4", "absent" or "unprepared") into (score, present, prepared)
+def parse_rating(rating):
+    if rating == "absent":
+        return 0, False, True
+    elif rating == "unprepared":
+        return 0, True, False
+    return int(rating[-1]), True, True #negative indexing to get last character
+
+# client timestamps are ISO 8601 strings or epoch milliseconds, missing ones default to now
+def parse_client_timestamp(value):
+    if value is None or value == "":
+        return timezone.now()
+    # True and False are ints too
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid timestamp {value}")
+    if isinstance(value, (int, float)):
+        if not 0 <= value <= MAX_CLIENT_TIMESTAMP:
+            raise ValueError(f"Timestamp {value} is out of range")
+        try:
+            return datetime.fromtimestamp(value / 1000, tz=dt_timezone.utc)
+        except (ValueError, OSError, OverflowError):
+            raise ValueError(f"Timestamp {value} is out of range")
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(f"Invalid timestamp {value}")
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+# Add the student to the session's absent list
+def mark_absent(request, student_id):
+    if 'absent_students' not in request.session:
+        request.session['absent_students'] = []
+
+    student_id = str(student_id)
+    if student_id not in request.session['absent_students']:
+        request.session['absent_students'].append(student_id)
+        request.session.modified = True
+
+#Returns the next few randomizer picks as JSON so the client can cycle through them without reloading the page
+class StudentRandomizerPicksView(LoginRequiredMixin, View):
+    MAX_PICKS = 20
+
+    def get(self, request):
+        try:
+            selected_class = Class.objects.get(id=request.GET.get('class_id'), professor_key=request.user)
+        except (Class.DoesNotExist, ValueError):
+            return JsonResponse({"success": False, "error": "Class not found or unauthorized"}, status=404)
+
+        try:
+            count = min(max(int(request.GET.get('count', 5)), 1), self.MAX_PICKS)
+        except ValueError:
+            count = 5
+        # remembered like on the randomizer page, rating a pick takes it out of the cycle in shuffle mode
+        mode = request.GET.get('mode')
+        if mode in RANDOMIZER_MODES:
+            request.session['randomizer_mode'] = mode
+        mode = request.session.get('randomizer_mode', 'weighted')
+        absent_ids = {int(s) for s in request.session.get('absent_students', [])} if request.session.get('last_class_id') == str(selected_class.id) else set()
+
+        if mode == 'shuffle':
+            # only looked at, each student leaves the cycle when their rating is saved
+            student_ids = peek_queue(selected_class.id, count, exclude=absent_ids)
+        else:
+            student_ids = get_sampler(selected_class.id, selected_class.get_stats().version).pick_many(count, exclude=absent_ids)
+
+        # only the fields shown on the randomizer card
+        students = {
+            s['id']: s for s in Student.objects
+                .filter(id__in=student_ids, class_key=selected_class, dropped=False)
+                .values('id', 'first_name', 'last_name', 'seating', 'total_calls', 'average_score')
+        }
+        return JsonResponse({
+            "success": True,
+            "class_id": selected_class.id,
+            "mode": mode,
+            "students": [students[student_id] for student_id in student_ids if student_id in students],
+        })
+
 #Profile page for user to view and edit their information
 class ProfileView(LoginRequiredMixin, View):
     login_url = '/accounts/login'
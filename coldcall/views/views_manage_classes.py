@@ -1,30 +1,27 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import prefetch_related_objects
 from django.shortcuts import render
 from django.views import View
 
 from .view_helper import get_template_dir
 from coldcall.models import Class
 
+CLASS_FILTERS = {'archived': True, 'active': False, 'all': None}
+
 class ManageClassesView(LoginRequiredMixin, View):
     def get(self, request):
         self.template_name = get_template_dir("manage_classes", request.is_mobile)
-        classes = Class.objects.filter(professor_key=request.user)
 
         class_filter = request.GET.get('class_filter', '')
-
-        if classes and class_filter == 'archived':
-            classes = Class.objects.filter(professor_key=request.user, is_archived=True)
-        elif classes and class_filter == 'active':
-            classes = Class.objects.filter(professor_key=request.user, is_archived=False)
-        elif classes and class_filter == 'all':
-            classes = Class.objects.filter(professor_key=request.user)
-        else:
-            classes = Class.objects.filter(professor_key=request.user, is_archived=False) # default to active
+        classes = Class.for_professor(request.user, archived=CLASS_FILTERS.get(class_filter, False)) # default to active
 
         # Apply Searching
         search_query = request.GET.get('class_name', '').strip()
-        if search_query and classes:
-            classes = classes.filter(class_name__icontains=search_query)
+        if search_query:
+            classes = [class_obj for class_obj in classes if search_query.lower() in class_obj.class_name.lower()]
+
+        # student counts change far more often than the class list, they are read fresh
+        prefetch_related_objects(classes, 'stats')
 
         context = {
             'classes': classes,
@@ -32,4 +29,4 @@ class ManageClassesView(LoginRequiredMixin, View):
             'class_name': search_query,
         }
 
-        return render(request, self.template_name, context)
\ No newline at end of file
+        return render(request, self.template_name, context)
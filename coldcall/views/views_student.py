@@ -1,14 +1,16 @@
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.http import HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views import View
 from django.views.generic import DetailView, TemplateView
 from django.urls import reverse
+from django.utils import timezone
 
 from .view_helper import get_template_dir
-from ..models import Class, Student, StudentRating, StudentNote
+from ..models import CallQueue, Class, Student, StudentRating, StudentNote
+from ..search import MAX_QUERY_LENGTH, autocomplete
 
 import json
 
@@ -20,7 +22,7 @@ class AddStudentManualView(LoginRequiredMixin, TemplateView):
         else: 
             selected_class = None
 
-        classes = Class.objects.filter(professor_key = request.user, is_archived=False)
+        classes = Class.for_professor(request.user, archived=False)
 
         return render(request, self.template_name, {'classes': classes, 'selected_class': selected_class})
     def post(self, request, class_id=None):
@@ -50,24 +52,28 @@ class AddStudentManualView(LoginRequiredMixin, TemplateView):
 
         if not same_length_arr(usc_id, first_name, last_name, email):
             messages.error(request, "All fields must have the same number of entries.")
-            return render(request, self.template_name, {'classes': Class.objects.filter(professor_key=request.user), 'usc_id': array_to_string(usc_id), 'first_name': array_to_string(first_name), 'last_name': array_to_string(last_name), 'email': array_to_string(email), 'seating': seating, 'selected_class': class_key})
+            return render(request, self.template_name, {'classes': Class.for_professor(request.user), 'usc_id': array_to_string(usc_id), 'first_name': array_to_string(first_name), 'last_name': array_to_string(last_name), 'email': array_to_string(email), 'seating': seating, 'selected_class': class_key})
         
         # add all students at once, abort on failure
-        with transaction.atomic():
-            for i in range(len(usc_id)):
-                if len(usc_id[i]) > 9:
-                    messages.error(request, "USC ID must be 9 characters long.")
-                    return render(request, self.template_name, {'classes': Class.objects.filter(professor_key=request.user), 'usc_id': array_to_string(usc_id), 'first_name': array_to_string(first_name), 'last_name': array_to_string(last_name), 'email': array_to_string(email), 'seating': seating, 'selected_class': class_key})
-                
-                student = Student(
-                    usc_id=usc_id[i],
-                    first_name=first_name[i],
-                    last_name=last_name[i],
-                    class_key=class_key,
-                    seating=seating,
-                    email=email[i]
-                )
-                student.save()
+        try:
+            with transaction.atomic():
+                for i in range(len(usc_id)):
+                    if len(usc_id[i]) > 9:
+                        messages.error(request, "USC ID must be 9 characters long.")
+                        return render(request, self.template_name, {'classes': Class.for_professor(request.user), 'usc_id': array_to_string(usc_id), 'first_name': array_to_string(first_name), 'last_name': array_to_string(last_name), 'email': array_to_string(email), 'seating': seating, 'selected_class': class_key})
+                    
+                    student = Student(
+                        usc_id=usc_id[i],
+                        first_name=first_name[i],
+                        last_name=last_name[i],
+                        class_key=class_key,
+                        seating=seating,
+                        email=email[i]
+                    )
+                    student.save()
+        except IntegrityError:
+            messages.error(request, "A student with that USC ID already exists in this class.")
+            return render(request, self.template_name, {'classes': Class.for_professor(request.user), 'usc_id': array_to_string(usc_id), 'first_name': array_to_string(first_name), 'last_name': array_to_string(last_name), 'email': array_to_string(email), 'seating': seating, 'selected_class': class_key})
 
         if len(usc_id) == 1:
             messages.success(request, f"Student {first_name[0]} {last_name[0]} added successfully!")
@@ -75,12 +81,12 @@ class AddStudentManualView(LoginRequiredMixin, TemplateView):
             messages.success(request, f"{len(usc_id)} students added successfully!")
 
         # Clear the form fields and allow the user to add another student
-        return render(request, self.template_name, {'classes': Class.objects.filter(professor_key=request.user), 'selected_class': class_key})
+        return render(request, self.template_name, {'classes': Class.for_professor(request.user), 'selected_class': class_key})
 
 class EditStudentView(LoginRequiredMixin, TemplateView):
     def get(self, request, student_id=None):
         self.template_name = get_template_dir("addedit_student_manual", request.is_mobile)
-        classes = Class.objects.filter(professor_key = request.user)
+        classes = Class.for_professor(request.user)
         try:
             student = Student.objects.get(id=student_id)
             selected_class = student.class_key
@@ -114,6 +120,7 @@ class EditStudentView(LoginRequiredMixin, TemplateView):
         # if student_id is provided, update the existing Student instance
         if student_id:
             student = Student.objects.get(id=student_id)
+            transferred = student.class_key_id != class_key.id
             student.usc_id = usc_id
             student.first_name = first_name
             student.last_name = last_name
@@ -122,8 +129,16 @@ class EditStudentView(LoginRequiredMixin, TemplateView):
             student.email = email
             if len(usc_id) > 9:
                 messages.error(request, "USC ID must be 9 characters long.")
-                return render(request, self.template_name, {'classes': Class.objects.filter(professor_key=request.user), 'student': student, 'usc_id': usc_id, 'first_name': first_name, 'last_name': last_name, 'email': email, 'seating': seating, 'selected_class': class_key})
-            student.save()
+                return render(request, self.template_name, {'classes': Class.for_professor(request.user), 'student': student, 'usc_id': usc_id, 'first_name': first_name, 'last_name': last_name, 'email': email, 'seating': seating, 'selected_class': class_key})
+            try:
+                with transaction.atomic():
+                    if transferred:
+                        transfer_student(student, class_key)
+                    else:
+                        student.save()
+            except IntegrityError:
+                messages.error(request, "A student with that USC ID already exists in this class.")
+                return render(request, self.template_name, {'classes': Class.for_professor(request.user), 'student': student, 'usc_id': usc_id, 'first_name': first_name, 'last_name': last_name, 'email': email, 'seating': seating, 'selected_class': class_key})
         else:
             return HttpResponseBadRequest("Student ID is required for updating.")
 
@@ -175,24 +190,14 @@ class StudentRatingEditView(LoginRequiredMixin, View):
         rating = StudentRating.objects.get(pk=performance_id)
         new_rating = request.POST.get('modifier')
         if 'absent' in new_rating or 'unprepared' in new_rating:
-            rating.score = 0
-            rating.attendance = not 'absent' in new_rating
-            rating.prepared = not 'unprepared' in new_rating
-            rating.save()
-
-            student.recalculate_all()
+            student.update_rating(rating, score = 0, is_present = not 'absent' in new_rating, is_prepared = not 'unprepared' in new_rating)
             return redirect("/student/" + str(pk)) 
 
         try:
             score = int(request.POST.get('rating'))
         except:
             score = 5
-        rating.attendance = True
-        rating.prepared = True
-        rating.score = score
-        rating.save()
-
-        student.recalculate_all()
+        student.update_rating(rating, score = score)
         return redirect("/student/" + str(pk)) 
         
 #Allows editing of a student's existing data.     
@@ -224,8 +229,7 @@ class StudentUpdateView(View):
         if request.method == "POST":
             new_class_id = request.POST.get("new_class_id")
             new_class = get_object_or_404(Class, id=new_class_id)
-            student.class_key = new_class
-            student.save()
+            transfer_student(student, new_class)
             return redirect('home')  # Redirect to homepage or student list
 
         classes = Class.objects.exclude(id=student.class_key.id)  # Exclude current class
@@ -249,6 +253,8 @@ class StudentDropView(View):
             student = get_object_or_404(Student, id=student_id)
             student.dropped = not student.dropped  # Toggle the dropped status
             student.save()
+            if student.dropped:
+                CallQueue.remove(student.class_key_id, student.id)
         
             return redirect('home')
         except Exception as e:
@@ -278,5 +284,32 @@ class DeleteNoteView(View):
             # Redirect back to the student's notes page
             return redirect('student_metrics', pk=student_id)
     
+#Students matching a search box as it is typed, as JSON for autocomplete
+class StudentAutocompleteView(LoginRequiredMixin, View):
+    def get(self, request):
+        class_id = request.GET.get('class_id', '')
+        students = autocomplete(request.user, request.GET.get('q', '')[:MAX_QUERY_LENGTH], class_id=int(class_id) if class_id.isdigit() else None)
+        return JsonResponse({
+            "success": True,
+            "students": [{
+                "id": student.id,
+                "first_name": student.first_name,
+                "last_name": student.last_name,
+                "usc_id": student.usc_id,
+                "email": student.email,
+                "class_id": student.class_key_id,
+                "class_name": student.class_key.class_name,
+                "url": reverse('student_metrics', args=[student.id]),
+            } for student in students],
+        })
+
+# moves a student and their ratings to another class, then rebuilds the counters in case the ratings drifted
+def transfer_student(student, new_class):
+    with transaction.atomic():
+        student.class_key = new_class
+        student.save()
+        StudentRating.objects.filter(student_key=student).update(class_key=new_class, modified=timezone.now())
+        Student.objects.filter(pk=student.pk).recalculate_counters()
+
 def array_to_string(array):
-    return ', '.join(array) if isinstance(array, list) else array
\ No newline at end of file
+    return ', '.join(array) if isinstance(array, list) else array
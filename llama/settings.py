@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -32,6 +33,40 @@ RECAPTCHA_PRIVATE_KEY = os.getenv('RECAPTCHA_PRIVATE_KEY')
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.getenv('DEBUG') == 'TRUE'
 
+# queue uploads for `manage.py run_import_worker` instead of importing them during the request
+BACKGROUND_IMPORTS = os.getenv('BACKGROUND_IMPORTS') == 'TRUE'
+# threads building the per-class files of a multi-class export
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', 2))
+# finished class exports, kept until the class changes
+EXPORT_CACHE_DIR = os.getenv('EXPORT_CACHE_DIR', os.path.join(BASE_DIR, 'export_cache'))
+
+# class lists and rendered home tables. Local memory is per process, so a site served by several worker
+# processes should share one cache: CACHE_BACKEND=file with a CACHE_LOCATION directory, or
+# CACHE_BACKEND=redis with a redis:// CACHE_LOCATION for Redis or a Redis-compatible server
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+if CACHE_BACKEND not in CACHE_BACKENDS:
+    raise ImproperlyConfigured(f"CACHE_BACKEND must be one of {', '.join(CACHE_BACKENDS)}, not {CACHE_BACKEND!r}")
+CACHE_LOCATIONS = {
+    'locmem': 'coldcall',
+    'file': os.path.join(BASE_DIR, 'django_cache'),
+    'redis': 'redis://127.0.0.1:6379',
+}
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.getenv('CACHE_LOCATION', CACHE_LOCATIONS[CACHE_BACKEND]),
+        'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', ''),
+    }
+}
+# seconds a professor's class list stays cached. A change drops the list only from the cache of the process that
+# made it, so with locmem the other workers see it once their copy expires
+CLASS_LIST_CACHE_TIMEOUT = int(os.getenv('CLASS_LIST_CACHE_TIMEOUT', 10 if CACHE_BACKEND == 'locmem' else 24 * 60 * 60))
+
 ALLOWED_HOSTS = ['*']
 
 
@@ -87,6 +122,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # take the write lock when a transaction starts, so concurrent writers (e.g. import worker threads)
+            # wait for each other instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 